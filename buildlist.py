@@ -5,14 +5,33 @@
 import argparse
 import configparser
 import logging
-import multiprocessing as mp
+import os
 import pathlib
 import pprint
-import subprocess
 import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
 
+import pyscan
+from distribution import (
+    Distribution,
+    distribution_report,
+    parse_sizes,
+    save_distribution,
+    scan_distribution,
+)
+from executors import LocalExecutor, get_executor
+from purgehelper import age_cutoff
+from pwalk import walk
+from pyscan import Cancelled
+from scanlog import escape_part, estimate_cost, longest_first, part_prefix
+from scansort import merge_runs, sort_text
+from scanstate import DONE, FAILED, PENDING, RUNNING, ScanState
+from scanstatus import ScanStatus
+from scheduler import ScanScheduler, size_ranks
+
 # load config file settings
 config = configparser.ConfigParser()
 config.read(pathlib.Path(__file__).resolve().parent.joinpath("etc/purgetools.ini"))
@@ -29,7 +48,7 @@ def parse_args(args):
     )
     parser.add_argument(
         "--np",
-        help="Number of ranks for dwalk (Default 4)",
+        help="Number of ranks for dwalk or processes for python (Default 4)",
         type=int,
         default=4,
         metavar="N",
@@ -48,6 +67,21 @@ def parse_args(args):
         metavar="S",
         default=60,
     )
+    parser.add_argument(
+        "--cores",
+        help="Total ranks (or python processes) across all scans at once, each "
+        "directory gets ranks for its size from --history or by listing a few "
+        "entries, replaces --np and --threads",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--items-per-rank",
+        help="With --cores, entries to give each rank (Default 1000000)",
+        type=int,
+        default=1000000,
+        metavar="N",
+    )
     parser.add_argument(
         "--dryrun", help="Print list to scan and quit", action="store_true"
     )
@@ -60,6 +94,68 @@ def parse_args(args):
         type=str,
         default=datetime.now().strftime("%d-%m-%Y"),
     )
+    parser.add_argument(
+        "--backend",
+        help="Scanner, dwalk needs MPI and mpiFileUtils, python uses --np "
+        "processes per directory (Default dwalk)",
+        choices=["dwalk", "python"],
+        default="dwalk",
+    )
+    parser.add_argument(
+        "--executor",
+        help="Where dwalk runs, local mpirun, srun steps inside a Slurm "
+        "allocation or mpirun over ssh on [buildlist] sshhosts (Default local)",
+        choices=["local", "slurm", "ssh"],
+        default="local",
+    )
+    parser.add_argument(
+        "--split",
+        help="Scan directories estimated over N items as one scan per "
+        "subdirectory, estimates from --history or by listing up to N entries",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--straggler",
+        help="Once nothing is left to start cancel scans running X times the "
+        "median scan and rescan their subdirectories on the idle slots",
+        type=float,
+        metavar="X",
+    )
+    parser.add_argument(
+        "--textfile",
+        help="Keep overall scan progress in FILE for the node_exporter "
+        "textfile collector (FILE should end .prom)",
+        type=str,
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--status",
+        help="Keep overall scan progress in FILE as JSON",
+        type=str,
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Carry on the --scanident scan from its <scanident>-state.json, "
+        "scanning only directories that aren't done",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--retries",
+        help="Times to retry a failed scan, waiting longer each time, before "
+        "leaving it failed (Default 2)",
+        type=int,
+        default=2,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--history",
+        help="Earlier scanident whose .log/.cache files are used to start the "
+        "biggest directories first",
+        type=str,
+        metavar="SCANIDENT",
+    )
 
     verbosity = parser.add_mutually_exclusive_group()
     verbosity.add_argument(
@@ -129,6 +225,173 @@ def build_scanlist(path, excludes=[], dontwalk=False, ignoremissing=False):
     return sc_paths - ex_paths
 
 
+# one scan, path is scanned to <scanident>-<name>.txt which is folded into
+# <scanident>-<top>.txt if the two differ.  files_only scans just the files
+# directly in path, left behind when its subdirectories are scanned apart
+ScanUnit = namedtuple("ScanUnit", ["path", "name", "top", "files_only"])
+
+
+def state_units(state, *states):
+    """ScanUnits kept in a scanstate.ScanState in any of states."""
+    return [
+        ScanUnit(pathlib.Path(r["path"]), name, r["top"], r["files_only"])
+        for name, r in state.select(*states)
+    ]
+
+
+def probe(path, limit, threads=16):
+    """Count entries under path listing no more than about limit of them."""
+    count = 0
+    walker = walk([path], threads, stat=False)
+    for dirpath, st, dirnames, files in walker:
+        count += len(dirnames) + len(files)
+        if count > limit:
+            walker.close()
+            break
+    return count
+
+
+def split_scanlist(paths, threshold, history=None, maxdepth=4, directory="."):
+    """
+    Split directories too big for one scan into a scan per subdirectory.
+
+    paths      directories from build_scanlist()
+    threshold  items a single scan should walk at most
+    history    earlier scanident to estimate sizes from, see
+               scanlog.estimate_cost(), directories it doesn't know are
+               probed by listing up to threshold entries
+    maxdepth   levels to descend at most
+
+    Each directory over threshold becomes a ScanUnit for each subdirectory,
+    themselves split again if still too big, and a files_only ScanUnit for
+    the files beside them.  Units are named by scanlog.part_prefix() so their
+    outputs go in <scanident>-parts/.
+
+    returns list of ScanUnit
+    """
+    units = []
+    todo = [(p, p.name, p.name, 0) for p in map(pathlib.Path, paths)]
+    while todo:
+        path, name, top, depth = todo.pop()
+        estimate = estimate_cost(name, history, directory) if history else None
+        if estimate is None:
+            estimate = probe(path, threshold)
+        if estimate <= threshold or depth >= maxdepth:
+            units.append(ScanUnit(path, name, top, False))
+            continue
+
+        logging.info(f"Splitting {path} estimated {estimate} items")
+        for unit in split_unit(ScanUnit(path, name, top, False)):
+            if unit.files_only:
+                units.append(unit)
+            else:
+                todo.append((unit.path, unit.name, top, depth + 1))
+
+    return units
+
+
+def split_unit(unit):
+    """
+    ScanUnits for unit's subdirectories and the files beside them.
+
+    returns list of ScanUnit, just unit if it can't be listed
+    """
+    try:
+        subdirs = [x for x in unit.path.iterdir() if x.is_dir() and not x.is_symlink()]
+    except OSError as e:
+        logging.error(f"Can't split {unit.path}: {e}")
+        return [unit]
+
+    prefix = part_prefix(unit.name)
+    units = [ScanUnit(unit.path, prefix, unit.top, True)]
+    for sub in subdirs:
+        units.append(ScanUnit(sub, prefix + escape_part(sub.name), unit.top, False))
+    return units
+
+
+def discard_unit(unit, scanident):
+    """
+    Remove the outputs of a cancelled scan.
+
+    Its .txt, .cache and .dist.json are removed so it isn't listed, folded
+    or reported beside the parts it was re-split into, and its log is kept
+    as .log.cancelled, out of the way of --history.
+    """
+    logname = f"{scanident}-{unit.name}.log"
+    if os.path.exists(logname):
+        os.replace(logname, f"{logname}.cancelled")
+    for suffix in ("cache", "txt", "dist.json"):
+        leftover = f"{scanident}-{unit.name}.{suffix}"
+        if os.path.exists(leftover):
+            os.unlink(leftover)
+
+
+def scan_unit(unit, scan=None, scanident=None, atime=60, dryrun=False, **kwargs):
+    """
+    Run scan (scan_path or scan_path_python) on a ScanUnit.
+
+    If the scan is cancelled its outputs are discarded, see discard_unit().
+    If it fails its partial .cache and .txt are removed so only finished
+    scans are listed, the log is left to see why.
+    """
+    if not dryrun:
+        # split parts are written under <scanident>-parts/
+        os.makedirs(os.path.dirname(f"{scanident}-{unit.name}") or ".", exist_ok=True)
+    if not unit.files_only:
+        try:
+            return scan(
+                unit.path,
+                name=unit.name,
+                scanident=scanident,
+                atime=atime,
+                dryrun=dryrun,
+                **kwargs,
+            )
+        except Cancelled:
+            discard_unit(unit, scanident)
+            raise
+        except Exception:
+            for suffix in ("cache", "txt"):
+                leftover = f"{scanident}-{unit.name}.{suffix}"
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+            raise
+
+    output = f"{scanident}-{unit.name}.txt"
+    logging.info(f"Scanning files in {unit.path} to {output}")
+    if dryrun:
+        return
+    dist = Distribution()
+    with open(f"{scanident}-{unit.name}.log", "w") as log:
+        pyscan.scan_files(unit.path, output, age_cutoff(atime), log=log, dist=dist)
+    save_distribution(dist, scanident, unit.name)
+
+
+def fold_units(units, scanident, dryrun=False, resume=False):
+    """
+    Merge the .txt of split directories into <scanident>-<top>.txt.
+
+    Outputs stay sorted by user so userlist.py sees one list per top level
+    directory as if it were scanned whole.  The unit .txt files are removed,
+    their .log (and .cache) are kept.  With resume a <top>.txt folded by the
+    earlier run is merged in too.
+    """
+    parts = {}
+    for unit in units:
+        if unit.name != unit.top:
+            parts.setdefault(unit.top, []).append(f"{scanident}-{unit.name}.txt")
+
+    for top, texts in parts.items():
+        texts = [t for t in texts if pathlib.Path(t).is_file()]
+        output = f"{scanident}-{top}.txt"
+        logging.info(f"Folding {len(texts)} lists into {output}")
+        if texts and not dryrun:
+            if resume and os.path.exists(output):
+                os.replace(output, f"{output}.folded")
+                texts.append(f"{output}.folded")
+            merge_runs(texts, output)
+
+
 # scans actual filesystem and builds cache file and txt file
 # path PathLib object to scan
 # progress how often for mpiFileUtils to log progress
@@ -143,26 +406,28 @@ def scan_path(
     np=int(20),
     atime=int(60),
     dryrun=False,
+    name=None,
+    cancel=None,
+    executor=None,
 ):
-
-    # all settings for mpi
-    args = [config["DEFAULT"]["mpirunpath"]]
-    args.append("--allow-run-as-root")
-    args.append("--oversubscribe")
-    # args += ["--mca", "io", f"{config['DEFAULT']['romio']}"] # required for older OMPI
-    args += ["-np", f"{np}"]
-
-    # add settings for dwalk, mpiFileUtils installed in <instdir>/install/bin/dwalk
-    args.append(
-        str(pathlib.Path(__file__).resolve().parent.joinpath("install/bin/dwalk"))
-    )
+    # name of output files, default path's name
+    name = name or path.name
+    # where dwalk runs, see executors.py
+    executor = executor or LocalExecutor(config["DEFAULT"]["mpirunpath"])
+
+    # settings for dwalk, mpiFileUtils installed in <instdir>/install/bin/dwalk
+    # the executor puts mpirun, srun or ssh in front
+    args = [str(pathlib.Path(__file__).resolve().parent.joinpath("install/bin/dwalk"))]
     args += ["--progress", f"{progress}"]
     args += ["--type", "f"]
     args += ["--atime", f"+{atime}"]
     args += ["--mtime", f"+{atime}"]
     args += ["--ctime", f"+{atime}"]
     args += ["--distribution", f"{distribution}"]
-    args += ["--output", f"{scanident}-{path.name}.cache"]
+    args += ["--output", f"{scanident}-{name}.cache"]
+    # unsorted text in the same pass, sorted by user below rather than
+    # running dwalk --sort user --input <cache> a second time
+    args += ["--text-output", f"{scanident}-{name}.txt"]
     args.append(f"{path}")
 
     logging.info(args)
@@ -170,46 +435,72 @@ def scan_path(
         logging.info("--dryrun given not scanning, exiting")
         return
 
-    logname = f"{scanident}-{path.name}.log"
+    logname = f"{scanident}-{name}.log"
     with open(logname, "w") as log:
         logging.info(f"Opening log file: {log}")
-        subprocess.run(args, check=True, stderr=subprocess.PIPE, stdout=log)
-
-    # dwalk will error if there are no files to sort, but sorting speeds building per user lists
-    # dwalk will also not write an output file if there are no entires so test if it exists if so sort it
-    # this isn't as slow as expected as the sort is very fast,
-    if pathlib.Path(f"{scanident}-{path.name}.cache").is_file():
-        # cache file exists so sort and create sorted text version
-        # no extra filters required
-
-        logging.info(f"Purge Candidates found sorting {path.name}")
-
-        args = [config["DEFAULT"]["mpirunpath"]]
-        args.append("--allow-run-as-root")
-        args.append("--oversubscribe")
-        # args += ["--mca", "io", f"{config['DEFAULT']['romio']}"] # required for older OMPI
-        args += ["-np", f"{np}"]
-
-        # add settings for dwalk, mpiFileUtils installed in <instdir>/install/bin/dwalk
-        args.append(
-            str(pathlib.Path(__file__).resolve().parent.joinpath("install/bin/dwalk"))
+        executor.run(args, np, log, cancel)
+    if cancel is not None and cancel.is_set():
+        # dwalk finished as it was cancelled, its parts are scanned instead
+        raise Cancelled(path)
+
+    # dwalk will not write an output file if there are no entires so test if
+    # it exists, if so sort it by user for userlist.py.  The sort streams
+    # through sorted runs on disk so memory stays flat however many files
+    if pathlib.Path(f"{scanident}-{name}.txt").is_file():
+        logging.info(f"Purge Candidates found sorting {name}")
+        count = sort_text(f"{scanident}-{name}.txt", f"{scanident}-{name}.txt")
+        logging.info(f"Sorted {count} purge candidates for {name}")
+    else:
+        logging.info(f"No Purge candidates for {name}")
+
+    dist = scan_distribution(scanident, name, parse_sizes(distribution))
+    if dist:
+        save_distribution(dist, scanident, name)
+
+
+def scan_path_python(
+    path,
+    scanident=datetime.now().strftime("%d-%m-%Y"),
+    progress=int(60),
+    np=int(20),
+    atime=int(60),
+    dryrun=False,
+    name=None,
+    cancel=None,
+):
+    """
+    scan_path() without MPI, see pyscan.scan().
+
+    Writes the same <scanident>-<name>.txt sorted by user and progress to
+    <scanident>-<name>.log, there is no .cache file.  np is the number of
+    scanning processes.
+    """
+    name = name or path.name
+    output = f"{scanident}-{name}.txt"
+    logging.info(f"Scanning {path} with {np} processes to {output}")
+    if dryrun:
+        logging.info("--dryrun given not scanning, exiting")
+        return
+
+    logname = f"{scanident}-{name}.log"
+    dist = Distribution()
+    with open(logname, "w") as log:
+        counts = pyscan.scan(
+            path,
+            output,
+            age_cutoff(atime),
+            procs=np,
+            progress=progress,
+            log=log,
+            cancel=cancel,
+            dist=dist,
         )
-        args += ["--progress", f"{progress}"]
-        args += ["--type", "f"]
-        args += ["--atime", f"+{atime}"]
-        args += ["--mtime", f"+{atime}"]
-        args += ["--ctime", f"+{atime}"]
-        args += ["--distribution", f"{distribution}"]
-        args += ["--sort", "user"]
-        # args += ["--sort", "user,name"]   # removes most memory requirements
-        args += ["--input", f"{scanident}-{path.name}.cache"]
-        args += ["--text-output", f"{scanident}-{path.name}.txt"]
-
-        with open(logname, "a") as log:
-            subprocess.run(args, check=True, stderr=subprocess.PIPE, stdout=log)
+    save_distribution(dist, scanident, name)
 
+    if counts["files"]:
+        logging.info(f"Purge Candidates found in {name}")
     else:
-        logging.info(f"No Purge candidates for {path.name}")
+        logging.info(f"No Purge candidates for {name}")
 
 
 #########  MAIN PROGRM ########
@@ -224,19 +515,70 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(level=logging.INFO)
 
-    scan_set = build_scanlist(
-        args.path,
-        dontwalk=args.dontwalk,
-        excludes=config["buildlist"]["ignorepath"].split(","),
-        ignoremissing=config["buildlist"]["ignoremissing"],
-    )
+    # state of each directory for --resume, not kept for --dryrun
+    state = None
+    if not args.dryrun:
+        state = ScanState(f"{args.scanident}-state.json", resume=args.resume)
+
+    previous = []
+    if state and state.units:
+        # finished before, only folded and reported again
+        previous = state_units(state, DONE)
+        units = state_units(state, PENDING, RUNNING, FAILED)
+        logging.info(f"Resuming, {len(previous)} done {len(units)} to scan")
+    else:
+        scan_set = build_scanlist(
+            args.path,
+            dontwalk=args.dontwalk,
+            excludes=config["buildlist"]["ignorepath"].split(","),
+            ignoremissing=config["buildlist"]["ignoremissing"],
+        )
+
+        if args.split:
+            units = split_scanlist(scan_set, args.split, history=args.history)
+        else:
+            units = [ScanUnit(path, path.name, path.name, False) for path in scan_set]
+
+    def size(unit):
+        # entries for --cores, without --history list up to a rank's worth
+        if unit.files_only:
+            return 0  # just the files directly in it, always one process
+        if args.history:
+            cost = estimate_cost(unit.name, args.history)
+            if cost is not None:
+                return cost
+        return probe(unit.path, args.items_per_rank, threads=4)
+
+    if args.cores:
+        # biggest first so the widest scans start while all cores are free,
+        # smaller ones fill in around them.  Sized a few at a time
+        with ThreadPoolExecutor(8) as pool:
+            sizes = dict(zip(units, pool.map(size, units)))
+        scan_list = sorted(sizes.items(), key=lambda x: (-x[1], str(x[0].path)))
+    else:
+        # longest job first, unknown or without --history in no particular order
+        scan_list = longest_first(units, history=args.history)
 
     print("Will Scan Following List")
-    pp.pprint(scan_set)
+    pp.pprint(scan_list)
 
-    # create partial function so it can be passed to pool.map()
+    if args.backend == "python":
+        if args.executor != "local":
+            logging.error("--backend python only runs locally")
+            sys.exit(2)
+        scan = scan_path_python
+    else:
+        scan = partial(
+            scan_path,
+            executor=get_executor(
+                args.executor, config["buildlist"], config["DEFAULT"]["mpirunpath"],
+            ),
+        )
+
+    # create partial function so it can be passed to the scheduler
     func = partial(
-        scan_path,
+        scan_unit,
+        scan=scan,
         scanident=args.scanident,
         np=args.np,
         atime=args.days,
@@ -244,8 +586,66 @@ if __name__ == "__main__":
         dryrun=args.dryrun,
     )
 
-    # walk paths in path in parallel
-    with mp.Pool(args.threads) as p:
-        p.map(func, scan_set)
-        p.close()
-        p.join()
+    probes = {}  # unit to probe() future for estimate()
+    prober = ThreadPoolExecutor(2)
+
+    def estimate(unit, walked):
+        # items for straggler checks, list at most twice what's been walked
+        # off the scheduler's thread, None (asked again later) until done
+        if args.history:
+            cost = estimate_cost(unit.name, args.history)
+            if cost is not None:
+                return cost
+        if unit not in probes:
+            probes[unit] = prober.submit(probe, unit.path, walked * 2, 4)
+        if probes[unit].done() and not probes[unit].exception():
+            return probes[unit].result()
+        return None
+
+    def logname(unit):
+        return f"{args.scanident}-{unit.name}.log"
+
+    def ranks(unit):
+        # re-split parts weren't sized up front, rather than list them on
+        # the scheduler's thread they get their --history size or 1 rank
+        if unit in sizes:
+            items = sizes[unit]
+        elif args.history and not unit.files_only:
+            items = estimate_cost(unit.name, args.history)
+        else:
+            items = None
+        return size_ranks(items, args.items_per_rank, args.cores)
+
+    # walk paths in path in parallel, each scan is its own mpirun or
+    # processes so threads are enough to run them.  Scans start in the
+    # order submitted
+    scheduler = ScanScheduler(
+        func,
+        threads=args.cores or args.threads,
+        resplit=split_unit if args.straggler else None,
+        logname=logname,
+        estimate=estimate,
+        straggler=args.straggler,
+        interval=args.progress,
+        status=ScanStatus(
+            args.scanident, logname, textfile=args.textfile, status=args.status
+        ),
+        retries=args.retries,
+        state=state,
+        discard=lambda unit: discard_unit(unit, args.scanident),
+        cores=args.cores,
+        ranks=ranks if args.cores else None,
+    )
+    units = previous + scheduler.run([unit for unit, cost in scan_list])
+    prober.shutdown(wait=False)
+
+    fold_units(units, args.scanident, dryrun=args.dryrun, resume=args.resume)
+    if not args.dryrun:
+        distribution_report(units, args.scanident)
+
+    if scheduler.failed:
+        logging.error(
+            f"{len(scheduler.failed)} failed, see their logs and rerun with "
+            f"--resume: {' '.join(unit.name for unit in scheduler.failed)}"
+        )
+        sys.exit(1)
@@ -0,0 +1,211 @@
+import csv
+import json
+import logging
+import pathlib
+import re
+import time
+from bisect import bisect_right
+
+from purgestats import write_json
+from pyscan import UNITS
+
+# same buckets buildlist.py asks dwalk --distribution for
+SIZES = "size:0,1K,1M,100M,1G,1T"
+
+# atime age buckets in days
+AGES = [0, 30, 60, 90, 180, 365, 730, 1825]
+
+# [   1.000  KB -    1.000  MB )          12
+BUCKET = re.compile(r"^\[\s*([\d.]+)\s*([KMGTPE]?B)\s*-.*[)\]]\s*(\d+)\s*$")
+
+
+def parse_sizes(spec=SIZES):
+    """Byte edges from a dwalk --distribution spec, size:0,1K,1M -> [0, 1024, ...]"""
+    edges = []
+    for value in spec.split(":", 1)[1].split(","):
+        unit = value[-1].upper()
+        if unit.isdigit():
+            edges.append(int(value))
+        else:
+            edges.append(int(float(value[:-1]) * 1024 ** UNITS.index(f"{unit}B")))
+    return edges
+
+
+class Distribution:
+    """
+    Files and bytes by size bucket and by atime age bucket.
+
+    Bucket i holds edges[i] <= value < edges[i+1], the last is open ended.
+    Ages are days before now.
+    """
+
+    def __init__(self, sizes=None, ages=AGES, now=None):
+        self.sizes = sizes if sizes is not None else parse_sizes()
+        self.ages = ages
+        self.now = now if now is not None else time.time()
+        self.size_files = [0] * len(self.sizes)
+        self.size_bytes = [0] * len(self.sizes)
+        self.age_files = [0] * len(self.ages)
+        self.age_bytes = [0] * len(self.ages)
+        self.exact = True  # False if any counts came from a dwalk log only
+
+    @staticmethod
+    def _bucket(edges, value):
+        return max(bisect_right(edges, value) - 1, 0)
+
+    def add(self, size, atime):
+        i = self._bucket(self.sizes, size)
+        self.size_files[i] += 1
+        self.size_bytes[i] += size
+        j = self._bucket(self.ages, (self.now - atime) / 86400)
+        self.age_files[j] += 1
+        self.age_bytes[j] += size
+
+    def add_arrays(self, sizes, atimes):
+        """add() for NumPy arrays of sizes and atimes at once."""
+        import numpy as np
+
+        sizes = sizes.astype(np.int64)
+        ages = (self.now - atimes.astype(np.float64)) / 86400
+        for edges, values, files, nbytes in [
+            (self.sizes, sizes, self.size_files, self.size_bytes),
+            (self.ages, ages, self.age_files, self.age_bytes),
+        ]:
+            index = np.maximum(np.searchsorted(edges, values, side="right") - 1, 0)
+            counts = np.bincount(index, minlength=len(edges))
+            totals = np.bincount(index, weights=sizes, minlength=len(edges))
+            for i in range(len(edges)):
+                files[i] += int(counts[i])
+                nbytes[i] += int(totals[i])
+
+    def merge(self, other):
+        for name in ("size_files", "size_bytes", "age_files", "age_bytes"):
+            mine = getattr(self, name)
+            for i, value in enumerate(getattr(other, name)):
+                mine[i] += value
+        self.exact = self.exact and other.exact
+
+    def as_dict(self):
+        return {
+            "sizes": self.sizes,
+            "ages": self.ages,
+            "now": self.now,
+            "size_files": self.size_files,
+            "size_bytes": self.size_bytes,
+            "age_files": self.age_files,
+            "age_bytes": self.age_bytes,
+            "exact": self.exact,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        dist = cls(data["sizes"], data["ages"], data["now"])
+        for name in ("size_files", "size_bytes", "age_files", "age_bytes"):
+            setattr(dist, name, list(data[name]))
+        dist.exact = data["exact"]
+        return dist
+
+    @classmethod
+    def from_cache(cls, path, sizes=None, ages=AGES):
+        """From a dwalk .cache, exact but needs numpy, see cachefile.py."""
+        from cachefile import CacheFile
+
+        dist = cls(sizes, ages)
+        with CacheFile(path) as cache:
+            dist.add_arrays(cache.files["size"], cache.files["atime"])
+        return dist
+
+    @classmethod
+    def from_log(cls, path, sizes=None, ages=AGES):
+        """
+        File counts by size from dwalk's --distribution table in its log.
+
+        dwalk only prints counts, bytes and ages stay 0 and exact is False.
+        """
+        dist = cls(sizes, ages)
+        dist.exact = False
+        with open(path, errors="replace") as f:
+            for line in f:
+                m = BUCKET.match(line.strip())
+                if m:
+                    low = float(m.group(1)) * 1024 ** UNITS.index(m.group(2))
+                    dist.size_files[cls._bucket(dist.sizes, low)] += int(m.group(3))
+        return dist
+
+
+def dist_path(scanident, name):
+    return pathlib.Path(f"{scanident}-{name}.dist.json")
+
+
+def save_distribution(dist, scanident, name):
+    """Keep one scan's Distribution beside its .txt for distribution_report()"""
+    write_json(dist_path(scanident, name), dist.as_dict())
+
+
+def scan_distribution(scanident, name, sizes=None):
+    """
+    Distribution of a finished dwalk scan.
+
+    From its .cache if numpy is there, else the counts from its log.
+    """
+    cache = pathlib.Path(f"{scanident}-{name}.cache")
+    if cache.is_file():
+        try:
+            return Distribution.from_cache(cache, sizes)
+        except ImportError:
+            logging.debug("numpy not available, size counts only from log")
+    log = pathlib.Path(f"{scanident}-{name}.log")
+    if log.is_file():
+        return Distribution.from_log(log, sizes)
+    return None
+
+
+def distribution_report(units, scanident):
+    """
+    Merge each scan's Distribution per top level directory.
+
+    Writes <scanident>-distribution.json and <scanident>-distribution.csv
+    with a row per directory, bucket kind and bucket plus an ALL total.
+
+    returns dict top level directory name to Distribution
+    """
+    tops = {}
+    for unit in units:
+        path = dist_path(scanident, unit.name)
+        if not path.is_file():
+            continue
+        with open(path) as f:
+            dist = Distribution.from_dict(json.load(f))
+        if unit.top in tops:
+            tops[unit.top].merge(dist)
+        else:
+            tops[unit.top] = dist
+    if not tops:
+        return tops
+
+    total = None
+    for dist in tops.values():
+        if total is None:
+            total = Distribution.from_dict(dist.as_dict())
+        else:
+            total.merge(dist)
+
+    tables = dict(sorted(tops.items()))
+    tables["ALL"] = total
+    write_json(
+        f"{scanident}-distribution.json",
+        {name: dist.as_dict() for name, dist in tables.items()},
+    )
+    with open(f"{scanident}-distribution.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["directory", "kind", "low", "high", "files", "bytes"])
+        for name, dist in tables.items():
+            for kind, edges, files, nbytes in [
+                ("size", dist.sizes, dist.size_files, dist.size_bytes),
+                ("atime_age_days", dist.ages, dist.age_files, dist.age_bytes),
+            ]:
+                for i, low in enumerate(edges):
+                    high = edges[i + 1] if i + 1 < len(edges) else ""
+                    writer.writerow([name, kind, low, high, files[i], nbytes[i]])
+
+    return tops
@@ -0,0 +1,157 @@
+import logging
+import os
+import queue
+import shlex
+import subprocess
+
+from pyscan import Cancelled
+
+
+def run_command(args, log, cancel=None, poll=1):
+    """
+    subprocess.run(args, check=True, stdout=log, stderr=subprocess.STDOUT)
+    that kills args and raises Cancelled once cancel (threading.Event) is set.
+
+    stderr goes to the log as it is written rather than held in memory.
+    """
+    proc = subprocess.Popen(
+        args, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT
+    )
+    while True:
+        try:
+            proc.wait(timeout=poll)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel is not None and cancel.is_set():
+                proc.terminate()
+                proc.wait()
+                raise Cancelled(args)
+
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+
+
+class LocalExecutor:
+    """Run each scan with mpirun on this host, the original behaviour."""
+
+    name = "local"
+
+    def __init__(self, mpirun):
+        self.mpirun = mpirun
+
+    def command(self, args, np):
+        """argv to run MPI program args on np ranks"""
+        # all settings for mpi
+        mpi = [self.mpirun]
+        mpi.append("--allow-run-as-root")
+        mpi.append("--oversubscribe")
+        # mpi += ["--mca", "io", f"{config['DEFAULT']['romio']}"] # required for older OMPI
+        mpi += ["-np", f"{np}"]
+        return mpi + args
+
+    def run(self, args, np, log, cancel=None):
+        run_command(self.command(args, np), log, cancel)
+
+
+class SlurmExecutor(LocalExecutor):
+    """
+    Run each scan as a Slurm job step with srun.
+
+    Run buildlist.py inside an allocation (sbatch/salloc) spanning several
+    nodes, each scan gets np tasks placed by Slurm wherever cores are free.
+    """
+
+    name = "slurm"
+
+    def __init__(self, srunargs=()):
+        self.srunargs = list(srunargs)
+
+    def command(self, args, np):
+        # --exclusive keeps concurrent steps off each others cores
+        return ["srun", "--ntasks", f"{np}", "--exclusive"] + self.srunargs + args
+
+
+class SSHExecutor(LocalExecutor):
+    """
+    Fan scans out over hosts with ssh, each running mpirun there.
+
+    hosts  list of (host, slots), a host runs at most slots scans at once
+           and scans wait for a free slot
+
+    The working directory must be on a filesystem shared by the hosts, the
+    scan writes its .cache and .txt there and its output comes back over
+    ssh into the local .log.  A tty is asked for so cancelling a scan
+    hangs up its remote mpirun.
+    """
+
+    name = "ssh"
+
+    def __init__(self, hosts, mpirun, ssh="ssh"):
+        super().__init__(mpirun)
+        self.ssh = ssh
+        self._free = queue.Queue()
+        for host, slots in hosts:
+            for _ in range(slots):
+                self._free.put(host)
+
+    def command(self, args, np, host=None):
+        remote = " ".join(shlex.quote(a) for a in super().command(args, np))
+        cwd = shlex.quote(os.getcwd())
+        return [self.ssh, "-o", "BatchMode=yes", "-tt", host, f"cd {cwd} && {remote}"]
+
+    def run(self, args, np, log, cancel=None):
+        host = self._free.get()
+        try:
+            logging.debug(f"Running on {host}")
+            run_command(self.command(args, np, host), log, cancel)
+        finally:
+            self._free.put(host)
+
+
+class FakeExecutor:
+    """
+    Record scans instead of running them, for tests.
+
+    func(args, np, log) is called in place of the command if given, eg. to
+    write the outputs the scan would have.
+    """
+
+    name = "fake"
+
+    def __init__(self, func=None):
+        self.func = func
+        self.calls = []  # (args, np) of each scan
+
+    def run(self, args, np, log, cancel=None):
+        self.calls.append((args, np))
+        if self.func:
+            self.func(args, np, log)
+
+
+def parse_hosts(spec):
+    """'node1,node2:4' to [("node1", 1), ("node2", 4)]"""
+    hosts = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, slots = item.partition(":")
+        hosts.append((host, int(slots or 1)))
+    return hosts
+
+
+def get_executor(name, section, mpirun):
+    """
+    Executor for buildlist.py --executor name.
+
+    section  [buildlist] of purgetools.ini for sshhosts and srunargs
+    mpirun   path to mpirun for local and ssh
+    """
+    if name == "slurm":
+        return SlurmExecutor(shlex.split(section.get("srunargs", "")))
+    if name == "ssh":
+        hosts = parse_hosts(section.get("sshhosts", ""))
+        if not hosts:
+            raise ValueError("--executor ssh needs sshhosts in [buildlist]")
+        return SSHExecutor(hosts, mpirun)
+    return LocalExecutor(mpirun)
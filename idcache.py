@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import pathlib
+import pwd
+import time
+from collections import namedtuple
+
+# subset of pwd.struct_passwd the tools use, same attribute names
+Identity = namedtuple("Identity", ["pw_name", "pw_uid", "pw_gecos"])
+
+
+class IdentityCache:
+    """
+    Cache of passwd entries by uid and by username.
+
+    Lookups that miss fall through to NSS (pwd) once and are remembered,
+    including misses.  An optional on disk snapshot lets later runs skip
+    NSS, each entry is kept until it is older than ttl seconds.
+    """
+
+    def __init__(self, path=False, ttl=86400):
+        self.path = path  # location of on disk snapshot, False for memory only
+        self.ttl = ttl  # seconds before snapshot is stale
+        self._by_uid = {}
+        self._by_name = {}
+        self._added = {}  # uid to time entry was looked up, for the snapshot
+        self._dirty = False  # entries added since load/save
+
+    def add(self, name, uid, gecos="", added=None):
+        """Add entry looked up at time added (default now), returns the Identity."""
+        entry = Identity(pw_name=name, pw_uid=uid, pw_gecos=gecos)
+        self._by_uid[uid] = entry
+        self._by_name[name] = entry
+        self._added[uid] = added if added is not None else time.time()
+        self._dirty = True
+        return entry
+
+    def _add_pw(self, pw):
+        return self.add(pw.pw_name, pw.pw_uid, pw.pw_gecos)
+
+    def preload(self):
+        """Bulk load every entry NSS will enumerate with getpwall()."""
+        count = 0
+        for pw in pwd.getpwall():
+            self._add_pw(pw)
+            count += 1
+        logging.debug(f"Preloaded {count} passwd entries")
+        return count
+
+    def getpwuid(self, uid):
+        """Same as pwd.getpwuid() but cached, raises KeyError if not found."""
+        try:
+            entry = self._by_uid[uid]
+        except KeyError:
+            try:
+                entry = self._add_pw(pwd.getpwuid(uid))
+            except KeyError:
+                entry = self._by_uid[uid] = None  # remember misses too
+
+        if entry is None:
+            raise KeyError(f"getpwuid(): uid not found: {uid}")
+        return entry
+
+    def getpwnam(self, name):
+        """Same as pwd.getpwnam() but cached, raises KeyError if not found."""
+        try:
+            entry = self._by_name[name]
+        except KeyError:
+            try:
+                entry = self._add_pw(pwd.getpwnam(name))
+            except KeyError:
+                entry = self._by_name[name] = None
+
+        if entry is None:
+            raise KeyError(f"getpwnam(): name not found: {name}")
+        return entry
+
+    def uids(self, names):
+        """Return set of uids for list of usernames, unknown names are skipped."""
+        uids = set()
+        for name in names:
+            try:
+                uids.add(self.getpwnam(name).pw_uid)
+            except KeyError:
+                logging.warning(f"User {name} not found, can't ignore")
+
+        return uids
+
+    def load(self):
+        """
+        Load entries newer than ttl from the snapshot at path.
+
+        returns True if every entry in the snapshot was still fresh
+        """
+        if not self.path:
+            return False
+
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.debug(f"Not loading identity cache {self.path}: {e}")
+            return False
+
+        oldest = time.time() - self.ttl
+        stale = 0
+        try:
+            for name, uid, gecos, added in snapshot["entries"]:
+                if added < oldest:
+                    stale += 1
+                else:
+                    self.add(name, uid, gecos, added=added)
+        except (KeyError, TypeError, ValueError) as e:
+            # older snapshot format, start over
+            logging.info(f"Not loading identity cache {self.path}: {e}")
+            return False
+        self._dirty = bool(stale)  # so the stale entries are dropped on save
+
+        loaded = len(snapshot["entries"]) - stale
+        logging.debug(f"Loaded {loaded} entries from {self.path}, {stale} stale")
+        if stale:
+            logging.info(f"Identity cache {self.path} has {stale} stale entries")
+        return loaded > 0 and not stale
+
+    def save(self):
+        """Write snapshot to path if anything changed, replaced atomically."""
+        if not (self.path and self._dirty):
+            return False
+
+        # each entry keeps the time it was looked up so reusing a snapshot
+        # never extends how long an old entry lives
+        entries = [
+            list(e) + [self._added[uid]]
+            for uid, e in self._by_uid.items()
+            if e is not None
+        ]
+        path = pathlib.Path(self.path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        with tmp.open("w") as f:
+            json.dump({"time": time.time(), "entries": entries}, f)
+        os.replace(tmp, path)
+        self._dirty = False
+        return True
+
+    def configure(self, section, refresh=True):
+        """
+        Setup from the [idcache] section of purgetools.ini.
+
+        Loads the snapshot if there is a fresh one, otherwise preloads from
+        NSS if requested and saves a new snapshot.  refresh=False only loads,
+        for short lived processes that run many at once (purgehelper.py --file
+        under dfind) so they don't all call getpwall() and rewrite the snapshot.
+        """
+        self.path = section.get("path", "") or False
+        self.ttl = section.getint("ttl", 86400)
+        if self.load() or not refresh:
+            return
+
+        if section.getboolean("preload", False):
+            self.preload()
+            self.save()
+
+
+# shared cache for purgehelper, purgelist and userlist
+identities = IdentityCache()
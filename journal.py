@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# outcomes that are tried again on --resume rather than skipped
+RETRY = ("error",)
+
+
+class Journal:
+    """
+    Append only record of what was done to each path and when.
+
+    One JSON line [time, outcome, path] per path handled.  Records are
+    buffered and written every buffersize records or interval seconds,
+    and fsync'd, so a crash loses at most the last buffer which is then
+    just checked again on --resume.
+
+    With no path records are only kept in memory for take(), used to send
+    them from worker processes to the parent writing the journal.
+    """
+
+    def __init__(self, path=None, buffersize=1000, interval=10):
+        self.path = path
+        self.buffersize = buffersize
+        self.interval = interval  # seconds
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last = time.time()
+        self._f = open(path, "a", errors="surrogateescape") if path else None
+
+    def record(self, path, outcome):
+        """Record outcome for path now."""
+        self.write([(time.time(), outcome, path)])
+
+    def write(self, records):
+        """Add list of (time, outcome, path) records eg. from take()."""
+        with self._lock:
+            self._buffer.extend(records)
+            if self._f is None:
+                return
+            if (
+                len(self._buffer) >= self.buffersize
+                or time.time() - self._last >= self.interval
+            ):
+                self._flush()
+
+    def take(self):
+        """Return buffered records and reset."""
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        return records
+
+    def _flush(self):
+        lines = "".join(
+            json.dumps([int(t), outcome, path]) + "\n"
+            for t, outcome, path in self._buffer
+        )
+        self._buffer = []
+        self._f.write(lines)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._last = time.time()
+
+    def flush(self):
+        """Write anything buffered."""
+        with self._lock:
+            if self._f is not None and self._buffer:
+                self._flush()
+
+    def close(self):
+        if self._f is not None:
+            self.flush()
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_done(path):
+    """
+    Set of paths in journal at path that don't need doing again.
+
+    Paths whose last outcome was in RETRY are left out, a partly written
+    last line from a crash is ignored.
+    """
+    done = set()
+    try:
+        f = open(path, errors="surrogateescape")
+    except FileNotFoundError:
+        return done
+
+    with f:
+        for line in f:
+            try:
+                _, outcome, entry = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping damaged journal line in {path}: {line!r}")
+                continue
+            if outcome in RETRY:
+                done.discard(entry)
+            else:
+                done.add(entry)
+
+    logging.info(f"Loaded {len(done)} completed paths from journal {path}")
+    return done
+
+
+def skip_done(paths, done):
+    """Yield paths not in set done."""
+    skipped = 0
+    for path in paths:
+        if path in done:
+            skipped += 1
+        else:
+            yield path
+    logging.info(f"Skipped {skipped} paths already in the journal")
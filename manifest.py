@@ -0,0 +1,122 @@
+import fnmatch
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections import defaultdict
+
+from idcache import identities
+
+
+def manifest_path(section):
+    """Manifest directory from [purgehelper] in purgetools.ini."""
+    path = section.get("manifestpath", "")
+    if path:
+        return pathlib.Path(path)
+    return pathlib.Path(section["stagepath"]) / ".manifest"
+
+
+class Manifest:
+    """
+    Per user index of staged files for restore.py.
+
+    One <username>.manifest of JSON lines [time, size, original, staged] in
+    path for each user.  Records are buffered and appended with a single
+    O_APPEND write per user so many processes (dfind, purgelist.py workers)
+    can add to the same manifests at once.
+    """
+
+    def __init__(self, path, buffersize=1000):
+        self.path = pathlib.Path(path)
+        self.buffersize = buffersize
+        self._buffer = defaultdict(list)  # username to lines
+        self._count = 0
+        self._lock = threading.Lock()
+        self._made = False
+
+    def record(self, uid, original, staged, size):
+        """Add a staged file owned by uid."""
+        try:
+            user = identities.getpwuid(uid).pw_name
+        except KeyError:
+            user = str(uid)
+        line = json.dumps([int(time.time()), size, str(original), str(staged)])
+        with self._lock:
+            self._buffer[user].append(line + "\n")
+            self._count += 1
+            if self._count >= self.buffersize:
+                self._flush()
+
+    def _flush(self):
+        if not self._made:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._made = True
+        for user, lines in self._buffer.items():
+            data = "".join(lines).encode(errors="surrogateescape")
+            fd = os.open(
+                self.path / f"{user}.manifest",
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0o600,
+            )
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        self._buffer.clear()
+        self._count = 0
+
+    def flush(self):
+        """Append anything buffered."""
+        with self._lock:
+            if self._count:
+                self._flush()
+
+    close = flush
+
+
+def read_manifest(path):
+    """Yield (time, size, original, staged) from one manifest, skipping damage."""
+    with open(path, errors="surrogateescape") as f:
+        for line in f:
+            try:
+                t, size, original, staged = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping damaged manifest line in {path}: {line!r}")
+                continue
+            yield t, size, original, staged
+
+
+def find_entries(path, users=None, prefix=None, pattern=None):
+    """
+    Look up staged files in the manifests in directory path.
+
+    users    list of usernames to read, default every manifest
+    prefix   only original paths under this directory
+    pattern  only original paths matching this glob (fnmatch)
+
+    returns dict original path to (size, staged path), the latest staging of
+    each original path wins
+    """
+    path = pathlib.Path(path)
+    if users:
+        manifests = [path / f"{user}.manifest" for user in users]
+    else:
+        manifests = sorted(path.glob("*.manifest"))
+    if prefix:
+        prefix = prefix.rstrip("/") + "/"
+
+    entries = {}
+    for m in manifests:
+        if not m.exists():
+            logging.warning(f"No manifest {m}")
+            continue
+        for _, size, original, staged in read_manifest(m):
+            if prefix and not original.startswith(prefix):
+                continue
+            if pattern and not fnmatch.fnmatchcase(original, pattern):
+                continue
+            entries[original] = (size, staged)
+
+    return entries
@@ -0,0 +1,140 @@
+import errno
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DirTracker:
+    """
+    Remember directories files were purged or staged from.
+
+    The directory's times are taken the first time it is seen, before
+    anything in it is removed, so they can later be checked against the
+    same age rules as the files.  Only mtime and ctime are kept, the
+    buildlist.py scan reads every directory shortly before the purge so
+    their atime (under relatime) says nothing about use.
+    """
+
+    def __init__(self):
+        self._times = {}  # directory to (mtime, ctime) before any action
+        self.acted = {}  # same for directories something was removed from
+        self._lock = threading.Lock()
+
+    def before(self, parent, dir_fd=None):
+        """Record times of parent, call before acting on a file in it."""
+        if parent in self._times:
+            return
+        try:
+            st = os.fstat(dir_fd) if dir_fd is not None else os.stat(parent)
+        except OSError:
+            return
+        times = (st.st_mtime, st.st_ctime)
+        with self._lock:
+            self._times.setdefault(parent, times)
+
+    def after(self, parent):
+        """A file in parent was removed."""
+        with self._lock:
+            if parent in self._times and parent not in self.acted:
+                self.acted[parent] = self._times[parent]
+
+    def take(self):
+        """Return acted and reset, to send from worker processes."""
+        with self._lock:
+            acted, self.acted = self.acted, {}
+            self._times = {}
+        return acted
+
+    def merge(self, acted):
+        """Add in take() from another tracker, keeping the oldest times."""
+        with self._lock:
+            for parent, times in acted.items():
+                if parent in self.acted:
+                    times = tuple(map(min, self.acted[parent], times))
+                self.acted[parent] = times
+
+
+def _protected(path, root):
+    """root, its direct children (the buildlist scan directories) and outside it"""
+    parent = os.path.dirname(path)
+    return path == root or parent == root or not path.startswith(root + os.sep)
+
+
+def prune_dirs(acted, root, cutoff, ignore_ctime=False, threads=8, dryrun=False):
+    """
+    Remove directories left empty under root, deepest first.
+
+    acted         dict directory to (mtime, ctime) from DirTracker
+    root          path the lists were scanned under, it and its direct
+                  children are never removed
+    cutoff        epoch time directories must be older than (age_cutoff())
+    ignore_ctime  don't check ctime, same as for files
+
+    atime isn't checked for directories, listing them updates it.
+
+    Parents of removed directories are tried as well up to root.  Each
+    depth is done in parallel on threads, rmdir() itself is the empty
+    check so nothing is listed.
+
+    returns Counter of pruned, notempty, underage and error
+    """
+    root = os.path.abspath(root).rstrip(os.sep) or os.sep
+    outcomes = Counter()
+    if dryrun:
+        logging.info("Dryrun requested nothing was removed, skipping prune")
+        return outcomes
+
+    times = dict(acted)
+    # parents up to root are candidates too, take their times now before
+    # anything under them is removed
+    for path in list(acted):
+        parent = os.path.dirname(path)
+        while not _protected(parent, root) and parent not in times:
+            try:
+                st = os.stat(parent)
+                times[parent] = (st.st_mtime, st.st_ctime)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    levels = defaultdict(list)
+    for path in times:
+        if not _protected(path, root):
+            levels[path.count(os.sep)].append(path)
+
+    emptied = set(acted)  # directories something was removed from
+
+    def rmdir(path):
+        if path not in emptied:
+            return None  # ancestor with nothing removed under it
+        mtime, ctime = times[path]
+        if mtime > cutoff or (ctime > cutoff and not ignore_ctime):
+            logging.debug(f"Directory underage: {path}")
+            return "underage"
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            if e.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                return "notempty"
+            if e.errno == errno.ENOENT:
+                return None
+            logging.error(f"Directory {path} {e}")
+            return "error"
+        logging.info(f"Removed empty directory {path}")
+        return "pruned"
+
+    with ThreadPoolExecutor(threads) as executor:
+        for depth in sorted(levels, reverse=True):
+            paths = levels[depth]
+            results = list(executor.map(rmdir, paths))
+            for path, outcome in zip(paths, results):
+                if outcome:
+                    outcomes[outcome] += 1
+                if outcome == "pruned":
+                    emptied.add(os.path.dirname(path))
+
+    counts = " ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+    logging.info(f"Pruned empty directories under {root}: {counts}")
+    return outcomes
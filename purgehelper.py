@@ -5,13 +5,27 @@
 import argparse
 import configparser
 import datetime
+import errno
+import io
 import logging
+import os
 import pathlib
 import pprint
-import pwd
+import stat
 import subprocess
 import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from idcache import identities
+from journal import Journal, load_done, skip_done
+from manifest import Manifest, manifest_path
+from prune import DirTracker, prune_dirs
+from purgestats import Progress, PurgeStats, count_entries, write_json
+from stagecopy import CrossDeviceStager, StageCopyError, copy_stage
+from throttle import AdaptiveLimiter, TokenBucket
 
 # load config file settings
 config = configparser.ConfigParser()
@@ -36,10 +50,79 @@ def parse_args(args):
         "--days", help="Number of days to check st_atime", type=int, required=True
     )
     parser.add_argument(
-        "--file", help="File to check and take action on", type=str, required=True
+        "--purge", help="Don't stage, delete in place", action="store_true"
+    )
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="File to check and take action on", type=str)
+    source.add_argument(
+        "--files-from",
+        help="Batch mode, read paths to check from LIST ('-' for stdin)",
+        type=str,
+        metavar="LIST",
     )
     parser.add_argument(
-        "--purge", help="Don't stage, delete in place", action="store_true"
+        "-0",
+        "--null",
+        help="Paths in --files-from are NUL delimited rather than newline",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--dirfd",
+        help="Batch mode, group paths by directory and open each directory once",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-rate",
+        help="Batch mode, most files to check per second (Default 0 no limit)",
+        type=float,
+        default=0,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--threads",
+        help="Batch mode, number of threads checking files (Default 1)",
+        type=int,
+        default=1,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--target-latency",
+        help="Batch mode, adapt threads to keep p95 metadata latency under MS",
+        type=float,
+        default=0,
+        metavar="MS",
+    )
+    parser.add_argument(
+        "--stats",
+        help="Batch mode, write final counters, bytes and latencies as JSON to FILE",
+        type=str,
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--progress",
+        help="Batch mode, how often to log progress (Default 60)",
+        type=int,
+        metavar="S",
+        default=60,
+    )
+    parser.add_argument(
+        "--prune-root",
+        help="Batch mode, remove directories left empty under ROOT, never ROOT "
+        "or its direct children",
+        type=str,
+        metavar="ROOT",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Batch mode, append each path's outcome to FILE as it's done",
+        type=str,
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Batch mode, skip paths already done in --journal",
+        action="store_true",
     )
 
     verbosity = parser.add_mutually_exclusive_group()
@@ -54,6 +137,10 @@ def parse_args(args):
     )
 
     args = parser.parse_args(args)
+    if args.resume and not args.journal:
+        parser.error("--resume needs --journal")
+    if args.journal and args.dryrun:
+        parser.error("--journal can't be used with --dryrun, nothing would be done")
     return args
 
 
@@ -76,6 +163,10 @@ class PurgeNotFileError(PurgeError):
 class PurgeDaysUnderError(PurgeError):
     """exception class when file is skiped for under age"""
 
+    def __init__(self, PurgeObject, message, field="atime"):
+        self.field = field  # which of atime, ctime, mtime was underage
+        super().__init__(PurgeObject, message)
+
     def __str__(self):
         try:
             atime = datetime.date.fromtimestamp(self.PurgeObject.stat.st_atime)
@@ -86,6 +177,16 @@ class PurgeDaysUnderError(PurgeError):
         return s
 
 
+def age_cutoff(days):
+    """Return epoch time a file must be older than to be acted on (today - days)."""
+    today = datetime.date.today()
+    delta = datetime.timedelta(days=days)
+    delta = today - delta
+    logging.debug(f"Today: {today} Delta: {delta}")
+
+    return time.mktime(delta.timetuple())
+
+
 class PurgeObject:
     def __init__(
         self,
@@ -94,6 +195,13 @@ class PurgeObject:
         purge=False,  # don't move to stagepath, just blow it away NOT IMPLIMENTED
         stagepath=False,  # Path to move file to for staging
         userignore=False,  # array of usernames to ignore
+        uidignore=False,  # set of uids to ignore, precomputed from userignore
+        cutoff=False,  # precomputed age_cutoff(days) to share across many objects
+        dir_fd=None,  # open fd of path's parent, stat/unlink/rename relative to it
+        stage_fd=None,  # open fd of the stage directory to rename into with dir_fd
+        stagedirs=None,  # StageDirs shared across objects to skip repeat mkdirs
+        stager=None,  # CrossDeviceStager to copy in background if stagepath on other fs
+        manifest=None,  # manifest.Manifest to record staged files in for restore
     ):
         """setup the path and rules for purge action (purge or stage)"""
 
@@ -108,57 +216,83 @@ class PurgeObject:
 
         # store the parameters
         # ok parameters are acceptable hit the filesystem
+        self._dir_fd = dir_fd
+        self._stage_fd = stage_fd
+        self._stagedirs = stagedirs
+        self._stager = stager
+        self._manifest = manifest
+        self.future = None  # set if staging was queued with stager
+        self.target = None  # where the file was staged to
         self._check_valid(path)
         self._days = days
         self._purge = purge
         self._stagepath = stagepath
+        self._cutoff = cutoff
         self.userignore = userignore
+        self.uidignore = uidignore
 
     def _check_valid(self, path):
         """Check if valid file and exists"""
         p = pathlib.Path(path)
-        if p.is_file():
+        if self._dir_fd is not None:
+            # only look up the name in the already open parent directory
+            try:
+                st = os.stat(p.name, dir_fd=self._dir_fd)
+            except (FileNotFoundError, NotADirectoryError):
+                st = None
+            if st is None or not stat.S_ISREG(st.st_mode):
+                raise PurgeNotFileError(self, f"File {path} does not exist or file")
+            self._path = p
+            self.stat = st
+        elif p.is_file():
             self._path = p
             self.stat = p.stat()
         else:
             raise PurgeNotFileError(self, f"File {path} does not exist or file")
 
     def applyrules(self, dryrun=False, ignore_ctime=False):
-        """apply the settings/rules to the file"""
+        """
+        apply the settings/rules to the file
+
+        returns action taken "ignored", "purged" or "staged"
+        """
 
         # check if file owned by a user to ignore if so skip everything else
-        if self.userignore:  # there are users to ignore do extra lookup
-            username = pwd.getpwuid(self.stat.st_uid).pw_name
+        if self.uidignore:  # uids already known no lookup needed
+            if self.stat.st_uid in self.uidignore:
+                uid = self.stat.st_uid
+                logging.info(f"Skipping {self._path} owned by uid {uid} in ignore list")
+                return "ignored"
+        elif self.userignore:  # there are users to ignore do extra lookup
+            username = identities.getpwuid(self.stat.st_uid).pw_name
             logging.debug(f"{self._path} owned by {username}")
             if username in self.userignore:
                 # username found in ignorelist stop here
                 logging.info(
                     f"Skipping {self._path} owned by {username} in ignore list"
                 )
-                return
+                return "ignored"
 
         # check self._days rule
-        today = datetime.date.today()
-        delta = datetime.timedelta(days=self._days)
-        delta = today - delta
-        logging.debug(f"Today: {today} Delta: {delta}")
-
-        cur_time = time.mktime(delta.timetuple())
+        if self._cutoff:
+            cur_time = self._cutoff
+        else:
+            cur_time = age_cutoff(self._days)
 
         # if today - days > st_atime continue
         if self.stat.st_atime > cur_time:
             logging.debug(f"File Underage: {self._path} st_atime: {self.stat.st_atime}")
-            raise PurgeDaysUnderError(self, "file underage atime")
+            raise PurgeDaysUnderError(self, "file underage atime", field="atime")
 
         # if today - days > st_ctime continue
         if self.stat.st_ctime > cur_time and not ignore_ctime:
             logging.debug(f"File Underage: {self._path} st_ctime: {self.stat.st_ctime}")
-            raise PurgeDaysUnderError(self, "file underage ctime")
+            raise PurgeDaysUnderError(self, "file underage ctime", field="ctime")
 
         # if today - days > st_mtime continue
         if self.stat.st_mtime > cur_time:
             logging.debug(f"File Underage: {self._path} st_mtime: {self.stat.st_mtime}")
-            raise PurgeDaysUnderError(self, "file underage mtime")
+            raise PurgeDaysUnderError(self, "file underage mtime", field="mtime")
 
         # if file is purge remove (CAREFUL) else stage
         if self._purge:
@@ -168,7 +302,12 @@ class PurgeObject:
                 logging.info("Dryrun requested skipping purge {self._path}")
             else:
                 # actaully do it
-                self._path.unlink()
+                if self._dir_fd is not None:
+                    os.unlink(self._path.name, dir_fd=self._dir_fd)
+                else:
+                    self._path.unlink()
+
+            return "purged"
 
         # stage, don't remove
         else:
@@ -176,8 +315,13 @@ class PurgeObject:
             #  eg.   /scratch/sr/brockp/topurge.txt
             #  dest: /stagepath/scratch/sr/brockp/topurge.txt
             parent = self._path.parent  # get path part
-            sd = pathlib.Path(self._stagepath) / parent.relative_to("/")
-            sd.mkdir(parents=True, exist_ok=True)
+            sd = stage_dir(self._stagepath, parent)
+            if self._stage_fd is None:
+                # caller didn't already create and open stage directory
+                if self._stagedirs is not None:
+                    self._stagedirs.makedirs(sd)
+                else:
+                    sd.mkdir(parents=True, exist_ok=True)
 
             # move / rename file to new location
             target = sd / self._path.name
@@ -186,7 +330,393 @@ class PurgeObject:
                 logging.info("Dryrun requested skipping stage/rename")
             else:
                 # actaully do it
-                self._path.rename(target)
+                if self._stager is not None and self._stager.crossdev(self.stat):
+                    # can't rename to another filesystem, copy in the background
+                    self.future = self._stager.stage(self._path, target, self.stat)
+                elif self._stage_fd is not None:
+                    name = self._path.name
+                    os.rename(
+                        name, name, src_dir_fd=self._dir_fd, dst_dir_fd=self._stage_fd
+                    )
+                else:
+                    try:
+                        self._path.rename(target)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        logging.debug(f"{self._path} on another filesystem, copying")
+                        copy_stage(self._path, target, self.stat)
+
+                self.target = target
+                if self.future is None:
+                    # queued copies are recorded by PurgeBatch once done
+                    self.record_manifest()
+
+            return "staged"
+
+    def record_manifest(self):
+        """Add the staged file to the manifest if there is one."""
+        if self._manifest is not None:
+            original = os.path.abspath(self._path)
+            self._manifest.record(
+                self.stat.st_uid, original, self.target, self.stat.st_size
+            )
+
+
+def stage_dir(stagepath, parent):
+    """Directory under stagepath that mirrors parent."""
+    return pathlib.Path(stagepath) / pathlib.Path(parent).relative_to("/")
+
+
+class StageDirs:
+    """
+    Remember stage directories created this run.
+
+    Many files staged from one directory only create (or stat) the
+    matching stage directory tree once rather than once per file.
+    """
+
+    def __init__(self):
+        self._made = set()
+
+    def makedirs(self, path):
+        """Create path and parents unless already done, returns True if created."""
+        path = pathlib.Path(path)
+        if path in self._made:
+            return False
+
+        path.mkdir(parents=True, exist_ok=True)
+        self._made.add(path)
+        self._made.update(path.parents)
+        return True
+
+
+def open_paths(name):
+    """
+    Open the --files-from list, '-' for stdin, for read_paths().
+
+    Only \\n ends a line and nothing is translated so a \\r in a path is kept.
+    """
+    if name == "-":
+        return io.TextIOWrapper(
+            sys.stdin.buffer, errors="surrogateescape", newline="\n"
+        )
+    return open(name, errors="surrogateescape", newline="\n")
+
+
+def read_paths(f, null=False):
+    """
+    Yield paths from an open file for batch mode.
+
+    f     open text file (or stdin) with one path per entry
+    null  entries are NUL delimited (find -print0) rather than newline
+    """
+    if not null:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+        return
+
+    buf = ""
+    for chunk in iter(lambda: f.read(65536), ""):
+        buf += chunk
+        *entries, buf = buf.split("\0")
+        for entry in entries:
+            if entry:
+                yield entry
+    if buf:
+        yield buf
+
+
+class PurgeBatch:
+    """
+    Apply PurgeObject rules to many paths in a single process.
+
+    Rules and the age cutoff are built once and reused for every path,
+    errors on a single path are counted in summary rather than fatal.
+    """
+
+    def __init__(
+        self,
+        days=False,  # (required) number of days old from TODAY required to take action on
+        purge=False,  # don't move to stagepath, just blow it away
+        stagepath=False,  # Path to move file to for staging
+        userignore=False,  # array of usernames to ignore
+        dryrun=False,  # passed to PurgeObject.applyrules()
+        ignore_ctime=False,  # passed to PurgeObject.applyrules()
+        dirfd=False,  # group paths by parent and work relative to directory fds
+        copythreads=4,  # threads copying small files if stagepath on other fs
+        largethreads=2,  # threads copying files of largesize and over
+        largesize=1024 ** 3,  # bytes for a file to use the large copy threads
+        maxrate=0,  # ceiling of files per second, 0 unlimited
+        target_latency=0,  # seconds, adapt concurrency to keep p95 latency under
+        concurrency=1,  # most threads that will call apply() at once
+        journal=None,  # journal.Journal to record each path's outcome in
+        prune=False,  # track directories files are removed from for prune_dirs()
+        manifest=None,  # manifest.Manifest to record staged files in
+    ):
+        self._po_args = {
+            "days": days,
+            "purge": purge,
+            "stagepath": stagepath,
+            "uidignore": identities.uids(userignore) if userignore else False,
+            "cutoff": age_cutoff(days) if days else False,
+            "stagedirs": StageDirs() if stagepath else None,
+            "stager": None,
+            "manifest": manifest,
+        }
+        if stagepath:
+            self._po_args["stager"] = CrossDeviceStager(
+                stagepath,
+                threads=copythreads,
+                largethreads=largethreads,
+                largesize=largesize,
+            )
+        self._stagepath = stagepath
+        self._dryrun = dryrun
+        self._ignore_ctime = ignore_ctime
+        self.dirfd = dirfd
+        # staging renames are grouped by source directory too
+        self.grouped = dirfd or bool(stagepath)
+        self._lock = threading.Lock()  # apply() may be called from many threads
+        self._pending = []  # (path, PurgeObject) of queued cross filesystem copies
+        self.summary = Counter()
+        self.stats = PurgeStats()
+        self.journal = journal
+        self.dirs = DirTracker() if prune else None
+        self.throttle = TokenBucket(maxrate) if maxrate else None
+        self.limiter = None
+        if target_latency:
+            self.limiter = AdaptiveLimiter(target_latency, maximum=concurrency)
+
+    def _observe(self, op, seconds):
+        self.stats.observe(op, seconds)
+        if self.limiter is not None:
+            self.limiter.observe(seconds)
+
+    def _apply(self, path, dir_fd, stage_fd):
+        """returns tuple outcome, finer grained reason for stats, PurgeObject"""
+        po = None
+        reason = None
+        start = time.monotonic()
+        try:
+            try:
+                # relative --files-from entries are relative to the cwd, made
+                # absolute so stage_dir() can place them under stagepath
+                po = PurgeObject(
+                    path=os.path.abspath(path),
+                    dir_fd=dir_fd,
+                    stage_fd=stage_fd,
+                    **self._po_args,
+                )
+            finally:
+                self._observe("stat", time.monotonic() - start)
+            start = time.monotonic()
+            outcome = po.applyrules(
+                dryrun=self._dryrun, ignore_ctime=self._ignore_ctime
+            )
+            if outcome in ("purged", "staged"):
+                self._observe(outcome, time.monotonic() - start)
+        except PurgeNotFileError as e:
+            logging.info(f"{e}")
+            outcome = "notfile"
+        except PurgeDaysUnderError as e:
+            logging.info(f"{e}")
+            outcome = "underage"
+            reason = f"underage_{e.field}"
+        except OSError as e:
+            # permissions, file removed underneath us etc, keep going
+            logging.error(f"{path} {e}")
+            outcome = "error"
+
+        return outcome, reason, po
+
+    def apply(self, path, dir_fd=None, stage_fd=None):
+        """Check and take action on a single path, returns outcome counted."""
+        if self.dirs is not None:
+            # directory times before anything in it is removed
+            self.dirs.before(os.path.dirname(os.path.abspath(path)), dir_fd)
+        if self.throttle is not None:
+            self.throttle.acquire()
+        if self.limiter is not None:
+            self.limiter.acquire()
+        try:
+            outcome, reason, po = self._apply(path, dir_fd, stage_fd)
+        finally:
+            if self.limiter is not None:
+                self.limiter.release()
+
+        if outcome == "staged" and po.future is not None:
+            # counted once the copy finishes in flush()
+            with self._lock:
+                self._pending.append((path, po))
+                backlog = len(self._pending)
+            if backlog >= 10000:
+                self.flush()
+            return "copying"
+
+        with self._lock:
+            self.summary[outcome] += 1
+        if self.journal is not None:
+            self.journal.record(path, outcome)
+        if self.dirs is not None and outcome in ("purged", "staged"):
+            self.dirs.after(os.path.dirname(os.path.abspath(path)))
+        if outcome in ("purged", "staged"):
+            self.stats.count(outcome, nbytes=po.stat.st_size)
+        else:
+            self.stats.count(reason or outcome)
+        return outcome
+
+    def flush(self):
+        """Wait for queued cross filesystem copies, returns Counter of outcomes."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        outcomes = Counter()
+        for path, po in pending:
+            try:
+                copied = po.future.result()
+                outcome = "staged"
+                self.stats.count("staged", nbytes=copied)
+                po.record_manifest()
+            except (OSError, StageCopyError) as e:
+                logging.error(f"{path} {e}")
+                outcome = "error"
+                self.stats.count("error")
+            outcomes[outcome] += 1
+            if self.journal is not None:
+                self.journal.record(path, outcome)
+            if self.dirs is not None and outcome == "staged":
+                self.dirs.after(os.path.dirname(os.path.abspath(path)))
+
+        with self._lock:
+            self.summary.update(outcomes)
+        if self._po_args["manifest"] is not None:
+            self._po_args["manifest"].flush()
+        return outcomes
+
+    @property
+    def copied(self):
+        """Bytes copied to a stagepath on another filesystem."""
+        stager = self._po_args["stager"]
+        return stager.bytes if stager else 0
+
+    def close(self):
+        """Finish queued copies and release copy threads."""
+        self.flush()
+        if self._po_args["stager"]:
+            self._po_args["stager"].close()
+
+    def apply_group(self, parent, paths):
+        """
+        Check and take action on paths that all share the directory parent.
+
+        With dirfd parent is opened once (and the matching stage directory
+        once it exists) and each file is handled relative to those descriptors
+        rather than resolving the full path again for every operation.
+
+        returns Counter of outcomes for the group
+        """
+        outcomes = Counter()
+        if not self.dirfd:
+            for path in paths:
+                outcomes[self.apply(path)] += 1
+            return outcomes
+
+        try:
+            dir_fd = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError as e:
+            logging.info(f"Directory {parent} {e}")
+            outcome = "notfile" if isinstance(e, FileNotFoundError) else "error"
+            with self._lock:
+                self.summary[outcome] += len(paths)
+            self.stats.count(outcome, n=len(paths))
+            if self.journal is not None:
+                for path in paths:
+                    self.journal.record(path, outcome)
+            outcomes[outcome] += len(paths)
+            return outcomes
+
+        stage_fd = None
+        try:
+            for path in paths:
+                outcome = self.apply(path, dir_fd=dir_fd, stage_fd=stage_fd)
+                outcomes[outcome] += 1
+                if outcome == "staged" and stage_fd is None and not self._dryrun:
+                    # first file staged created the stage directory, open it
+                    # so the rest of the group renames relative to it
+                    sd = stage_dir(self._stagepath, parent)
+                    stage_fd = os.open(sd, os.O_RDONLY | os.O_DIRECTORY)
+        finally:
+            if stage_fd is not None:
+                os.close(stage_fd)
+            os.close(dir_fd)
+
+        return outcomes
+
+    def _apply_group(self, group):
+        return self.apply_group(*group)
+
+    def run(self, paths, groupsize=10000, executor=None, progress=None):
+        """
+        Apply rules to every path in iterable paths, returns summary.
+
+        Paths are read groupsize at a time, with dirfd or staging they are
+        grouped by parent.  If given executor (eg. ThreadPoolExecutor) is used
+        to map over the paths or groups and progress (purgestats.Progress)
+        updated after each group.
+        """
+        mapper = executor.map if executor else map
+        for chunk in chunks(paths, groupsize):
+            if self.grouped:
+                # each thread takes a whole directory at a time
+                list(mapper(self._apply_group, group_by_parent(chunk).items()))
+            else:
+                list(mapper(self.apply, chunk))
+            if progress:
+                progress.update(sum(self.summary.values()))
+
+        self.flush()
+        return self.summary
+
+    def report(self):
+        """Single line summary of the batch."""
+        report = summarize(self.summary, dryrun=self._dryrun)
+        stager = self._po_args["stager"]
+        if stager and stager.files + stager.errors:
+            report += f"\n{stager.report()}"
+        return report
+
+
+def chunks(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def group_by_parent(paths):
+    """Return dict of parent directory string to list of paths, in first seen order."""
+    groups = {}
+    for path in paths:
+        # bare names are in the current directory
+        groups.setdefault(os.path.dirname(path) or ".", []).append(path)
+
+    return groups
+
+
+def summarize(summary, dryrun=False):
+    """Single line summary from a Counter of applyrules outcomes."""
+    total = sum(summary.values())
+    counts = " ".join(f"{k}={v}" for k, v in sorted(summary.items()))
+    dryrun = " (dryrun)" if dryrun else ""
+    return f"Processed {total} paths{dryrun}: {counts}"
 
 
 if __name__ == "__main__":
@@ -201,11 +731,12 @@ if __name__ == "__main__":
         level = logging.INFO
 
     logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=level)
+    # only batch mode refreshes the snapshot, --file runs many times at once
+    identities.configure(config["idcache"], refresh=bool(args.files_from))
 
     po_args = {
-        "path": args.file,
         "days": args.days,
-        "userignore": args.users_ignore.split(","),
+        "userignore": args.users_ignore.split(",") if args.users_ignore else False,
     }
 
     # set if were purging or staging
@@ -214,11 +745,66 @@ if __name__ == "__main__":
     else:
         # staging
         po_args["stagepath"] = config["purgehelper"]["stagepath"]
+        if not args.dryrun:
+            po_args["manifest"] = Manifest(manifest_path(config["purgehelper"]))
+
+    if args.files_from:
+        # batch mode, one process for the whole list
+        done = load_done(args.journal) if args.resume else set()
+        journal = Journal(args.journal) if args.journal else None
+        batch = PurgeBatch(
+            journal=journal,
+            prune=bool(args.prune_root),
+            dryrun=args.dryrun,
+            dirfd=args.dirfd,
+            maxrate=args.max_rate,
+            target_latency=args.target_latency / 1000,
+            concurrency=args.threads,
+            copythreads=config["purgehelper"].getint("copythreads", 4),
+            largethreads=config["purgehelper"].getint("largethreads", 2),
+            largesize=config["purgehelper"].getint("largesize", 1024 ** 3),
+            **po_args,
+        )
+        f = open_paths(args.files_from)
+        if args.files_from == "-":
+            total = None
+        else:
+            total = count_entries([args.files_from], sep=b"\0" if args.null else b"\n")
+        progress = Progress(total=total, interval=args.progress)
+        executor = ThreadPoolExecutor(args.threads) if args.threads > 1 else None
+        with f:
+            paths = read_paths(f, null=args.null)
+            if done:
+                paths = skip_done(paths, done)
+            batch.run(paths, executor=executor, progress=progress)
+        if executor:
+            executor.shutdown()
+        batch.close()
+        if journal:
+            journal.close()
+        if args.prune_root:
+            prune_dirs(
+                batch.dirs.acted,
+                args.prune_root,
+                age_cutoff(args.days),
+                threads=args.threads,
+                dryrun=args.dryrun,
+            )
+        if args.stats:
+            stats = batch.stats.as_dict()
+            stats.update(progress.status(stats["total"]), dryrun=args.dryrun)
+            write_json(args.stats, stats)
+
+        print(batch.report())
+        identities.save()
+        sys.exit(1 if batch.summary["error"] else 0)
 
     try:
         # Run the actual purge / stage
-        po = PurgeObject(**po_args)
+        po = PurgeObject(path=args.file, **po_args)
         po.applyrules(dryrun=args.dryrun)
+        if po_args.get("manifest"):
+            po_args["manifest"].flush()
 
     except PurgeNotFileError as e:
         # do stuff here with files that don't exist
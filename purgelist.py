@@ -0,0 +1,408 @@
+#!/usr/bin/python3 -u
+
+## -u is needed to avoid buffering stdout
+
+import argparse
+import configparser
+import logging
+import multiprocessing as mp
+import pathlib
+import pprint
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from idcache import identities
+from journal import Journal, load_done, skip_done
+from manifest import Manifest, manifest_path
+from prune import DirTracker, prune_dirs
+from purgehelper import PurgeBatch, age_cutoff, chunks, summarize
+from purgestats import Progress, PurgeStats, count_entries, write_json
+
+# load config file settings
+config = configparser.ConfigParser()
+config.read(pathlib.Path(__file__).resolve().parent.joinpath("etc/purgetools.ini"))
+
+
+def parse_args(args):
+    # grab cli options
+    parser = argparse.ArgumentParser(
+        description="Stage or purge every file in lists from buildlist.py/userlist.py"
+    )
+    parser.add_argument(
+        "lists", help="List files to process (Default all for --scanident)", nargs="*"
+    )
+    parser.add_argument(
+        "--scanident", help="Unique identifier for scan from buildlist.py", type=str
+    )
+    parser.add_argument(
+        "--userlists",
+        help="Use per user <scanident>-<user>.purge.txt lists from userlist.py",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--dryrun", help="Print what would do but dont do it", action="store_true"
+    )
+    parser.add_argument(
+        "--users-ignore",
+        help="Comma list of usernames files to skip",
+        type=str,
+        default=False,
+    )
+    parser.add_argument(
+        "--days", help="Number of days to check st_atime", type=int, required=True
+    )
+    parser.add_argument(
+        "--purge", help="Don't stage, delete in place", action="store_true"
+    )
+    parser.add_argument(
+        "--procs",
+        help="Number of worker processes (Default 4)",
+        type=int,
+        default=4,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--threads",
+        help="Number of threads in each process (total procs * threads) (Default 8)",
+        type=int,
+        default=8,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--chunksize",
+        help="Number of paths handed to a process at a time (Default 1000)",
+        type=int,
+        default=1000,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--dirfd",
+        help="Group paths by directory and work relative to one open handle each",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-rate",
+        help="Most files per second across all processes (Default 0 no limit)",
+        type=float,
+        default=0,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--target-latency",
+        help="Adapt threads to keep p95 metadata latency under MS (Default off)",
+        type=float,
+        default=0,
+        metavar="MS",
+    )
+    parser.add_argument(
+        "--stats",
+        help="Write final counters, bytes and latencies as JSON to FILE",
+        type=str,
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--progress",
+        help="How often to log progress and ETA (Default 60)",
+        type=int,
+        metavar="S",
+        default=60,
+    )
+    parser.add_argument(
+        "--prune-root",
+        help="Remove directories left empty under ROOT (the path given to "
+        "buildlist.py), never ROOT or its direct children",
+        type=str,
+        metavar="ROOT",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Append each path's outcome to <list>.journal as it's done",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Skip paths already done in each <list>.journal, implies --journal",
+        action="store_true",
+    )
+
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-v",
+        "--verbose",
+        help="Increase messages, including files as added",
+        action="store_true",
+    )
+    verbosity.add_argument(
+        "-q", "--quiet", help="Decrease messages", action="store_true"
+    )
+
+    args = parser.parse_args(args)
+    if not (args.lists or args.scanident):
+        parser.error("Must give list files or --scanident")
+    args.journal = args.journal or args.resume
+    if args.journal and args.dryrun:
+        parser.error("--journal can't be used with --dryrun, nothing would be done")
+    return args
+
+
+def get_lists(path=pathlib.Path.cwd(), scanident=None, userlists=False):
+    """
+    Get list files for a scan.
+
+    path       pathlib directory the lists are in
+    scanident  scan identifier given to buildlist.py
+    userlists  per user *.purge.txt lists rather than per directory lists
+
+    returns sorted list of pathlib paths
+    """
+    lists = path.glob(f"{scanident}-*.txt")
+    return sorted(p for p in lists if p.name.endswith(".purge.txt") == userlists)
+
+
+# format of files being parsed
+# -rw-rw---- bvansade glotzer 232.791 KB Nov 21 2019 15:48 /scratch/sglotzer_root/sglotzer/bvansade/peng-kai/cycles_poly/.ipynb_checkpoints/integrator_energy_replicates-checkpoint.ipynb
+
+
+# get the path from the format, path is everything after the time and may have spaces
+def get_path(line):
+    try:
+        path = line.rstrip("\n").split(None, 9)[9]
+    except IndexError as error:
+        logging.error(f"{error}, Line: {line}")
+        path = None
+
+    return path
+
+
+def read_list(listpath):
+    """Yield every path in one dwalk text list."""
+    logging.info(f"Reading {listpath}")
+    with open(listpath, errors="surrogateescape", newline="\n") as f:
+        for line in f:
+            path = get_path(line)
+            if path:
+                yield path
+
+
+def journal_path(listpath):
+    """Journal kept next to each list."""
+    return pathlib.Path(f"{listpath}.journal")
+
+
+# each worker process builds its PurgeBatch and thread pool once
+_batch = None
+_executor = None
+
+
+def _init_worker(batch_args, threads, journal):
+    global _batch, _executor
+    batch_args = dict(batch_args)
+    if batch_args.get("manifest"):
+        # each worker appends to the manifests itself
+        batch_args["manifest"] = Manifest(batch_args["manifest"])
+    # worker only collects journal records, the parent writes them
+    _batch = PurgeBatch(
+        concurrency=threads, journal=Journal() if journal else None, **batch_args
+    )
+    _executor = ThreadPoolExecutor(threads)
+
+
+def purge_chunk(chunk):
+    """
+    Apply rules to a chunk of paths across the worker threads.
+
+    returns tuple Counter of outcomes, bytes copied across filesystems,
+    PurgeStats.take(), journal records and DirTracker.take() for the chunk
+    """
+    # a worker process only runs one chunk at a time
+    before = Counter(_batch.summary)
+    copied = _batch.copied
+    _batch.run(chunk, groupsize=len(chunk), executor=_executor)
+    records = _batch.journal.take() if _batch.journal else []
+    dirs = _batch.dirs.take() if _batch.dirs else {}
+    return (
+        _batch.summary - before,
+        _batch.copied - copied,
+        _batch.stats.take(),
+        records,
+        dirs,
+    )
+
+
+def purge_lists(
+    lists,
+    procs=4,
+    threads=8,
+    chunksize=1000,
+    stats=None,
+    progress=None,
+    journal=False,
+    resume=False,
+    prune_root=None,
+    **batch_args,
+):
+    """
+    Stage or purge every path in lists across a pool of processes and threads.
+
+    lists      dwalk text lists to read paths from
+    procs      number of worker processes
+    threads    number of threads in each worker process
+    chunksize  number of paths to hand a worker at a time
+    stats      PurgeStats to merge worker counters and latencies into
+    progress   purgestats.Progress updated as chunks complete
+    journal    record each path's outcome in <list>.journal
+    resume     skip paths already done in <list>.journal
+    prune_root remove directories left empty under it, see prune.prune_dirs()
+    batch_args options for PurgeBatch() eg. days, purge, stagepath, dryrun
+               maxrate is for all processes and split between them, manifest
+               is the manifest directory
+
+    returns Counter of outcomes
+    """
+    if batch_args.get("maxrate"):
+        batch_args["maxrate"] = batch_args["maxrate"] / procs
+
+    dirs = DirTracker()
+    if prune_root:
+        batch_args["prune"] = True
+
+    summary = Counter()
+    pending = deque()  # (journal, async result)
+    copied = 0
+    start = time.time()
+
+    def collect():
+        nonlocal copied
+        chunkjournal, result = pending.popleft()
+        outcomes, nbytes, chunkstats, records, chunkdirs = result.get()
+        summary.update(outcomes)
+        copied += nbytes
+        dirs.merge(chunkdirs)
+        if chunkjournal is not None:
+            chunkjournal.write(records)
+        if stats is not None:
+            stats.merge(chunkstats)
+        if progress is not None:
+            progress.update(sum(summary.values()))
+
+    journals = []
+    initargs = (batch_args, threads, journal)
+    try:
+        with mp.Pool(procs, initializer=_init_worker, initargs=initargs) as p:
+            for listpath in lists:
+                paths = read_list(listpath)
+                listjournal = None
+                if journal:
+                    if resume:
+                        paths = skip_done(paths, load_done(journal_path(listpath)))
+                    listjournal = Journal(journal_path(listpath))
+                    journals.append(listjournal)
+
+                # only keep a few chunks per process queued so huge lists are
+                # not read into memory all at once
+                for chunk in chunks(paths, chunksize):
+                    result = p.apply_async(purge_chunk, (chunk,))
+                    pending.append((listjournal, result))
+                    if len(pending) >= procs * 2:
+                        collect()
+
+            while pending:
+                collect()
+    finally:
+        # keep what was journaled even if a worker failed
+        for listjournal in journals:
+            listjournal.close()
+
+    if copied:
+        elapsed = time.time() - start
+        rate = copied / elapsed / 1024 ** 2
+        logging.info(f"Copied {copied} bytes across filesystems ({rate:.1f} MB/s)")
+
+    if prune_root:
+        prune_dirs(
+            dirs.acted,
+            prune_root,
+            age_cutoff(batch_args["days"]),
+            ignore_ctime=batch_args.get("ignore_ctime", False),
+            threads=procs * threads,
+            dryrun=batch_args.get("dryrun", False),
+        )
+
+    return summary
+
+
+if __name__ == "__main__":
+    pp = pprint.PrettyPrinter(indent=4)
+    args = parse_args(sys.argv[1:])
+
+    if args.quiet:
+        level = logging.WARNING
+    elif args.verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    logging.basicConfig(
+        format="%(asctime)s %(processName)s %(levelname)s %(message)s", level=level
+    )
+    identities.configure(config["idcache"])
+
+    if args.lists:
+        lists = [pathlib.Path(x) for x in args.lists]
+    else:
+        lists = get_lists(scanident=args.scanident, userlists=args.userlists)
+
+    print("Will process following lists")
+    pp.pprint(lists)
+
+    # look up ignored users once here, workers inherit the cache
+    userignore = args.users_ignore.split(",") if args.users_ignore else False
+    if userignore:
+        identities.uids(userignore)
+
+    batch_args = {
+        "days": args.days,
+        "userignore": userignore,
+        "dryrun": args.dryrun,
+        "dirfd": args.dirfd,
+        "maxrate": args.max_rate,
+        "target_latency": args.target_latency / 1000,
+        "copythreads": config["purgehelper"].getint("copythreads", 4),
+        "largethreads": config["purgehelper"].getint("largethreads", 2),
+        "largesize": config["purgehelper"].getint("largesize", 1024 ** 3),
+    }
+
+    # set if were purging or staging
+    if args.purge:
+        batch_args["purge"] = True
+    else:
+        # staging
+        batch_args["stagepath"] = config["purgehelper"]["stagepath"]
+        if not args.dryrun:
+            batch_args["manifest"] = manifest_path(config["purgehelper"])
+
+    stats = PurgeStats()
+    progress = Progress(total=count_entries(lists), interval=args.progress)
+    summary = purge_lists(
+        lists,
+        procs=args.procs,
+        threads=args.threads,
+        chunksize=args.chunksize,
+        journal=args.journal,
+        resume=args.resume,
+        prune_root=args.prune_root,
+        stats=stats,
+        progress=progress,
+        **batch_args,
+    )
+
+    print(summarize(summary, dryrun=args.dryrun))
+    if args.stats:
+        final = stats.as_dict()
+        final.update(progress.status(final["total"]))
+        final.update(dryrun=args.dryrun, lists=[str(x) for x in lists])
+        write_json(args.stats, final)
+    identities.save()
+    sys.exit(1 if summary["error"] else 0)
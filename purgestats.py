@@ -0,0 +1,212 @@
+import bisect
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# latency histogram bucket upper bounds in seconds, last bucket is everything over
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """Fixed bucket latency histogram that can be merged between processes."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p (0-100) percentile."""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def merge(self, d):
+        """Add in a histogram from as_dict()."""
+        self.counts = [a + b for a, b in zip(self.counts, d["buckets"])]
+        self.count += d["count"]
+        self.sum += d["sum"]
+        self.max = max(self.max, d["max"])
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": list(self.counts),
+        }
+
+
+class PurgeStats:
+    """
+    Counters, bytes and operation latency for a purge run.
+
+    counters  Counter of reasons eg. purged, staged, ignored, notfile,
+              underage_atime, underage_ctime, underage_mtime, error
+    bytes     Counter of bytes by reason (purged, staged)
+    latency   Histogram per operation eg. stat, purged, staged
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # updated from many threads
+        self.counters = Counter()
+        self.bytes = Counter()
+        self.latency = defaultdict(Histogram)
+
+    def count(self, reason, n=1, nbytes=0):
+        with self._lock:
+            self.counters[reason] += n
+            if nbytes:
+                self.bytes[reason] += nbytes
+
+    def observe(self, op, seconds):
+        with self._lock:
+            self.latency[op].observe(seconds)
+
+    @contextmanager
+    def timer(self, op):
+        """Time the with block as op."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(op, time.monotonic() - start)
+
+    @property
+    def total(self):
+        return sum(self.counters.values())
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "total": sum(self.counters.values()),
+                "counters": dict(self.counters),
+                "bytes": dict(self.bytes),
+                "latency": {op: h.as_dict() for op, h in self.latency.items()},
+            }
+
+    def take(self):
+        """Return as_dict() and reset, to send deltas from worker processes."""
+        d = self.as_dict()
+        with self._lock:
+            self.counters.clear()
+            self.bytes.clear()
+            self.latency.clear()
+        return d
+
+    def merge(self, d):
+        """Add in stats from as_dict() or take()."""
+        with self._lock:
+            self.counters.update(d["counters"])
+            self.bytes.update(d["bytes"])
+            for op, h in d["latency"].items():
+                self.latency[op].merge(h)
+
+
+def format_duration(seconds):
+    """Seconds as [Nd ]HH:MM:SS, days are kept rather than wrapping."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    s = f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{days}d {s}" if days else s
+
+
+class Progress:
+    """Log progress with rate and ETA no more than every interval seconds."""
+
+    def __init__(self, total=None, interval=60):
+        self.total = total  # expected entries, None if unknown
+        self.interval = interval
+        self.start = time.time()
+        self._last = self.start
+
+    def status(self, done):
+        """Dict of done, expected, rate and eta (seconds) at done entries."""
+        elapsed = time.time() - self.start
+        rate = done / elapsed if elapsed else 0.0
+        eta = None
+        if self.total and rate:
+            eta = max(self.total - done, 0) / rate
+        return {
+            "done": done,
+            "expected": self.total,
+            "elapsed": elapsed,
+            "rate": rate,
+            "eta": eta,
+        }
+
+    def update(self, done, force=False):
+        """Log a progress line if interval has passed, returns True if logged."""
+        now = time.time()
+        if not force and now - self._last < self.interval:
+            return False
+        self._last = now
+
+        s = self.status(done)
+        line = f"Progress: {done}"
+        if self.total:
+            line += f"/{self.total} ({100 * done / self.total:.1f}%)"
+        line += f" {s['rate']:.1f}/s"
+        if s["eta"] is not None:
+            line += f" ETA {format_duration(s['eta'])}"
+        logging.info(line)
+        return True
+
+
+def count_entries(paths, sep=b"\n"):
+    """Count entries (lines) in files without parsing them."""
+    count = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                count += block.count(sep)
+    return count
+
+
+def write_json(path, data):
+    """Write data as JSON to path, replaced atomically."""
+    path = pathlib.Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    with tmp.open("w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,66 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def _scan(dirpath, stat):
+    """
+    List one directory.
+
+    returns tuple dirpath, os.stat_result of dirpath, list of subdirectory
+    names and list of (name, os.stat_result) of everything else (lstat, no
+    symlinks followed).  stat_result is None if stat=False.
+    """
+    dirnames = []
+    files = []
+    with os.scandir(dirpath) as it:
+        st = os.stat(dirpath)
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirnames.append(entry.name)
+                    continue
+                files.append(
+                    (entry.name, entry.stat(follow_symlinks=False) if stat else None)
+                )
+            except FileNotFoundError:
+                continue  # removed while we were listing
+
+    return dirpath, st, dirnames, files
+
+
+def walk(roots, threads=16, stat=True, exclude=()):
+    """
+    Walk directory trees with os.scandir on a pool of threads.
+
+    roots    list of directories to walk
+    threads  directories listed (and their files stat'd) at once, the calls
+             release the GIL so threads keep many metadata requests in flight
+    stat     lstat every non directory entry
+    exclude  directory paths not to descend into
+
+    Yields (dirpath, st, dirnames, files) as each directory is listed, see
+    _scan(), in no particular order.  Directories that can't be listed are
+    logged and skipped.  Directories are taken depth first so the queue
+    of ones still to list stays small on wide trees.
+    """
+    todo = deque(str(r) for r in roots)
+    running = set()
+    with ThreadPoolExecutor(threads) as executor:
+        while todo or running:
+            while todo and len(running) < threads * 2:
+                running.add(executor.submit(_scan, todo.pop(), stat))
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    dirpath, st, dirnames, files = future.result()
+                except OSError as e:
+                    logging.error(f"Can't list {e.filename}: {e.strerror}")
+                    continue
+                for d in dirnames:
+                    path = os.path.join(dirpath, d)
+                    if path not in exclude:
+                        todo.append(path)
+                yield dirpath, st, dirnames, files
@@ -0,0 +1,292 @@
+import grp
+import logging
+import multiprocessing as mp
+import os
+import queue
+import stat
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from idcache import identities
+from scansort import RunWriter, merge_runs
+
+UNITS = ["B", "KB", "MB", "GB", "TB", "PB", "EB"]
+
+
+class Cancelled(Exception):
+    """A scan was stopped by its cancel event before finishing."""
+
+
+class WorkerDied(Exception):
+    """A scan worker process exited before finishing, eg. killed for memory."""
+
+
+def _check_workers(workers):
+    """Raise WorkerDied, stopping the others, if any worker exited badly."""
+    for w in workers:
+        if w.exitcode:
+            for other in workers:
+                other.terminate()
+                other.join()
+            raise WorkerDied(f"scan worker {w.pid} exited with {w.exitcode}")
+
+
+def format_size(size):
+    """Size as dwalk prints it, eg. 232.791 KB."""
+    value = float(size)
+    unit = 0
+    while value >= 1024 and unit < len(UNITS) - 1:
+        value /= 1024
+        unit += 1
+    return f"{value:7.3f} {UNITS[unit]:>2}"
+
+
+def dwalk_line(path, st, user, group):
+    """
+    One line of dwalk --text-output for path.
+
+    -rw-rw---- bvansade glotzer 232.791 KB Nov 21 2019 15:48 /scratch/...
+    """
+    mtime = time.strftime("%b %e %Y %H:%M", time.localtime(st.st_mtime))
+    return (
+        f"{stat.filemode(st.st_mode)} {user} {group} "
+        f"{format_size(st.st_size)} {mtime} {path}\n"
+    )
+
+
+def log_line(message):
+    """message with the timestamp dwalk puts on its progress lines"""
+    return time.strftime("[%Y-%m-%dT%H:%M:%S] ") + message + "\n"
+
+
+class _Names:
+    """uid/gid to name for one worker, numbers when there is no name"""
+
+    def __init__(self):
+        self._groups = {}
+
+    def user(self, uid):
+        try:
+            return identities.getpwuid(uid).pw_name
+        except KeyError:
+            return str(uid)
+
+    def group(self, gid):
+        if gid not in self._groups:
+            try:
+                self._groups[gid] = grp.getgrgid(gid).gr_name
+            except KeyError:
+                self._groups[gid] = str(gid)
+        return self._groups[gid]
+
+
+def _list(dirpath, todo, runs, names, cutoff, counts, dist=None):
+    """
+    List dirpath, queue its subdirectories and add old regular files to runs.
+
+    Subdirectories are skipped if todo is None.  Old files are added to
+    dist (distribution.Distribution) too if given.
+    """
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            counts["items"] += 1
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if todo is not None:
+                        todo.put(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue  # removed while we were listing
+
+            # same as dwalk --atime +N --mtime +N --ctime +N
+            if st.st_atime > cutoff or st.st_mtime > cutoff or st.st_ctime > cutoff:
+                continue
+            if "\n" in entry.path:
+                logging.warning(f"Skipping path with newline {entry.path!r}")
+                continue
+            runs.add(
+                dwalk_line(
+                    entry.path, st, names.user(st.st_uid), names.group(st.st_gid)
+                )
+            )
+            counts["files"] += 1
+            counts["bytes"] += st.st_size
+            if dist is not None:
+                dist.add(st.st_size, st.st_atime)
+
+
+def _worker(todo, results, walked, rundir, cutoff, runsize, dist):
+    """Take directories off todo until given None then put results on results."""
+    runs = RunWriter(rundir, runsize)
+    names = _Names()
+    counts = Counter()
+    while True:
+        dirpath = todo.get()
+        if dirpath is None:
+            break
+        items = counts["items"]
+        try:
+            _list(dirpath, todo, runs, names, cutoff, counts, dist)
+        except OSError as e:
+            logging.error(f"Can't list {dirpath}: {e.strerror}")
+            counts["errors"] += 1
+        finally:
+            with walked.get_lock():
+                walked.value += counts["items"] - items
+            todo.task_done()
+
+    runs.close()
+    results.put((counts, runs.runs, dist))
+
+
+def scan(
+    root,
+    output,
+    cutoff,
+    procs=4,
+    progress=60,
+    log=None,
+    runsize=500000,
+    cancel=None,
+    dist=None,
+):
+    """
+    Find regular files under root not accessed, modified or changed since cutoff.
+
+    The pure Python equivalent of dwalk --type f --atime/--mtime/--ctime +N
+    --sort user --text-output output.  Directories are shared between procs
+    processes through one queue, each lists a directory, puts its
+    subdirectories back on the queue and keeps matching files as sorted runs
+    that are merged into output at the end.  Nothing is written if nothing
+    matched, as with dwalk.
+
+    root      directory to scan
+    output    dwalk format text file to write sorted by user
+    cutoff    epoch time files must be older than (purgehelper.age_cutoff())
+    procs     worker processes
+    progress  seconds between progress lines written to log
+    log       open file to write dwalk style progress to
+    cancel    threading.Event, if set the workers are stopped and Cancelled
+              is raised
+    dist      distribution.Distribution to add matching files to
+
+    Raises WorkerDied if a worker process is killed or crashes.
+
+    returns Counter of items walked, files and bytes matched and errors
+    """
+    # spawn rather than fork, scan() is run from threads in buildlist.py
+    ctx = mp.get_context("spawn")
+    todo = ctx.JoinableQueue()
+    results = ctx.Queue()
+    walked = ctx.Value("Q", 0)
+
+    def write(message):
+        logging.debug(message)
+        if log:
+            log.write(log_line(message))
+            log.flush()
+
+    start = time.time()
+    write(f"Walking {root}")
+    with tempfile.TemporaryDirectory(
+        prefix=f".{os.path.basename(output)}.", dir=os.path.dirname(output) or "."
+    ) as rundir:
+        workers = [
+            ctx.Process(
+                target=_worker,
+                args=(todo, results, walked, rundir, cutoff, runsize, dist),
+            )
+            for _ in range(procs)
+        ]
+        for w in workers:
+            w.start()
+
+        todo.put(str(root))
+        waiter = threading.Thread(target=todo.join, daemon=True)
+        waiter.start()
+        last = start
+        while True:
+            waiter.join(min(progress, 1))
+            if not waiter.is_alive():
+                break
+            # a dead worker never calls task_done(), todo.join() would wait
+            # forever for it
+            _check_workers(workers)
+            if cancel is not None and cancel.is_set():
+                for w in workers:
+                    w.terminate()
+                    w.join()
+                write(f"Cancelled after {walked.value} items")
+                raise Cancelled(root)
+            if time.time() - last < progress:
+                continue
+            last = time.time()
+            elapsed = last - start
+            write(
+                f"Walked {walked.value} items in {elapsed:.3f} secs "
+                f"({walked.value / elapsed:.3f} items/sec) ..."
+            )
+
+        for _ in workers:
+            todo.put(None)
+        counts = Counter()
+        runs = []
+        for _ in workers:
+            while True:
+                try:
+                    c, r, d = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    _check_workers(workers)
+            counts.update(c)
+            runs += r
+            if dist is not None:
+                dist.merge(d)
+        for w in workers:
+            w.join()
+
+        elapsed = time.time() - start
+        write(
+            f"Walked {counts['items']} items in {elapsed:.3f} secs "
+            f"({counts['items'] / max(elapsed, 1e-9):.3f} items/sec)"
+        )
+        if cancel is not None and cancel.is_set():
+            # the runs go with rundir
+            write(f"Cancelled after {counts['items']} items")
+            raise Cancelled(root)
+        if runs:
+            merge_runs(runs, output)
+        write(f"Matched {counts['files']} files {counts['bytes']} bytes")
+
+    return counts
+
+
+def scan_files(dirpath, output, cutoff, log=None, dist=None):
+    """
+    scan() of only the files directly in dirpath, its subdirectories are left.
+
+    For the files beside the subdirectories buildlist.py scans separately
+    when it splits a directory.
+
+    returns Counter as scan()
+    """
+    counts = Counter()
+    start = time.time()
+    with tempfile.TemporaryDirectory(
+        prefix=f".{os.path.basename(output)}.", dir=os.path.dirname(output) or "."
+    ) as rundir:
+        runs = RunWriter(rundir)
+        _list(dirpath, None, runs, _Names(), cutoff, counts, dist)
+        runs.close()
+        if runs.runs:
+            merge_runs(runs.runs, output)
+
+    if log:
+        elapsed = time.time() - start
+        log.write(log_line(f"Walked {counts['items']} items in {elapsed:.3f} secs"))
+    return counts
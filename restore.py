@@ -0,0 +1,177 @@
+#!/usr/bin/python3 -u
+
+## -u is needed to avoid buffering stdout
+
+import argparse
+import configparser
+import errno
+import logging
+import os
+import pathlib
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from manifest import find_entries, manifest_path
+from purgehelper import group_by_parent, summarize
+from stagecopy import StageCopyError, copy_stage
+
+# load config file settings
+config = configparser.ConfigParser()
+config.read(pathlib.Path(__file__).resolve().parent.joinpath("etc/purgetools.ini"))
+
+
+def parse_args(args):
+    # grab cli options
+    parser = argparse.ArgumentParser(
+        description="Move staged files back to where they were staged from"
+    )
+    parser.add_argument(
+        "--user", help="Comma list of users to restore (Default all users)", type=str,
+    )
+    parser.add_argument(
+        "--prefix", help="Only restore files originally under PATH", metavar="PATH"
+    )
+    parser.add_argument(
+        "--glob",
+        help="Only restore files whose original path matches GLOB",
+        metavar="GLOB",
+    )
+    parser.add_argument(
+        "--threads",
+        help="Number of directories restored at once (Default 16)",
+        type=int,
+        default=16,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--manifestpath",
+        help="Manifest directory (Default from purgetools.ini)",
+        type=str,
+    )
+    parser.add_argument(
+        "--dryrun", help="Print what would be restored but dont", action="store_true"
+    )
+
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-v",
+        "--verbose",
+        help="Increase messages, including files as restored",
+        action="store_true",
+    )
+    verbosity.add_argument(
+        "-q", "--quiet", help="Decrease messages", action="store_true"
+    )
+
+    args = parser.parse_args(args)
+    if not (args.user or args.prefix or args.glob):
+        parser.error("Give at least one of --user, --prefix or --glob")
+    return args
+
+
+class Restore:
+    """
+    Move staged files from a manifest back to their original paths.
+
+    Files are handled a directory at a time across threads.  Nothing is
+    overwritten, if a file is back at the original path the staged copy is
+    left alone.  Staged files on another filesystem are copied back.
+    """
+
+    def __init__(self, threads=16, dryrun=False):
+        self.threads = threads
+        self.dryrun = dryrun
+        self.summary = Counter()
+
+    def restore(self, original, staged):
+        """Move staged back to original, returns outcome."""
+        try:
+            st = os.lstat(staged)
+        except FileNotFoundError:
+            logging.info(f"{staged} no longer in staging")
+            return "missing"
+        if os.path.lexists(original):
+            logging.warning(f"{original} exists, leaving {staged}")
+            return "exists"
+
+        logging.info(f"Restoring {staged} to {original}")
+        if self.dryrun:
+            return "restored"
+
+        try:
+            os.rename(staged, original)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            copy_stage(staged, original, st)
+        return "restored"
+
+    def _makedirs(self, parent, staged):
+        """Recreate parent if it was pruned, owned by the staged file's owner."""
+        if self.dryrun or os.path.isdir(parent):
+            return
+        os.makedirs(parent, exist_ok=True)
+        try:
+            st = os.lstat(staged)
+            os.chown(parent, st.st_uid, st.st_gid)
+        except OSError:
+            pass
+
+    def _restore_group(self, group):
+        parent, items = group
+        outcomes = Counter()
+        try:
+            self._makedirs(parent, items[0][1])
+        except OSError as e:
+            logging.error(f"Directory {parent} {e}")
+            outcomes["error"] += len(items)
+            return outcomes
+
+        for original, staged in items:
+            try:
+                outcome = self.restore(original, staged)
+            except (OSError, StageCopyError) as e:
+                logging.error(f"{original} {e}")
+                outcome = "error"
+            outcomes[outcome] += 1
+        return outcomes
+
+    def run(self, entries):
+        """
+        Restore every entry from manifest.find_entries().
+
+        returns Counter of restored, missing, exists and error
+        """
+        work = [
+            (parent, [(o, entries[o][1]) for o in paths])
+            for parent, paths in group_by_parent(entries).items()
+        ]
+        with ThreadPoolExecutor(self.threads) as executor:
+            for outcomes in executor.map(self._restore_group, work):
+                self.summary.update(outcomes)
+        return self.summary
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+
+    if args.quiet:
+        level = logging.WARNING
+    elif args.verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=level)
+
+    path = args.manifestpath or manifest_path(config["purgehelper"])
+    users = args.user.split(",") if args.user else None
+    start = time.time()
+    entries = find_entries(path, users=users, prefix=args.prefix, pattern=args.glob)
+    logging.info(f"Found {len(entries)} staged files in {time.time() - start:.1f}s")
+
+    summary = Restore(threads=args.threads, dryrun=args.dryrun).run(entries)
+    print(summarize(summary, dryrun=args.dryrun))
+    sys.exit(1 if summary["error"] else 0)
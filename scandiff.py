@@ -0,0 +1,229 @@
+#!/usr/bin/python3 -u
+
+## -u is needed to avoid buffering stdout
+
+import argparse
+import logging
+import pathlib
+import sys
+from collections import Counter, defaultdict
+
+from purgestats import write_json
+from pyscan import UNITS
+
+FIELDS = [
+    "added",
+    "added_bytes",
+    "removed",
+    "removed_bytes",
+    "unchanged",
+    "delta_bytes",
+]
+
+
+def parse_args(args):
+    # grab cli options
+    parser = argparse.ArgumentParser(
+        description="Compare the lists of two buildlist.py scans"
+    )
+    parser.add_argument("old", help="Earlier scanident", type=str)
+    parser.add_argument("new", help="Later scanident", type=str)
+    parser.add_argument(
+        "--directory",
+        help="Where the scan lists are (Default current directory)",
+        type=str,
+        default=".",
+    )
+    parser.add_argument(
+        "--json",
+        help="Write per user and per directory counts as JSON to FILE",
+        type=str,
+        metavar="FILE",
+    )
+
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-v",
+        "--verbose",
+        help="Increase messages, including every added and removed path",
+        action="store_true",
+    )
+    verbosity.add_argument(
+        "-q", "--quiet", help="Decrease messages", action="store_true"
+    )
+
+    args = parser.parse_args(args)
+    return args
+
+
+class ListOrderError(Exception):
+    """a list isn't sorted by user and path, see scansort.sort_text()"""
+
+    pass
+
+
+def scan_lists(directory, scanident):
+    """
+    Per directory lists of a scan.
+
+    returns dict top level directory name to <scanident>-<name>.txt, leaving
+    out userlist.py's .purge.txt, --split parts are in <scanident>-parts/
+    """
+    lists = {}
+    prefix = f"{scanident}-"
+    for path in pathlib.Path(directory).glob(f"{scanident}-*.txt"):
+        name = path.name[len(prefix) : -len(".txt")]
+        if name.endswith(".purge"):
+            continue
+        lists[name] = path
+    return lists
+
+
+def parse_line(line):
+    """(user, path, bytes) from a dwalk text line, bytes to its 3 decimals"""
+    fields = line.rstrip("\n").split(None, 9)
+    size = round(float(fields[3]) * 1024 ** UNITS.index(fields[4]))
+    return fields[1], fields[9], size
+
+
+def read_entries(path):
+    """Yield ((user, path), bytes) checking the list is in sort_key() order."""
+    last = None
+    with open(path, errors="surrogateescape", newline="\n") as f:
+        for line in f:
+            try:
+                user, name, size = parse_line(line)
+            except (IndexError, ValueError):
+                logging.error(f"Skipping damaged line in {path}: {line!r}")
+                continue
+            key = (user, name)
+            if last is not None and key < last:
+                raise ListOrderError(
+                    f"{path} isn't sorted by user and path at {name}, "
+                    "sort it with scansort.sort_text()"
+                )
+            last = key
+            yield key, size
+
+
+def diff_entries(old, new):
+    """
+    Merge two sorted entry streams from read_entries().
+
+    Yields (status, user, path, old bytes, new bytes) with status added,
+    removed or unchanged, reading each stream once.
+    """
+    end = object()
+    o = next(old, end)
+    n = next(new, end)
+    while o is not end or n is not end:
+        if n is end or (o is not end and o[0] < n[0]):
+            yield "removed", o[0][0], o[0][1], o[1], 0
+            o = next(old, end)
+        elif o is end or n[0] < o[0]:
+            yield "added", n[0][0], n[0][1], 0, n[1]
+            n = next(new, end)
+        else:
+            yield "unchanged", o[0][0], o[0][1], o[1], n[1]
+            o = next(old, end)
+            n = next(new, end)
+
+
+class ScanDiff:
+    """
+    Added, removed and unchanged purge candidates between two scans.
+
+    Added are new to the lists, removed were listed before and no longer are
+    (touched, deleted or rescued).  Bytes are from the text lists so only as
+    exact as their three decimals.
+    """
+
+    def __init__(self):
+        self.users = defaultdict(Counter)  # username to FIELDS
+        self.directories = defaultdict(Counter)  # top level directory to FIELDS
+
+    def add(self, directory, status, user, oldsize, newsize):
+        for counts in (self.users[user], self.directories[directory]):
+            counts[status] += 1
+            if status != "unchanged":
+                counts[f"{status}_bytes"] += oldsize or newsize
+            counts["delta_bytes"] += newsize - oldsize
+
+    def run(self, old, new):
+        """Compare lists, old and new are dicts from scan_lists()."""
+        for directory in sorted(set(old) | set(new)):
+            logging.info(f"Comparing {directory}")
+            entries = [
+                read_entries(lists[directory]) if directory in lists else iter(())
+                for lists in (old, new)
+            ]
+            for status, user, path, oldsize, newsize in diff_entries(*entries):
+                if status != "unchanged":
+                    logging.debug(f"{status} {path}")
+                self.add(directory, status, user, oldsize, newsize)
+
+    def totals(self):
+        total = Counter()
+        for counts in self.directories.values():
+            total.update(counts)
+        return total
+
+    def report(self):
+        """Tables of users and directories, biggest byte change first."""
+        lines = []
+        for title, table in [("user", self.users), ("directory", self.directories)]:
+            lines.append(
+                f"{title:>24} {'added':>10} {'removed':>10} {'unchanged':>10} "
+                f"{'delta bytes':>16}"
+            )
+            for key, c in sorted(
+                table.items(), key=lambda x: -abs(x[1]["delta_bytes"])
+            ):
+                lines.append(
+                    f"{key:>24} {c['added']:>10} {c['removed']:>10} "
+                    f"{c['unchanged']:>10} {c['delta_bytes']:>16}"
+                )
+            lines.append("")
+        t = self.totals()
+        lines.append(
+            f"Total added={t['added']} ({t['added_bytes']} bytes) "
+            f"removed={t['removed']} ({t['removed_bytes']} bytes) "
+            f"unchanged={t['unchanged']} delta={t['delta_bytes']} bytes"
+        )
+        return "\n".join(lines)
+
+    def as_dict(self):
+        def fields(counts):
+            return {f: counts[f] for f in FIELDS}
+
+        return {
+            "users": {k: fields(v) for k, v in self.users.items()},
+            "directories": {k: fields(v) for k, v in self.directories.items()},
+            "total": fields(self.totals()),
+        }
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+
+    if args.quiet:
+        level = logging.WARNING
+    elif args.verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=level)
+
+    diff = ScanDiff()
+    try:
+        diff.run(
+            scan_lists(args.directory, args.old), scan_lists(args.directory, args.new)
+        )
+    except ListOrderError as e:
+        logging.error(e)
+        sys.exit(2)
+    print(diff.report())
+
+    if args.json:
+        write_json(args.json, diff.as_dict())
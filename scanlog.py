@@ -0,0 +1,112 @@
+import glob
+import logging
+import pathlib
+import re
+import statistics
+
+# [2020-01-09T10:10:10] Walked 1234 items in 2.005 secs (615.461 items/sec) ...
+WALKED = re.compile(r"Walked (\d+) items in ([\d.]+) sec")
+
+
+def last_walked(logpath, tail=16384):
+    """
+    Final item count and seconds from a dwalk or pyscan log.
+
+    Only the last tail bytes are read unless the line isn't in them, so
+    checking a running scan's log is cheap however long it has got.
+
+    returns (items, seconds) of the last Walked line or None if there isn't
+    one or no log
+    """
+    try:
+        with open(logpath, "rb") as f:
+            size = f.seek(0, 2)
+            for start in (max(size - tail, 0), 0):
+                f.seek(start)
+                found = WALKED.findall(f.read().decode(errors="replace"))
+                if found:
+                    return int(found[-1][0]), float(found[-1][1])
+                if start == 0:
+                    break
+    except FileNotFoundError:
+        pass
+    return None
+
+
+# split parts of a directory are named parts/<top>+<sub>[+<sub>...] so their
+# outputs land in <scanident>-parts/, apart from any real directory's
+PARTS = "parts"
+
+
+def escape_part(name):
+    """name with % and + escaped so it can be joined into a part name"""
+    return name.replace("%", "%25").replace("+", "%2B")
+
+
+def part_prefix(name):
+    """
+    Prefix of the names of the parts a scan unit named name is split into.
+
+    A subdirectory's part is the prefix and its escaped name, the files
+    directly in name are the prefix alone.
+    """
+    if not name.startswith(f"{PARTS}/"):
+        name = f"{PARTS}/{escape_part(name)}"
+    return f"{name}+"
+
+
+# bytes in a dwalk .cache per entry, used when there is no log to go by
+CACHE_ENTRY_BYTES = 128
+
+
+def estimate_cost(name, history, directory="."):
+    """
+    Items a scan of directory name is expected to walk, from scan history.
+
+    Uses the Walked count from the <history>-<name>.log of the earlier scan,
+    failing that the size of its .cache.  The cache only holds purge
+    candidates so undercounts, but still ranks directories.  If name was
+    split into parts by that scan, see part_prefix(), their counts are added
+    up.
+
+    returns items or None if history has nothing on name
+    """
+    directory = pathlib.Path(directory)
+    walked = last_walked(directory / f"{history}-{name}.log")
+    if walked:
+        return walked[0]
+    cache = directory / f"{history}-{name}.cache"
+    if cache.is_file():
+        return cache.stat().st_size // CACHE_ENTRY_BYTES
+
+    prefix = directory / f"{history}-{part_prefix(name)}"
+    units = glob.glob(glob.escape(str(prefix)) + "*.log")
+    counts = [last_walked(log) for log in units]
+    if any(counts):
+        return sum(c[0] for c in counts if c)
+    return None
+
+
+def longest_first(paths, history=None, directory="."):
+    """
+    Order scan directories (paths or ScanUnits) by estimated cost, biggest first.
+
+    Started first, the longest scans are no longer what everything else
+    waits on at the end.  Directories history knows nothing about are given
+    the median of the known estimates.
+
+    returns list of (path, estimate)
+    """
+    estimates = {}
+    if history:
+        for path in paths:
+            estimates[path] = estimate_cost(path.name, history, directory)
+    known = [e for e in estimates.values() if e is not None]
+    default = int(statistics.median(known)) if known else 0
+    for path in paths:
+        if estimates.get(path) is None:
+            if history:
+                logging.debug(f"No history for {path.name} using {default}")
+            estimates[path] = default
+
+    return sorted(estimates.items(), key=lambda x: (-x[1], str(x[0])))
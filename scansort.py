@@ -0,0 +1,126 @@
+import heapq
+import logging
+import os
+import pathlib
+import tempfile
+
+
+def user_key(line):
+    """Username field of a dwalk text line, what dwalk --sort user orders by."""
+    return line.split(" ", 2)[1]
+
+
+def sort_key(line):
+    """
+    (user, path) of a dwalk text line, the order lists are written in.
+
+    Grouped by user for userlist.py and by path within each user so two
+    scans' lists can be compared in one pass, see scandiff.py.
+    """
+    fields = line.rstrip("\n").split(None, 9)
+    return fields[1], fields[9]
+
+
+def _open(path, mode="r"):
+    # paths in the lists may not be valid UTF-8 or may hold \r, keep them as is
+    return open(path, mode, newline="\n", errors="surrogateescape")
+
+
+class RunWriter:
+    """
+    Write lines as sorted runs for merge_runs().
+
+    Lines are held until runsize of them are buffered then sorted by
+    sort_key() and written to a new file in rundir, so memory stays bounded however
+    many lines are added.
+    """
+
+    def __init__(self, rundir, runsize=500000, prefix="run"):
+        self.rundir = pathlib.Path(rundir)
+        self.runsize = runsize
+        self.prefix = prefix
+        self.runs = []  # paths of runs written
+        self._lines = []
+
+    def add(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.runsize:
+            self.flush()
+
+    def flush(self):
+        if not self._lines:
+            return
+        self._lines.sort(key=sort_key)
+        path = self.rundir / f"{self.prefix}.{os.getpid()}.{len(self.runs)}"
+        with _open(path, "w") as f:
+            f.writelines(self._lines)
+        self.runs.append(path)
+        self._lines = []
+
+    close = flush
+
+
+def merge_runs(runs, output, fanin=128):
+    """
+    Merge sorted runs into output sorted by sort_key(), removing the runs.
+
+    Runs are merged fanin at a time so there are never more than fanin
+    files open, each line is read once per pass.
+
+    returns number of lines written
+    """
+    runs = list(runs)
+    pass_ = 0
+    while len(runs) > fanin:
+        merged = []
+        for i in range(0, len(runs), fanin):
+            path = pathlib.Path(f"{output}.merge{pass_}.{i // fanin}")
+            _merge(runs[i : i + fanin], path)
+            merged.append(path)
+        runs = merged
+        pass_ += 1
+
+    return _merge(runs, output)
+
+
+def _merge(runs, output):
+    files = [_open(run) for run in runs]
+    count = 0
+    try:
+        with _open(output, "w") as out:
+            for line in heapq.merge(*files, key=sort_key):
+                out.write(line)
+                count += 1
+    finally:
+        for f in files:
+            f.close()
+    for run in runs:
+        os.unlink(run)
+    logging.debug(f"Merged {len(runs)} runs, {count} lines into {output}")
+    return count
+
+
+def sort_text(source, output, runsize=500000, tmpdir=None):
+    """
+    Sort dwalk text output source by user and path into output, streaming.
+
+    The same order as dwalk --sort user,name without holding source in
+    memory, at most runsize lines at a time.  source and output may be the
+    same.
+
+    returns number of lines written
+    """
+    output = pathlib.Path(output)
+    with tempfile.TemporaryDirectory(
+        prefix=f".{output.name}.", dir=tmpdir or output.parent
+    ) as rundir:
+        runs = RunWriter(rundir, runsize)
+        with _open(source) as f:
+            for line in f:
+                runs.add(line)
+        runs.close()
+        tmp = pathlib.Path(rundir) / output.name
+        count = merge_runs(runs.runs, tmp)
+        os.replace(tmp, output)
+
+    return count
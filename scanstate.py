@@ -0,0 +1,80 @@
+import json
+import logging
+import pathlib
+import time
+
+from purgestats import write_json
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ScanState:
+    """
+    Per directory state of a buildlist.py scan in <scanident>-state.json.
+
+    Each ScanUnit is kept by name as pending, running, done or failed with
+    its path, attempts, runtime and entries walked, rewritten atomically on
+    every change so a killed run can be picked up with --resume.  Units
+    that are done are not scanned again, the rest are.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = pathlib.Path(path)
+        self.units = {}  # unit name to record
+        if resume:
+            try:
+                with open(self.path) as f:
+                    self.units = json.load(f)["units"]
+            except FileNotFoundError:
+                logging.warning(f"No {self.path} to resume, scanning everything")
+
+    def _save(self):
+        write_json(self.path, {"updated": time.time(), "units": self.units})
+
+    def _set(self, unit, state, **fields):
+        record = self.units.setdefault(
+            unit.name,
+            {
+                "path": str(unit.path),
+                "top": unit.top,
+                "files_only": unit.files_only,
+                "attempts": 0,
+                "runtime": None,
+                "entries": None,
+                "error": None,
+            },
+        )
+        record["state"] = state
+        record.update(fields)
+        self._save()
+
+    def add(self, units):
+        """Record units as pending, leaving alone any already known."""
+        for unit in units:
+            if unit.name not in self.units:
+                self._set(unit, PENDING)
+
+    def start(self, unit):
+        attempts = self.units.get(unit.name, {}).get("attempts", 0) + 1
+        self._set(unit, RUNNING, attempts=attempts)
+
+    def retry(self, unit, error):
+        self._set(unit, PENDING, error=error)
+
+    def done(self, unit, runtime, entries=None):
+        self._set(unit, DONE, runtime=round(runtime, 3), entries=entries, error=None)
+
+    def failed(self, unit, runtime, error):
+        self._set(unit, FAILED, runtime=round(runtime, 3), error=error)
+
+    def discard(self, unit):
+        """Forget a unit, eg. a straggler replaced by its re-split parts."""
+        if self.units.pop(unit.name, None) is not None:
+            self._save()
+
+    def select(self, *states):
+        """(name, record) of units in states, in name order."""
+        return [(n, r) for n, r in sorted(self.units.items()) if r["state"] in states]
@@ -0,0 +1,137 @@
+import os
+import pathlib
+import time
+
+from purgestats import write_json
+from scanlog import last_walked
+
+
+def _label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ScanStatus:
+    """
+    Aggregate progress of a buildlist.py scan for monitoring.
+
+    update() is given the scheduler's pending, running and finished units
+    and reads the tail of each running scan's log for its Walked count,
+    nothing is asked of the scans themselves.  Totals, rates and per
+    directory progress are written atomically to a node_exporter textfile
+    (textfile) and/or a JSON status file (status), at most every interval
+    seconds.
+    """
+
+    def __init__(
+        self,
+        scanident,
+        logname,  # logname(unit) path of unit's progress log
+        textfile=None,  # node_exporter textfile collector .prom to write
+        status=None,  # JSON status file to write
+        interval=15,  # seconds between writes at most
+        clock=time.time,
+    ):
+        self.scanident = scanident
+        self.logname = logname
+        self.textfile = textfile
+        self.status = status
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self._done = {}  # unit name to items walked by finished scans
+        self._last = None
+
+    def _walked(self, unit):
+        walked = last_walked(self.logname(unit))
+        return walked[0] if walked else 0
+
+    def snapshot(self, pending, running, done):
+        """
+        Progress as a dict.
+
+        pending  units not started
+        running  dict unit to seconds it has been running
+        done     units finished
+        """
+        now = self.clock()
+        for unit in done:
+            if unit.name not in self._done:
+                self._done[unit.name] = self._walked(unit)
+
+        directories = {}
+        for unit, elapsed in running.items():
+            items = self._walked(unit)
+            elapsed = max(elapsed, 1e-9)
+            directories[unit.name] = {
+                "items": items,
+                "seconds": round(elapsed, 3),
+                "rate": round(items / elapsed, 3),
+            }
+
+        items = sum(self._done.values()) + sum(d["items"] for d in directories.values())
+        elapsed = max(now - self.start, 1e-9)
+        return {
+            "scanident": self.scanident,
+            "start": self.start,
+            "updated": now,
+            "pending": len(pending),
+            "running": len(running),
+            "done": len(done),
+            "items": items,
+            "rate": round(items / elapsed, 3),
+            "directories": directories,
+        }
+
+    def prometheus(self, snapshot):
+        """node_exporter textfile format of snapshot()"""
+        ident = f'scanident="{_label(self.scanident)}"'
+        lines = [
+            "# HELP purgetools_scan_directories Scan directories by state",
+            "# TYPE purgetools_scan_directories gauge",
+        ]
+        for state in ("pending", "running", "done"):
+            lines.append(
+                f'purgetools_scan_directories{{{ident},state="{state}"}} '
+                f"{snapshot[state]}"
+            )
+        for name, help_, value in [
+            ("items", "Items walked so far", snapshot["items"]),
+            ("items_per_second", "Items walked per second", snapshot["rate"]),
+            ("start_time_seconds", "Scan start epoch time", snapshot["start"]),
+            ("updated_time_seconds", "Epoch time of this update", snapshot["updated"]),
+        ]:
+            lines.append(f"# HELP purgetools_scan_{name} {help_}")
+            lines.append(f"# TYPE purgetools_scan_{name} gauge")
+            lines.append(f"purgetools_scan_{name}{{{ident}}} {value}")
+        for name, help_, key in [
+            ("directory_items", "Items walked by a running scan", "items"),
+            ("directory_items_per_second", "Rate of a running scan", "rate"),
+        ]:
+            lines.append(f"# HELP purgetools_scan_{name} {help_}")
+            lines.append(f"# TYPE purgetools_scan_{name} gauge")
+            for directory, d in sorted(snapshot["directories"].items()):
+                lines.append(
+                    f'purgetools_scan_{name}{{{ident},directory="{_label(directory)}"}} '
+                    f"{d[key]}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def update(self, pending, running, done, force=False):
+        """Write the textfile and status if interval has passed (or force)."""
+        if not (self.textfile or self.status):
+            return
+        now = self.clock()
+        if not force and self._last is not None and now - self._last < self.interval:
+            return
+        self._last = now
+
+        snapshot = self.snapshot(pending, running, done)
+        if self.status:
+            write_json(self.status, snapshot)
+        if self.textfile:
+            # node_exporter reads *.prom, write beside it and rename over
+            path = pathlib.Path(self.textfile)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}")
+            tmp.write_text(self.prometheus(snapshot))
+            os.replace(tmp, path)
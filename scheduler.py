@@ -0,0 +1,256 @@
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pyscan import Cancelled
+from scanlog import last_walked
+
+
+def size_ranks(items, per_rank=1000000, most=64):
+    """
+    MPI ranks for a scan of about items entries, per_rank entries a rank.
+
+    Small directories get 1 rank rather than paying MPI startup for more,
+    big ones up to most.
+    """
+    return min(max(math.ceil((items or 0) / per_rank), 1), most)
+
+
+class ScanScheduler:
+    """
+    Run scans on a pool of threads and re-split stragglers.
+
+    Once nothing is left to start and slots are idle, a scan running
+    straggler times longer than the median finished scan is checked.  If
+    its log shows at least minremaining seconds of work left at its rate so
+    far it is cancelled and its directory is resubmitted as smaller units
+    that the idle slots pick up.
+
+    A scan that raises is retried up to retries more times, waiting backoff
+    seconds doubling each attempt, then left in failed while the rest carry
+    on.  state (scanstate.ScanState) is kept up to date for --resume.
+
+    Given cores and ranks, each scan is run with np=ranks(unit) and scans
+    start while their ranks fit in the cores left over by those running.
+    The first queued scan that fits goes next, so cores freed by a big scan
+    finishing are handed to smaller ones rather than left idle.
+    """
+
+    def __init__(
+        self,
+        scan,  # scan(unit, cancel=threading.Event) runs one ScanUnit
+        threads=4,  # scans at once
+        resplit=None,  # resplit(unit) list of smaller units, None to never re-split
+        logname=None,  # logname(unit) path of unit's progress log
+        estimate=None,  # estimate(unit, walked) items expected or None if unknown yet
+        straggler=3.0,  # times the median runtime before a scan is a straggler
+        minremaining=600,  # seconds left before re-splitting is worth it
+        interval=60,  # seconds between straggler checks
+        status=None,  # scanstatus.ScanStatus to keep up to date
+        retries=2,  # times to retry a failed scan
+        backoff=60,  # seconds before the first retry, doubled each time
+        state=None,  # scanstate.ScanState to keep up to date
+        discard=None,  # discard(unit) removes outputs of a re-split unit
+        cores=None,  # total ranks of running scans at most, None for np each
+        ranks=None,  # ranks(unit) np to scan unit with, needs cores
+        clock=time.monotonic,
+    ):
+        self.scan = scan
+        self.threads = threads
+        self.resplit = resplit
+        self.logname = logname
+        self.estimate = estimate
+        self.straggler = straggler
+        self.minremaining = minremaining
+        self.interval = interval
+        self.status = status
+        self.retries = retries
+        self.backoff = backoff
+        self.state = state
+        self.discard = discard
+        self.cores = cores
+        self.ranks = ranks
+        self.clock = clock
+        self.runtimes = []  # seconds of finished scans
+        self._estimates = {}  # unit to estimate() once it gives one
+        self.scanned = []  # units that finished, for buildlist.fold_units()
+        self.failed = []  # units that failed every attempt
+        self._attempts = {}  # unit to failed attempts so far
+        self._ranks = {}  # unit to ranks(), only asked once
+
+    def _remaining(self, unit, elapsed):
+        """Seconds of work unit has left going by its log or None if unknown."""
+        walked = last_walked(self.logname(unit)) if self.logname else None
+        if not walked or not walked[0]:
+            return None
+        if unit not in self._estimates and self.estimate:
+            estimate = self.estimate(unit, walked[0])
+            if estimate is not None:
+                self._estimates[unit] = estimate
+        estimate = self._estimates.get(unit)
+        if not estimate:
+            return None
+        return max(estimate - walked[0], 0) / (walked[0] / elapsed)
+
+    def _stragglers(self, running):
+        """Running scans worth cancelling and re-splitting."""
+        if not self.resplit or not self.runtimes:
+            return []
+        median = statistics.median(self.runtimes)
+        now = self.clock()
+        found = []
+        for unit, start, cancel in running.values():
+            elapsed = now - start
+            if cancel.is_set() or unit.files_only:
+                continue
+            if elapsed < median * self.straggler:
+                continue
+            remaining = self._remaining(unit, elapsed)
+            if remaining is None or remaining < self.minremaining:
+                continue
+            logging.info(
+                f"{unit.name} running {elapsed:.0f}s median {median:.0f}s "
+                f"about {remaining:.0f}s left, re-splitting"
+            )
+            found.append((unit, cancel))
+        return found
+
+    def _update_status(self, todo, running, force=False):
+        if self.status:
+            now = self.clock()
+            self.status.update(
+                todo,
+                {unit: now - start for unit, start, cancel in running.values()},
+                self.scanned,
+                force=force,
+            )
+
+    def _failed(self, unit, start, error, waiting):
+        """Queue unit in waiting to retry after a backoff or give up on it."""
+        runtime = self.clock() - start
+        attempts = self._attempts[unit] = self._attempts.get(unit, 0) + 1
+        if attempts <= self.retries:
+            delay = self.backoff * 2 ** (attempts - 1)
+            logging.error(f"{unit.name} failed: {error}, retrying in {delay}s")
+            waiting.append((self.clock() + delay, unit))
+            if self.state:
+                self.state.retry(unit, str(error))
+        else:
+            logging.error(f"{unit.name} failed {attempts} times: {error}")
+            self.failed.append(unit)
+            if self.state:
+                self.state.failed(unit, runtime, str(error))
+
+    def _done(self, unit, start):
+        runtime = self.clock() - start
+        self.runtimes.append(runtime)
+        self.scanned.append(unit)
+        if self.state:
+            walked = last_walked(self.logname(unit)) if self.logname else None
+            self.state.done(unit, runtime, walked[0] if walked else None)
+
+    def _next(self, todo, used):
+        """
+        Take the next unit to start from todo and its np.
+
+        returns (unit, np) or None if no queued scan fits the free cores,
+        np is None without a core budget
+        """
+        if not self.cores:
+            return todo.popleft(), None
+        free = self.cores - used
+        for i, unit in enumerate(todo):
+            if unit not in self._ranks:
+                self._ranks[unit] = min(self.ranks(unit), self.cores)
+            if self._ranks[unit] <= free:
+                del todo[i]
+                return unit, self._ranks[unit]
+        return None
+
+    def _busy(self, running, allocated):
+        if len(running) >= self.threads:
+            return True
+        return bool(self.cores) and sum(allocated.values()) >= self.cores
+
+    def run(self, units):
+        """
+        Scan every unit, returns units scanned including any re-split ones.
+
+        Units that failed every attempt are left in failed.
+        """
+        todo = deque(units)
+        running = {}  # future to (unit, start, cancel event)
+        allocated = {}  # future to np given with a core budget
+        waiting = []  # (clock time, unit) to retry
+        if self.state:
+            self.state.add(todo)
+        with ThreadPoolExecutor(self.threads) as executor:
+            while todo or running or waiting:
+                now = self.clock()
+                todo.extend(unit for ready, unit in waiting if ready <= now)
+                waiting = [(ready, unit) for ready, unit in waiting if ready > now]
+
+                while todo and len(running) < self.threads:
+                    picked = self._next(todo, sum(allocated.values()))
+                    if picked is None:
+                        break
+                    unit, np = picked
+                    cancel = threading.Event()
+                    if self.state:
+                        self.state.start(unit)
+                    if np is None:
+                        future = executor.submit(self.scan, unit, cancel=cancel)
+                    else:
+                        logging.info(f"Starting {unit.name} with {np} ranks")
+                        future = executor.submit(self.scan, unit, cancel=cancel, np=np)
+                        allocated[future] = np
+                    running[future] = (unit, self.clock(), cancel)
+
+                timeout = self.interval
+                if self.status:
+                    timeout = min(timeout, self.status.interval)
+                if waiting:
+                    timeout = max(min(timeout, min(r for r, u in waiting) - now), 0)
+                if not running:
+                    time.sleep(timeout)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit, start, cancel = running.pop(future)
+                    allocated.pop(future, None)
+                    try:
+                        future.result()
+                    except Cancelled:
+                        logging.info(f"Cancelled {unit.name}")
+                        continue
+                    except Exception as e:
+                        self._failed(unit, start, e, waiting)
+                        continue
+                    if cancel.is_set():
+                        # finished as it was re-split, its parts replace it
+                        logging.info(f"Cancelled {unit.name} after it finished")
+                        if self.discard:
+                            self.discard(unit)
+                        continue
+                    self._done(unit, start)
+                self._update_status(todo, running)
+
+                if todo or self._busy(running, allocated):
+                    continue
+                for unit, cancel in self._stragglers(running):
+                    parts = self.resplit(unit)
+                    if len(parts) < 2:
+                        continue
+                    cancel.set()
+                    todo.extend(parts)
+                    if self.state:
+                        self.state.discard(unit)
+                        self.state.add(parts)
+
+        self._update_status(todo, running, force=True)
+        return self.scanned
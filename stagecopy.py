@@ -0,0 +1,180 @@
+import errno
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StageCopyError(Exception):
+    """source changed or copy didn't verify, source is left in place"""
+
+    pass
+
+
+def _remove(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# errors meaning the zero copy call isn't supported for these files
+_FALLBACK_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+
+
+def _copy_data(fin, fout, size):
+    """Copy size bytes between open fds, in kernel where possible."""
+    copied = 0
+    # copy_file_range (python 3.8+ linux) then sendfile, both avoid user space
+    for method in ("copy_file_range", "sendfile"):
+        if not hasattr(os, method):
+            continue
+        try:
+            while copied < size:
+                if method == "copy_file_range":
+                    n = os.copy_file_range(fin, fout, size - copied)
+                else:
+                    n = os.sendfile(fout, fin, copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if copied or e.errno not in _FALLBACK_ERRNOS:
+                raise
+            logging.debug(f"{method} not supported here, falling back: {e}")
+
+    # plain read/write
+    with open(fin, "rb", closefd=False) as src, open(fout, "wb", closefd=False) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return os.fstat(fout).st_size
+
+
+def copy_stage(src, dst, st):
+    """
+    Copy src to dst on another filesystem then remove src.
+
+    src  pathlib file to stage
+    dst  pathlib target, parent must exist
+    st   os.stat_result of src taken before deciding to stage
+
+    Mode, ownership and timestamps are kept.  Data is written to a
+    temporary name and only renamed into place and src unlinked once the
+    size matches and src hasn't changed during the copy.
+
+    returns number of bytes copied
+    """
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    tmp = dst.with_name(f".{dst.name}.stage")
+
+    fin = os.open(src, os.O_RDONLY)
+    try:
+        fout = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            copied = _copy_data(fin, fout, st.st_size)
+            try:
+                os.fchown(fout, st.st_uid, st.st_gid)
+            except PermissionError:
+                logging.debug(f"Can't keep ownership of {src} not running as root")
+            os.fchmod(fout, st.st_mode & 0o7777)
+            written = os.fstat(fout).st_size
+        finally:
+            os.close(fout)
+        after = os.fstat(fin)
+    except BaseException:
+        _remove(tmp)
+        raise
+    finally:
+        os.close(fin)
+
+    if written != st.st_size or (after.st_size, after.st_mtime_ns) != (
+        st.st_size,
+        st.st_mtime_ns,
+    ):
+        _remove(tmp)
+        raise StageCopyError(f"{src} changed or short copy {written}/{st.st_size}")
+
+    os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.replace(tmp, dst)
+    src.unlink()
+    return copied
+
+
+class CrossDeviceStager:
+    """
+    Stage files to a stagepath on a different filesystem with parallel copies.
+
+    Files at or over largesize go to their own pool of largethreads so a
+    few huge files can't hold up all the small ones.
+    """
+
+    def __init__(
+        self,
+        stagepath,  # root of staging area
+        threads=4,  # copy threads for files under largesize
+        largethreads=2,  # copy threads for files largesize and over
+        largesize=1024 ** 3,  # bytes
+    ):
+        self._stagepath = stagepath
+        self._threads = threads
+        self._largethreads = largethreads
+        self._largesize = largesize
+        self._stage_dev = None
+        self._pools = None
+        self._lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self._start = None
+
+    def crossdev(self, st):
+        """True if file with os.stat_result st is on another device than stagepath."""
+        if self._stage_dev is None:
+            self._stage_dev = os.stat(self._stagepath).st_dev
+        return st.st_dev != self._stage_dev
+
+    def _copy(self, src, dst, st):
+        try:
+            copied = copy_stage(src, dst, st)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+        with self._lock:
+            self.files += 1
+            self.bytes += copied
+        return copied
+
+    def stage(self, src, dst, st):
+        """Queue copy of src to dst, returns Future of bytes copied."""
+        with self._lock:
+            if self._pools is None:
+                self._start = time.time()
+                self._pools = (
+                    ThreadPoolExecutor(self._threads),
+                    ThreadPoolExecutor(self._largethreads),
+                )
+        pool = self._pools[1] if st.st_size >= self._largesize else self._pools[0]
+        logging.debug(f"Queue copy {src} to {dst} {st.st_size} bytes")
+        return pool.submit(self._copy, src, dst, st)
+
+    def close(self):
+        """Wait for queued copies and stop the threads."""
+        if self._pools is not None:
+            for pool in self._pools:
+                pool.shutdown(wait=True)
+            self._pools = None
+
+    def report(self):
+        """Single line throughput report."""
+        elapsed = time.time() - self._start if self._start else 0
+        rate = self.bytes / elapsed / 1024 ** 2 if elapsed else 0
+        return (
+            f"Copied {self.files} files {self.bytes} bytes across filesystems "
+            f"in {elapsed:.1f}s ({rate:.1f} MB/s) errors={self.errors}"
+        )
@@ -0,0 +1,230 @@
+#!/usr/bin/python3 -u
+
+## -u is needed to avoid buffering stdout
+
+import argparse
+import configparser
+import logging
+import os
+import pathlib
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from idcache import identities
+from manifest import manifest_path
+from prune import prune_dirs
+from purgehelper import age_cutoff
+from purgestats import write_json
+from pwalk import walk
+
+# load config file settings
+config = configparser.ConfigParser()
+config.read(pathlib.Path(__file__).resolve().parent.joinpath("etc/purgetools.ini"))
+
+
+def parse_args(args):
+    # grab cli options
+    parser = argparse.ArgumentParser(
+        description="Delete staged files once they have been in staging --days"
+    )
+    parser.add_argument(
+        "--days",
+        help="Grace period, days since a file arrived in staging",
+        type=int,
+        required=True,
+    )
+    parser.add_argument(
+        "--stagepath",
+        help="Root of the staging area (Default stagepath in purgetools.ini)",
+        type=str,
+        default=config["purgehelper"]["stagepath"],
+    )
+    parser.add_argument(
+        "--threads",
+        help="Number of threads walking and deleting (Default 16)",
+        type=int,
+        default=16,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--dryrun", help="Report what would be deleted but dont", action="store_true"
+    )
+    parser.add_argument(
+        "--report",
+        help="Write per user files and bytes freed as JSON to FILE",
+        type=str,
+        metavar="FILE",
+    )
+
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-v",
+        "--verbose",
+        help="Increase messages, including files as deleted",
+        action="store_true",
+    )
+    verbosity.add_argument(
+        "-q", "--quiet", help="Decrease messages", action="store_true"
+    )
+
+    args = parser.parse_args(args)
+    return args
+
+
+def _remove(dirpath, expired, dryrun=False):
+    """
+    Unlink expired entries of dirpath.
+
+    expired  list of (name, os.stat_result)
+
+    returns list of (uid, size) removed and count of errors
+    """
+    removed = []
+    errors = 0
+    for name, st in expired:
+        path = os.path.join(dirpath, name)
+        logging.debug(f"Expire {path}")
+        if not dryrun:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.error(f"{path} {e}")
+                errors += 1
+                continue
+        removed.append((st.st_uid, st.st_size))
+
+    return removed, errors
+
+
+class StageExpire:
+    """
+    Delete files that have been in the stage area longer than the grace period.
+
+    Arrival in staging is taken from st_ctime, a rename into staging or the
+    copy made across filesystems both set it, so atime/mtime kept from the
+    original file don't matter.
+    """
+
+    def __init__(
+        self,
+        stagepath,  # root of staging area, it and its direct children are kept
+        days,  # grace period in days since arrival
+        threads=16,  # threads walking and threads deleting
+        dryrun=False,
+        exclude=(),  # directories to leave alone eg. the restore manifests
+    ):
+        # walked paths are compared to exclude as strings, resolve both so a
+        # relative or symlinked --stagepath still skips the manifests
+        self.stagepath = os.path.realpath(stagepath)
+        self.exclude = {os.path.realpath(x) for x in exclude}
+        self.cutoff = age_cutoff(days)
+        self.threads = threads
+        self.dryrun = dryrun
+        self.files = Counter()  # username to files freed
+        self.bytes = Counter()  # username to bytes freed
+        self.kept = 0  # files still in their grace period
+        self.errors = 0
+        self._acted = {}  # directories files were removed from for prune_dirs()
+
+    def _count(self, result):
+        removed, errors = result
+        self.errors += errors
+        for uid, size in removed:
+            try:
+                user = identities.getpwuid(uid).pw_name
+            except KeyError:
+                user = str(uid)
+            self.files[user] += 1
+            self.bytes[user] += size
+
+    def run(self):
+        """Walk and delete expired files then prune emptied directories."""
+        pending = deque()
+        with ThreadPoolExecutor(self.threads) as executor:
+            for dirpath, st, dirnames, files in walk(
+                [self.stagepath], self.threads, exclude=self.exclude
+            ):
+                expired = []
+                for name, fst in files:
+                    if fst.st_ctime < self.cutoff:
+                        expired.append((name, fst))
+                    else:
+                        self.kept += 1
+                if not expired:
+                    continue
+
+                self._acted[dirpath] = (st.st_mtime, st.st_ctime)
+                pending.append(
+                    executor.submit(_remove, dirpath, expired, dryrun=self.dryrun)
+                )
+                while len(pending) > self.threads * 4:
+                    self._count(pending.popleft().result())
+
+            while pending:
+                self._count(pending.popleft().result())
+
+        prune_dirs(
+            self._acted,
+            self.stagepath,
+            self.cutoff,
+            threads=self.threads,
+            dryrun=self.dryrun,
+        )
+
+    def report(self):
+        """Per user table of files and bytes freed, most bytes first."""
+        dryrun = " (dryrun)" if self.dryrun else ""
+        lines = [
+            f"Expired {sum(self.files.values())} files "
+            f"{sum(self.bytes.values())} bytes{dryrun}, "
+            f"kept {self.kept} in grace period, errors={self.errors}"
+        ]
+        for user, nbytes in self.bytes.most_common():
+            lines.append(f"{user:>16} {self.files[user]:>10} files {nbytes:>16} bytes")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {
+            "users": {
+                user: {"files": self.files[user], "bytes": self.bytes[user]}
+                for user in self.files
+            },
+            "kept": self.kept,
+            "errors": self.errors,
+            "dryrun": self.dryrun,
+        }
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+
+    if args.quiet:
+        level = logging.WARNING
+    elif args.verbose:
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level=level)
+    identities.configure(config["idcache"])
+
+    start = time.time()
+    expire = StageExpire(
+        args.stagepath,
+        args.days,
+        threads=args.threads,
+        dryrun=args.dryrun,
+        exclude=[manifest_path(config["purgehelper"])],
+    )
+    expire.run()
+    print(expire.report())
+    logging.info(f"Finished in {time.time() - start:.0f}s")
+
+    if args.report:
+        write_json(args.report, expire.as_dict())
+    identities.save()
+    sys.exit(1 if expire.errors else 0)
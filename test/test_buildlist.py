@@ -1,9 +1,12 @@
 import argparse
+import json
 import logging
 import os
 import pathlib
 import subprocess
 import sys
+import threading
+import time
 from contextlib import ExitStack as does_not_raise
 from unittest.mock import MagicMock
 
@@ -12,7 +15,20 @@ import pytest
 # needed to import functions in odd paths
 sys.path.append(os.path.abspath("./"))
 
-from buildlist import build_scanlist, parse_args, scan_path
+from buildlist import (
+    ScanUnit,
+    build_scanlist,
+    fold_units,
+    parse_args,
+    probe,
+    scan_path,
+    scan_path_python,
+    scan_unit,
+    split_scanlist,
+    split_unit,
+)
+from executors import FakeExecutor
+from pyscan import Cancelled
 
 #  not checking scanident isn't required but default value
 # @pytest.mark.parametrize(
@@ -77,11 +93,14 @@ def test_build_scanlist(tmp_path, kwargs, count, exception):
 
 @pytest.mark.parametrize(
     "kwargs,calls",
-    [({}, (2, 3)), ({"dryrun": True}, (0, 1)),],  # basic test  # dryrun never call
+    [({}, (1, 2)), ({"dryrun": True}, (0, 1)),],  # basic test  # dryrun never call
 )
 def test_scan_path(monkeypatch, tmp_path, kwargs, calls):
-    # setup
+    # setup, the log is written to the current directory
+    monkeypatch.chdir(tmp_path)
     mock_subprocess = MagicMock()
+    mock_subprocess.return_value.communicate.return_value = (b"", b"")
+    mock_subprocess.return_value.returncode = 0
 
     mock_Path = MagicMock()
 
@@ -94,12 +113,15 @@ def test_scan_path(monkeypatch, tmp_path, kwargs, calls):
     mock_is_file = MagicMock()
     mock_is_file.is_file.return_value = True
 
-    mock_Path.side_effect = [mock_resolve, mock_is_file, mock_resolve]
+    mock_Path.side_effect = [mock_resolve, mock_is_file]
+    mock_sort = MagicMock()
 
     # run
     with monkeypatch.context() as m:
         m.setattr(pathlib, "Path", mock_Path)
-        m.setattr(subprocess, "run", mock_subprocess)
+        m.setattr(subprocess, "Popen", mock_subprocess)
+        m.setattr("buildlist.sort_text", mock_sort)
+        m.setattr("buildlist.scan_distribution", MagicMock(return_value=None))
         scan_path(path=tmp_path, **kwargs)
 
     # compare expected outcome
@@ -107,3 +129,181 @@ def test_scan_path(monkeypatch, tmp_path, kwargs, calls):
     logging.info(mock_Path.called_with)
     assert mock_subprocess.call_count == calls[0]
     assert mock_Path.call_count == calls[1]
+    # single dwalk writes the text, sorted in python
+    assert mock_sort.call_count == calls[0]
+
+
+@pytest.mark.parametrize("dryrun", [False, True])
+def test_scan_path_python(monkeypatch, tmp_path, dryrun):
+    """No MPI needed, same .txt and .log names as dwalk."""
+    scan = tmp_path / "proj"
+    scan.mkdir()
+    f = scan / "old"
+    f.write_text("data")
+    os.utime(f, (0, 0))
+    monkeypatch.chdir(tmp_path)
+
+    # ctime is now so move the cutoff forward to match it
+    monkeypatch.setattr("buildlist.age_cutoff", lambda days: time.time() + 3600)
+    scan_path_python(scan, scanident="1-1-999", np=2, dryrun=dryrun)
+
+    txt = tmp_path / "1-1-999-proj.txt"
+    assert txt.exists() != dryrun
+    if not dryrun:
+        assert txt.read_text().split(None, 9)[9] == f"{f}\n"
+        assert "Walked" in (tmp_path / "1-1-999-proj.log").read_text()
+
+
+@pytest.fixture
+def bigtree(tmp_path):
+    """small/ with 2 entries and big/ with 3 subdirectories of 10 and a file"""
+    root = tmp_path / "scratch"
+    (root / "small" / "x").mkdir(parents=True)
+    (root / "small" / "f").write_text("f")
+    for sub in "abc":
+        d = root / "big" / sub
+        d.mkdir(parents=True)
+        for i in range(10):
+            (d / f"f{i}").write_text("f")
+    (root / "big" / "loose").write_text("f")
+    return root
+
+
+def test_probe(bigtree):
+    assert probe(bigtree / "big", 1000) == 34
+    assert probe(bigtree / "big", 5) < 34
+
+
+@pytest.mark.parametrize("history", [False, True])
+def test_split_scanlist(tmp_path, bigtree, history):
+    """Only big is split, into its subdirectories plus its own files."""
+    if history:
+        (tmp_path / "old-small.log").write_text("Walked 2 items in 1 secs\n")
+        (tmp_path / "old-parts").mkdir()
+        for name in ["big+", "big+a", "big+b", "big+c"]:
+            log = tmp_path / "old-parts" / f"{name}.log"
+            log.write_text("Walked 11 items in 1 secs\n")
+
+    paths = [bigtree / "small", bigtree / "big"]
+    units = split_scanlist(
+        paths, 20, history="old" if history else None, directory=tmp_path
+    )
+    assert sorted(units) == sorted(
+        [
+            ScanUnit(bigtree / "small", "small", "small", False),
+            ScanUnit(bigtree / "big", "parts/big+", "big", True),
+            ScanUnit(bigtree / "big" / "a", "parts/big+a", "big", False),
+            ScanUnit(bigtree / "big" / "b", "parts/big+b", "big", False),
+            ScanUnit(bigtree / "big" / "c", "parts/big+c", "big", False),
+        ]
+    )
+    # maxdepth stops splitting
+    assert len(split_scanlist(paths, 20, maxdepth=0)) == 2
+
+
+def test_split_unit_names(tmp_path):
+    """Parts of a directory a+b can't be mistaken for parts of a."""
+    (tmp_path / "a+b" / "c+d" / "e").mkdir(parents=True)
+    unit = ScanUnit(tmp_path / "a+b", "a+b", "a+b", False)
+    files, sub = sorted(split_unit(unit), key=lambda u: u.name)
+    assert (files.name, sub.name) == ("parts/a%2Bb+", "parts/a%2Bb+c%2Bd")
+    assert [u.name for u in split_unit(sub)] == [
+        "parts/a%2Bb+c%2Bd+",
+        "parts/a%2Bb+c%2Bd+e",
+    ]
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs root to chown")
+def test_scan_unit_fold(monkeypatch, tmp_path, bigtree):
+    """Split units fold back into one list per top level directory sorted by user."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("buildlist.age_cutoff", lambda days: time.time() + 3600)
+    os.chown(bigtree / "big" / "loose", 1, -1)
+
+    big = bigtree / "big"
+    units = [ScanUnit(big, "parts/big+", "big", True)]
+    units += [ScanUnit(big / x, f"parts/big+{x}", "big", False) for x in "abc"]
+    for unit in units:
+        scan_unit(unit, scan=scan_path_python, scanident="s", np=1)
+    assert (tmp_path / "s-parts" / "big+.txt").read_text().count("\n") == 1
+
+    fold_units(units, "s")
+    lines = (tmp_path / "s-big.txt").read_text().splitlines()
+    assert len(lines) == 31
+    users = [line.split()[1] for line in lines]
+    assert users == sorted(users)
+    assert sorted(p.name for p in tmp_path.glob("*.txt")) == ["s-big.txt"]
+    assert not list(tmp_path.glob("s-parts/*.txt"))
+    assert len(list(tmp_path.glob("s-parts/big+*.log"))) == 4
+
+
+def test_scan_path_python_distribution(monkeypatch, tmp_path):
+    """Exact sizes and atime ages kept for the report."""
+    scan = tmp_path / "proj"
+    scan.mkdir()
+    (scan / "old").write_text("x" * 2048)
+    os.utime(scan / "old", (0, 0))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("buildlist.age_cutoff", lambda days: time.time() + 3600)
+    scan_path_python(scan, scanident="s", np=1)
+
+    data = json.loads((tmp_path / "s-proj.dist.json").read_text())
+    assert data["size_bytes"][1] == 2048
+    assert data["age_files"][-1] == 1
+
+
+def test_fold_units_resume(monkeypatch, tmp_path):
+    """A list folded before a --resume is kept, not overwritten."""
+    monkeypatch.chdir(tmp_path)
+    line = "-rw-r--r-- {} g  1.000  B Aug 14 2019 17:04 /big/{}\n"
+    (tmp_path / "s-big.txt").write_text(
+        line.format("amy", "a/1") + line.format("zoe", "a/2")
+    )
+    (tmp_path / "s-parts").mkdir()
+    (tmp_path / "s-parts" / "big+b.txt").write_text(line.format("bob", "b/1"))
+    units = [ScanUnit(pathlib.Path("/big/a"), "parts/big+a", "big", False)]
+    units.append(ScanUnit(pathlib.Path("/big/b"), "parts/big+b", "big", False))
+
+    fold_units(units, "s", resume=True)
+    users = [x.split()[1] for x in (tmp_path / "s-big.txt").read_text().splitlines()]
+    assert users == ["amy", "bob", "zoe"]
+    assert sorted(p.name for p in tmp_path.glob("**/*.txt")) == ["s-big.txt"]
+
+
+def test_scan_unit_failed(monkeypatch, tmp_path):
+    """A failed scan leaves its log but no partial list."""
+    monkeypatch.chdir(tmp_path)
+
+    def broken(path, name=None, scanident=None, **kwargs):
+        for suffix in ("log", "cache", "txt"):
+            (tmp_path / f"{scanident}-{name}.{suffix}").write_text("partial")
+        raise subprocess.CalledProcessError(1, ["dwalk"])
+
+    with pytest.raises(subprocess.CalledProcessError):
+        scan_unit(ScanUnit(tmp_path, "a", "a", False), scan=broken, scanident="s")
+    assert [p.name for p in tmp_path.iterdir()] == ["s-a.log"]
+
+
+def test_scan_path_cancelled_late(monkeypatch, tmp_path):
+    """Cancelled as dwalk finishes, nothing is sorted or kept."""
+    monkeypatch.chdir(tmp_path)
+    cancel = threading.Event()
+
+    def dwalk(args, np, log):
+        (tmp_path / "s-parts" / "a+b.txt").write_text("unsorted\n")
+        (tmp_path / "s-parts" / "a+b.cache").write_text("cache")
+        cancel.set()
+
+    sort = MagicMock()
+    monkeypatch.setattr("buildlist.sort_text", sort)
+    unit = ScanUnit(tmp_path, "parts/a+b", "a", False)
+    with pytest.raises(Cancelled):
+        scan_unit(
+            unit,
+            scan=scan_path,
+            scanident="s",
+            executor=FakeExecutor(dwalk),
+            cancel=cancel,
+        )
+    assert not sort.called
+    assert [p.name for p in (tmp_path / "s-parts").iterdir()] == ["a+b.log.cancelled"]
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+np = pytest.importorskip("numpy")
+
+from cachefile import FIELDS, HEADER, CacheFile, CacheFormatError
+
+
+def write_cache(path, files, users, groups, chars=64, version=4):
+    """Write a version 4 cache as dwalk --output does."""
+    header = np.zeros(1, HEADER)
+    header[0] = (version, 100, 200, len(users), 16, len(groups), 16, len(files), chars)
+    table = np.dtype([("name", "S16"), ("id", ">u8")])
+    record = np.dtype([("path", f"S{chars}")] + [(f, ">u8") for f in FIELDS])
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(np.array([(n, i) for i, n in users.items()], table).tobytes())
+        f.write(np.array([(n, i) for i, n in groups.items()], table).tobytes())
+        f.write(np.array(files, record).tobytes())
+
+
+@pytest.fixture
+def cache(tmp_path):
+    path = tmp_path / "s-proj.cache"
+    files = [
+        # path, mode, uid, gid, atime, ns, mtime, ns, ctime, ns, size
+        (b"/scratch/a", 0o100644, 1000, 10, 50, 1, 60, 2, 70, 3, 18),
+        (b"/scratch/b\xff", 0o100600, 1001, 10, 500, 0, 600, 0, 700, 0, 238378),
+        (b"/scratch/c", 0o100600, 1000, 11, 5000, 0, 6000, 0, 7000, 0, 1),
+    ]
+    write_cache(path, files, {1000: b"msbritt", 1001: b"brockp"}, {10: b"support"})
+    return path
+
+
+def test_CacheFile(cache):
+    with CacheFile(cache) as c:
+        assert len(c) == 3
+        assert (c.walk_start, c.walk_end) == (100, 200)
+        assert c.users == {1000: "msbritt", 1001: "brockp"}
+        assert c.groups == {10: "support"}
+
+        assert c.files["size"][c.files["uid"] == 1000].sum() == 19
+        old = np.nonzero(c.files["atime"] < 1000)[0]
+        assert c.paths(old) == ["/scratch/a", "/scratch/b\udcff"]
+        assert c.files["mtime_nsec"][0] == 2
+
+
+def test_CacheFile_lines(cache):
+    """Same text format as dwalk, unknown groups by number."""
+    lines = list(CacheFile(cache).lines())
+    assert lines[0].startswith("-rw-r--r-- msbritt support  18.000  B ")
+    assert lines[1].startswith("-rw------- brockp support 232.791 KB ")
+    assert lines[2].startswith("-rw------- msbritt 11 ")
+    assert [l.rstrip("\n").split(None, 9)[9] for l in lines][1] == "/scratch/b\udcff"
+
+
+@pytest.mark.parametrize("damage", ["version", "truncated", "short"])
+def test_CacheFile_damaged(tmp_path, cache, damage):
+    path = tmp_path / "bad.cache"
+    data = cache.read_bytes()
+    if damage == "version":
+        write_cache(path, [], {}, {}, version=3)
+    elif damage == "truncated":
+        path.write_bytes(data[:-10])
+    else:
+        path.write_bytes(data[:10])
+    with pytest.raises(CacheFormatError):
+        CacheFile(path)
@@ -0,0 +1,102 @@
+import csv
+import json
+import os
+import sys
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from buildlist import ScanUnit
+from distribution import (
+    Distribution,
+    distribution_report,
+    parse_sizes,
+    save_distribution,
+    scan_distribution,
+)
+
+DAY = 86400
+
+
+def test_parse_sizes():
+    assert parse_sizes("size:0,1K,1M,100M,1G,1T") == [
+        0,
+        1024,
+        1024 ** 2,
+        100 * 1024 ** 2,
+        1024 ** 3,
+        1024 ** 4,
+    ]
+
+
+def test_Distribution_add():
+    dist = Distribution(now=1000 * DAY)
+    dist.add(10, 1000 * DAY - 45 * DAY)
+    dist.add(2048, 1000 * DAY - 400 * DAY)
+    dist.add(2 * 1024 ** 4, 0)
+    assert dist.size_files == [1, 1, 0, 0, 0, 1]
+    assert dist.size_bytes == [10, 2048, 0, 0, 0, 2 * 1024 ** 4]
+    assert dist.age_files == [0, 1, 0, 0, 0, 1, 1, 0]
+    assert dist.age_bytes[1] == 10
+
+
+def test_Distribution_add_arrays():
+    """Same as add() one at a time."""
+    np = pytest.importorskip("numpy")
+    sizes = np.array([0, 10, 5000, 2 * 1024 ** 3], dtype=">u8")
+    atimes = np.array([0, 100 * DAY, 990 * DAY, 999 * DAY], dtype=">u8")
+    one, many = Distribution(now=1000 * DAY), Distribution(now=1000 * DAY)
+    for size, atime in zip(sizes, atimes):
+        one.add(int(size), int(atime))
+    many.add_arrays(sizes, atimes)
+    assert one.as_dict() == many.as_dict()
+
+
+def test_from_log(tmp_path):
+    """Counts from dwalk's --distribution table."""
+    log = tmp_path / "s-proj.log"
+    log.write_text(
+        "[2020-01-09T10:10:10] Walked 100 items in 1.0 secs\n"
+        "Range                       Number\n"
+        "[   0.000   B -    0.000   B )          0\n"
+        "[   0.000   B -    1.000  KB )         12\n"
+        "[   1.000  KB -    1.000  MB )          3\n"
+        "[   1.000  TB -      MAX     ]          1\n"
+    )
+    dist = scan_distribution(str(tmp_path / "s"), "proj")
+    assert dist.size_files == [12, 3, 0, 0, 0, 1]
+    assert not dist.exact
+
+
+def test_distribution_report(monkeypatch, tmp_path):
+    """Split parts fold into their top level directory, plus ALL."""
+    monkeypatch.chdir(tmp_path)
+    for name, size in [("a+", 10), ("a+x", 2048), ("b", 10)]:
+        dist = Distribution(now=100 * DAY)
+        dist.add(size, 0)
+        save_distribution(dist, "s", name)
+    units = [
+        ScanUnit("/s/a", "a+", "a", True),
+        ScanUnit("/s/a/x", "a+x", "a", False),
+        ScanUnit("/s/b", "b", "b", False),
+        ScanUnit("/s/c", "c", "c", False),
+    ]
+    tops = distribution_report(units, "s")
+    assert tops["a"].size_files[:2] == [1, 1]
+
+    data = json.loads((tmp_path / "s-distribution.json").read_text())
+    assert sorted(data) == ["ALL", "a", "b"]
+    assert data["ALL"]["size_files"][:2] == [2, 1]
+    assert data["a"]["size_files"][:2] == [1, 1]
+
+    with open(tmp_path / "s-distribution.csv") as f:
+        rows = list(csv.DictReader(f))
+    row = [r for r in rows if r["directory"] == "ALL" and r["kind"] == "size"][1]
+    assert (row["low"], row["high"], row["files"], row["bytes"]) == (
+        "1024",
+        "1048576",
+        "1",
+        "2048",
+    )
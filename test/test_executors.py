@@ -0,0 +1,131 @@
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from buildlist import scan_path
+from executors import (
+    FakeExecutor,
+    LocalExecutor,
+    SlurmExecutor,
+    SSHExecutor,
+    get_executor,
+    parse_hosts,
+    run_command,
+)
+from pyscan import Cancelled
+
+
+def test_run_command(tmp_path):
+    """Cancelling kills the command, failures raise as with check=True."""
+    cancel = threading.Event()
+    cancel.set()
+    start = time.time()
+    with open(tmp_path / "log", "w") as log:
+        with pytest.raises(Cancelled):
+            run_command(["sleep", "30"], log, cancel, poll=0.1)
+        with pytest.raises(subprocess.CalledProcessError):
+            run_command(["false"], log)
+        run_command(["echo", "hi"], log)
+    assert time.time() - start < 10
+    assert (tmp_path / "log").read_text() == "hi\n"
+
+
+def test_commands(monkeypatch):
+    monkeypatch.chdir("/tmp")
+    args = ["dwalk", "--text-output", "s-my dir.txt", "/scratch/my dir"]
+    assert (
+        LocalExecutor("mpirun").command(args, 8)
+        == ["mpirun", "--allow-run-as-root", "--oversubscribe", "-np", "8",] + args
+    )
+    assert (
+        SlurmExecutor(["--mem=2G"]).command(args, 8)
+        == ["srun", "--ntasks", "8", "--exclusive", "--mem=2G",] + args
+    )
+
+    ssh = SSHExecutor([("node1", 1)], "mpirun").command(args, 8, "node1")
+    assert ssh[:5] == ["ssh", "-o", "BatchMode=yes", "-tt", "node1"]
+    # remote shell sees the same argv
+    cd, remote = ssh[5].split(" && ")
+    assert shlex.split(cd) == ["cd", "/tmp"]
+    assert shlex.split(remote) == LocalExecutor("mpirun").command(args, 8)
+
+
+def test_ssh_slots(monkeypatch):
+    """Each host runs no more than its slots at once."""
+    running = []
+    most = {}
+    lock = threading.Lock()
+
+    def fake_run(args, log, cancel=None):
+        host = args[4]
+        with lock:
+            running.append(host)
+            most[host] = max(most.get(host, 0), running.count(host))
+        time.sleep(0.05)
+        with lock:
+            running.remove(host)
+
+    monkeypatch.setattr("executors.run_command", fake_run)
+    executor = SSHExecutor(parse_hosts("a,b:2"), "mpirun")
+    threads = [
+        threading.Thread(target=executor.run, args=(["dwalk"], 1, None))
+        for _ in range(9)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert most == {"a": 1, "b": 2}
+
+
+@pytest.mark.parametrize(
+    "name, section, kind",
+    [
+        ("local", {}, LocalExecutor),
+        ("slurm", {"srunargs": "--mem=2G"}, SlurmExecutor),
+        ("ssh", {"sshhosts": "n1, n2:4,"}, SSHExecutor),
+    ],
+)
+def test_get_executor(name, section, kind):
+    executor = get_executor(name, section, "mpirun")
+    assert type(executor) is kind
+
+
+def test_get_executor_no_hosts():
+    with pytest.raises(ValueError):
+        get_executor("ssh", {"sshhosts": ""}, "mpirun")
+
+
+def test_parse_hosts():
+    assert parse_hosts("n1, n2:4,") == [("n1", 1), ("n2", 4)]
+
+
+def test_scan_path_fake(monkeypatch, tmp_path):
+    """scan_path hands dwalk's arguments to the executor and sorts its text."""
+    monkeypatch.chdir(tmp_path)
+
+    def dwalk(args, np, log):
+        text = args[args.index("--text-output") + 1]
+        with open(text, "w") as f:
+            f.write("-rw-r--r-- zoe g  1.000  B Aug 14 2019 17:04 /p/b\n")
+            f.write("-rw-r--r-- amy g  1.000  B Aug 14 2019 17:04 /p/a\n")
+        log.write("Walked 2 items in 0.1 secs\n")
+
+    executor = FakeExecutor(dwalk)
+    scan_path(tmp_path, scanident="s", np=3, name="p", executor=executor)
+
+    [(args, np)] = executor.calls
+    assert np == 3
+    assert args[0].endswith("install/bin/dwalk")
+    assert args[-1] == str(tmp_path)
+    users = [line.split()[1] for line in open("s-p.txt")]
+    assert users == ["amy", "zoe"]
+    assert "Walked 2 items" in open("s-p.log").read()
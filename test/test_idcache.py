@@ -0,0 +1,155 @@
+import configparser
+import json
+import os
+import pwd
+import sys
+import time
+from collections import namedtuple
+from unittest.mock import MagicMock
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from idcache import IdentityCache
+
+Passwd = namedtuple("Passwd", ["pw_name", "pw_uid", "pw_gecos"])
+
+
+@pytest.fixture
+def fake_pwd(monkeypatch):
+    """replace NSS with three fake users and count the calls"""
+    users = [
+        Passwd("bennet", 1001, "Ben Net"),
+        Passwd("msbritt", 1002, "M Britt"),
+        Passwd("mmiranda", 1003, "M Miranda"),
+    ]
+
+    def getpwuid(uid):
+        for u in users:
+            if u.pw_uid == uid:
+                return u
+        raise KeyError(uid)
+
+    def getpwnam(name):
+        for u in users:
+            if u.pw_name == name:
+                return u
+        raise KeyError(name)
+
+    mocks = {
+        "getpwuid": MagicMock(side_effect=getpwuid),
+        "getpwnam": MagicMock(side_effect=getpwnam),
+        "getpwall": MagicMock(return_value=users),
+    }
+    for name, mock in mocks.items():
+        monkeypatch.setattr(pwd, name, mock)
+    return mocks
+
+
+def test_lookups_cached(fake_pwd):
+    """each uid or name only hits NSS once, misses included"""
+    cache = IdentityCache()
+    for _ in range(3):
+        assert cache.getpwuid(1001).pw_name == "bennet"
+        assert cache.getpwnam("msbritt").pw_gecos == "M Britt"
+        with pytest.raises(KeyError):
+            cache.getpwuid(9999)
+
+    assert fake_pwd["getpwuid"].call_count == 2
+    assert fake_pwd["getpwnam"].call_count == 1
+    # name learned from the uid lookup
+    assert cache.getpwnam("bennet").pw_uid == 1001
+    assert fake_pwd["getpwnam"].call_count == 1
+
+
+def test_preload(fake_pwd):
+    """after preload nothing should go back to NSS"""
+    cache = IdentityCache()
+    assert cache.preload() == 3
+    assert cache.getpwuid(1003).pw_name == "mmiranda"
+    assert cache.getpwnam("bennet").pw_uid == 1001
+    assert fake_pwd["getpwuid"].call_count == 0
+    assert fake_pwd["getpwnam"].call_count == 0
+
+
+def test_uids(fake_pwd):
+    cache = IdentityCache()
+    assert cache.uids(["bennet", "notarealuser", "mmiranda"]) == {1001, 1003}
+
+
+@pytest.mark.parametrize("age,loaded", [(0, True), (7200, False)])
+def test_snapshot(tmp_path, fake_pwd, age, loaded):
+    """snapshot is reused until older than ttl"""
+    path = tmp_path / "idcache.json"
+    cache = IdentityCache(path=path, ttl=3600)
+    cache.preload()
+    assert cache.save()
+    assert not cache.save()  # nothing changed
+
+    snapshot = json.loads(path.read_text())
+    for entry in snapshot["entries"]:
+        entry[3] -= age
+    path.write_text(json.dumps(snapshot))
+
+    fresh = IdentityCache(path=path, ttl=3600)
+    assert fresh.load() == loaded
+    if loaded:
+        assert fresh.getpwuid(1002).pw_name == "msbritt"
+        assert fake_pwd["getpwuid"].call_count == 0
+
+
+def test_snapshot_entry_ttl(tmp_path, fake_pwd):
+    """saving after a new lookup keeps the old entries' age"""
+    path = tmp_path / "idcache.json"
+    old = IdentityCache(path=path, ttl=100)
+    old.add("bennet", 1001, "Ben Net", added=time.time() - 90)
+    old.save()
+
+    cache = IdentityCache(path=path, ttl=100)
+    assert cache.load()
+    cache.getpwuid(1002)  # one new lookup
+    cache.save()
+
+    ages = {e[0]: time.time() - e[3] for e in json.loads(path.read_text())["entries"]}
+    assert ages["bennet"] == pytest.approx(90, abs=5)
+    assert ages["msbritt"] == pytest.approx(0, abs=5)
+
+    # bennet expires on its own, msbritt is kept
+    later = IdentityCache(path=path, ttl=50)
+    assert not later.load()
+    assert later.getpwuid(1002).pw_name == "msbritt"
+    assert fake_pwd["getpwuid"].call_count == 1
+    later.save()
+    assert [e[0] for e in json.loads(path.read_text())["entries"]] == ["msbritt"]
+
+
+def test_configure(tmp_path, fake_pwd):
+    """preload and snapshot from purgetools.ini settings"""
+    config = configparser.ConfigParser()
+    config.read_dict(
+        {"idcache": {"path": str(tmp_path / "id.json"), "ttl": "60", "preload": "1"}}
+    )
+    cache = IdentityCache()
+    cache.configure(config["idcache"])
+    assert fake_pwd["getpwall"].call_count == 1
+    assert (tmp_path / "id.json").is_file()
+
+    # second run uses the snapshot
+    again = IdentityCache()
+    again.configure(config["idcache"])
+    assert fake_pwd["getpwall"].call_count == 1
+    assert again.getpwnam("bennet").pw_uid == 1001
+
+
+def test_configure_no_refresh(tmp_path, fake_pwd):
+    """without refresh a missing or stale snapshot is left for batch runs"""
+    config = configparser.ConfigParser()
+    config.read_dict(
+        {"idcache": {"path": str(tmp_path / "id.json"), "ttl": "60", "preload": "1"}}
+    )
+    cache = IdentityCache()
+    cache.configure(config["idcache"], refresh=False)
+    assert fake_pwd["getpwall"].call_count == 0
+    assert not (tmp_path / "id.json").exists()
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from journal import Journal, load_done, skip_done
+
+
+def test_Journal_buffered(tmp_path):
+    """nothing hits the file until the buffer fills or it's flushed"""
+    path = tmp_path / "list.journal"
+    journal = Journal(path, buffersize=3, interval=3600)
+    journal.record("/scratch/a", "purged")
+    journal.record("/scratch/b", "underage")
+    assert path.read_text() == ""
+    journal.record("/scratch/c", "staged")
+    assert len(path.read_text().splitlines()) == 3
+
+    journal.record("/scratch/d", "error")
+    journal.close()
+    lines = [json.loads(x) for x in path.read_text().splitlines()]
+    assert [x[1:] for x in lines][-1] == ["error", "/scratch/d"]
+
+
+def test_Journal_take():
+    """memory only journal hands records over with take()"""
+    journal = Journal()
+    journal.record("/scratch/a", "purged")
+    records = journal.take()
+    assert [r[1:] for r in records] == [("purged", "/scratch/a")]
+    assert journal.take() == []
+
+
+def test_load_done(tmp_path):
+    """errors are retried, damaged last line from a crash is skipped"""
+    path = tmp_path / "list.journal"
+    with Journal(path) as journal:
+        journal.record("/scratch/a", "purged")
+        journal.record("/scratch/b", "error")
+        journal.record("/scratch/c", "error")
+        journal.record("/scratch/c", "staged")  # done on a later run
+        journal.record("/scratch/new\nline \udcff", "underage")
+    with path.open("a") as f:
+        f.write('[1600000000, "purged", "/scratch/d')
+
+    done = load_done(path)
+    assert done == {"/scratch/a", "/scratch/c", "/scratch/new\nline \udcff"}
+    assert load_done(tmp_path / "missing.journal") == set()
+
+    paths = ["/scratch/a", "/scratch/b", "/scratch/c", "/scratch/d"]
+    assert list(skip_done(paths, done)) == ["/scratch/b", "/scratch/d"]
@@ -0,0 +1,70 @@
+import configparser
+import os
+import sys
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+import manifest
+from idcache import IdentityCache
+from manifest import Manifest, find_entries, manifest_path, read_manifest
+
+
+@pytest.fixture
+def users(monkeypatch):
+    cache = IdentityCache()
+    cache.add("bennet", 1001)
+    cache.add("msbritt", 1002)
+    monkeypatch.setattr(manifest, "identities", cache)
+
+
+def test_Manifest(tmp_path, users):
+    """one manifest per user, written when the buffer fills or on flush"""
+    m = Manifest(tmp_path / "manifests", buffersize=3)
+    m.record(1001, "/scratch/a/1", "/stage/scratch/a/1", 10)
+    m.record(1002, "/scratch/b/2", "/stage/scratch/b/2", 20)
+    assert not (tmp_path / "manifests").exists()
+    m.record(1001, "/scratch/a/3", "/stage/scratch/a/3", 30)
+    m.record(9999, "/scratch/c/4", "/stage/scratch/c/4", 40)
+    m.flush()
+
+    names = sorted(p.name for p in (tmp_path / "manifests").iterdir())
+    assert names == ["9999.manifest", "bennet.manifest", "msbritt.manifest"]
+    entries = list(read_manifest(tmp_path / "manifests" / "bennet.manifest"))
+    assert [e[1:] for e in entries] == [
+        (10, "/scratch/a/1", "/stage/scratch/a/1"),
+        (30, "/scratch/a/3", "/stage/scratch/a/3"),
+    ]
+
+
+def test_find_entries(tmp_path, users):
+    m = Manifest(tmp_path)
+    m.record(1001, "/scratch/a/x.txt", "/stage/scratch/a/x.txt", 1)
+    m.record(1001, "/scratch/a/y.dat", "/stage/scratch/a/y.dat", 2)
+    m.record(1001, "/scratch/ab/z.txt", "/stage/scratch/ab/z.txt", 3)
+    m.record(1002, "/scratch/b/x.txt", "/stage/scratch/b/x.txt", 4)
+    m.record(1001, "/scratch/a/x.txt", "/stage/scratch/a/x.txt", 5)  # staged again
+    m.flush()
+    with (tmp_path / "bennet.manifest").open("a") as f:
+        f.write('[1, 2, "/scratch/a/trunc')  # partial line from a crash
+
+    assert find_entries(tmp_path, users=["bennet"], prefix="/scratch/a") == {
+        "/scratch/a/x.txt": (5, "/stage/scratch/a/x.txt"),
+        "/scratch/a/y.dat": (2, "/stage/scratch/a/y.dat"),
+    }
+    assert set(find_entries(tmp_path, pattern="*.txt")) == {
+        "/scratch/a/x.txt",
+        "/scratch/ab/z.txt",
+        "/scratch/b/x.txt",
+    }
+    assert find_entries(tmp_path, users=["nobody"]) == {}
+
+
+def test_manifest_path():
+    config = configparser.ConfigParser()
+    config.read_dict({"purgehelper": {"stagepath": "/stage", "manifestpath": ""}})
+    assert str(manifest_path(config["purgehelper"])) == "/stage/.manifest"
+    config["purgehelper"]["manifestpath"] = "/var/manifests"
+    assert str(manifest_path(config["purgehelper"])) == "/var/manifests"
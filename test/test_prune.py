@@ -0,0 +1,103 @@
+import datetime
+import os
+import sys
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from prune import DirTracker, prune_dirs
+from purgehelper import PurgeBatch, age_cutoff
+
+
+def age(path, days=75):
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=days)).timetuple())
+    os.utime(path, (aTime, aTime))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """
+    root/top/old/deep/f1   all old, whole chain can go up to top
+    root/top/keep/f2 + f3  f3 is new so keep stays
+    root/top/new/f4        directory itself was just modified
+    """
+    files = {}
+    for name, rel in [
+        ("f1", "top/old/deep"),
+        ("f2", "top/keep"),
+        ("f3", "top/keep"),
+        ("f4", "top/new"),
+    ]:
+        d = tmp_path / rel
+        d.mkdir(parents=True, exist_ok=True)
+        files[name] = d / name
+        files[name].touch()
+        if name != "f3":
+            age(files[name])
+    for rel in ["top/old/deep", "top/old", "top/keep", "top"]:
+        age(tmp_path / rel)
+    return tmp_path, files
+
+
+def test_prune_dirs(tree):
+    """only directories left empty and old enough go, deepest first"""
+    root, files = tree
+    batch = PurgeBatch(days=60, purge=True, ignore_ctime=True, prune=True)
+    summary = batch.run([str(f) for f in files.values()])
+    assert summary == {"purged": 3, "underage": 1}
+
+    outcomes = prune_dirs(
+        batch.dirs.acted, str(root), age_cutoff(60), ignore_ctime=True, threads=2
+    )
+    assert outcomes == {"pruned": 2, "notempty": 1, "underage": 1}
+    assert not (root / "top" / "old").exists()
+    assert (root / "top" / "keep").is_dir()
+    assert (root / "top" / "new").is_dir()
+    assert (root / "top").is_dir()  # direct child of root is never removed
+
+
+def test_prune_dirs_atime(tree):
+    """directory atime refreshed by the scan doesn't keep it"""
+    root, files = tree
+    batch = PurgeBatch(days=60, purge=True, ignore_ctime=True, prune=True)
+    deep = files["f1"].parent
+    st = os.stat(deep)
+    os.utime(deep, (time.time(), st.st_mtime))
+    batch.run([str(files["f1"])])
+
+    outcomes = prune_dirs(
+        batch.dirs.acted, str(root), age_cutoff(60), ignore_ctime=True, threads=2
+    )
+    assert outcomes == {"pruned": 2}
+    assert not (root / "top" / "old").exists()
+
+
+def test_prune_dirs_protected(tmp_path):
+    """root, its children and anything outside root are left alone"""
+    (tmp_path / "top").mkdir()
+    (tmp_path / "outside").mkdir()
+    acted = {
+        str(tmp_path / "top"): (0, 0),
+        str(tmp_path / "outside"): (0, 0),
+    }
+    assert prune_dirs(acted, str(tmp_path / "top"), age_cutoff(60)) == {}
+    assert prune_dirs(acted, str(tmp_path), age_cutoff(60)) == {}
+    assert (tmp_path / "top").is_dir()
+
+
+def test_prune_dirs_dryrun(tree):
+    root, files = tree
+    acted = {str(files["f1"].parent): (0, 0)}
+    assert prune_dirs(acted, str(root), age_cutoff(60), dryrun=True) == {}
+
+
+def test_DirTracker_merge():
+    """oldest times win, a later stat may be after another worker acted"""
+    tracker = DirTracker()
+    tracker.merge({"/scratch/a": (10, 10)})
+    tracker.merge({"/scratch/a": (20, 20), "/scratch/b": (1, 1)})
+    assert tracker.acted == {"/scratch/a": (10, 10), "/scratch/b": (1, 1)}
@@ -1,4 +1,5 @@
 import datetime
+import io
 import logging
 import os
 import pathlib
@@ -15,12 +16,20 @@ import pytest
 # needed to import functions in odd paths
 sys.path.append(os.path.abspath("./"))
 
+import purgehelper
+from idcache import IdentityCache
+from journal import Journal
 from purgehelper import (
+    PurgeBatch,
     PurgeDaysUnderError,
     PurgeError,
     PurgeNotFileError,
     PurgeObject,
+    StageDirs,
+    group_by_parent,
+    open_paths,
     parse_args,
+    read_paths,
 )
 
 
@@ -44,6 +53,43 @@ def test_valid_args(ValidArgs):
     assert args.days == int(ValidArgs[1][1])
 
 
+def test_files_from_args():
+    """--files-from is batch mode and can't be combined with --file"""
+    args = parse_args(["--files-from", "-", "--days", "5", "-0"])
+    assert args.files_from == "-"
+    assert args.null
+    with pytest.raises(SystemExit):
+        parse_args(["--files-from", "-", "--file", "/tmp/data", "--days", "5"])
+
+
+@pytest.mark.parametrize(
+    "data,null",
+    [
+        ("/a/b\n/a/c d\n\n/e\n", False),  # newline, blank lines skipped
+        ("/a/b\0/a/c d\0/e", True),  # NUL delimited no trailing NUL
+        ("/a/b\0/a/c d\0\0/e\0", True),  # NUL delimited
+    ],
+)
+def test_read_paths(data, null):
+    """Check both delimiters and paths with spaces"""
+    assert list(read_paths(io.StringIO(data), null=null)) == ["/a/b", "/a/c d", "/e"]
+
+
+@pytest.mark.parametrize(
+    "data,null,expected",
+    [
+        (b"/a/b\r\0/c\r\nd\0", True, ["/a/b\r", "/c\r\nd"]),
+        (b"/a/b\r\n/c\rd\n", False, ["/a/b\r", "/c\rd"]),
+    ],
+)
+def test_open_paths(tmp_path, data, null, expected):
+    """carriage returns are part of the path, not line endings"""
+    listfile = tmp_path / "list"
+    listfile.write_bytes(data)
+    with open_paths(listfile) as f:
+        assert list(read_paths(f, null=null)) == expected
+
+
 @pytest.fixture
 def agedfile(tmp_path):
     """setup a number of example file 75 days last accessed"""
@@ -289,3 +335,212 @@ def test_purgeObject_delete(
 
         print(f"Number of files after: {num_f_after}")
         assert num_f_after == expected
+
+
+def test_PurgeBatch(agedfile, underagefile, stagepath):
+    """Batch should keep going past missing and underage files and summarize"""
+    paths = [str(agedfile), str(underagefile), "/garbage/path/file.txt"]
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True)
+    summary = batch.run(paths)
+
+    assert summary == {"staged": 1, "underage": 1, "notfile": 1}
+    assert not agedfile.exists()
+    assert underagefile.exists()
+    assert batch.report().startswith("Processed 3 paths")
+
+
+def test_PurgeBatch_relative(agedfile, stagepath, monkeypatch):
+    """relative paths are staged under stagepath like absolute ones"""
+    monkeypatch.chdir(agedfile.parent)
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True)
+    assert batch.run([agedfile.name]) == {"staged": 1}
+    assert (pathlib.Path(stagepath) / agedfile.relative_to("/")).is_file()
+
+
+def test_PurgeBatch_dryrun(agedfile):
+    """dryrun in batch should leave files alone"""
+    batch = PurgeBatch(days=60, purge=True, dryrun=True, ignore_ctime=True)
+    assert batch.apply(str(agedfile)) == "purged"
+    assert agedfile.exists()
+
+
+@pytest.mark.parametrize("purge,staged", [(True, 0), (False, 1)])
+def test_PurgeObject_dir_fd(agedfile, stagepath, purge, staged):
+    """stat/unlink/rename relative to open directory handles"""
+    dir_fd = os.open(agedfile.parent, os.O_RDONLY | os.O_DIRECTORY)
+    sd = pathlib.Path(stagepath) / agedfile.parent.relative_to("/")
+    sd.mkdir(parents=True)
+    stage_fd = os.open(sd, os.O_RDONLY | os.O_DIRECTORY)
+    kwargs = {"purge": True} if purge else {"stagepath": stagepath}
+    try:
+        po = PurgeObject(
+            path=agedfile, days=60, dir_fd=dir_fd, stage_fd=stage_fd, **kwargs
+        )
+        assert po.stat.st_ino == agedfile.stat().st_ino
+        po.applyrules(ignore_ctime=True)
+    finally:
+        os.close(dir_fd)
+        os.close(stage_fd)
+
+    assert not agedfile.exists()
+    assert (sd / agedfile.name).is_file() == bool(staged)
+
+
+def test_PurgeObject_dir_fd_bad(tmp_path):
+    """missing names and directories are not files relative to dir_fd either"""
+    (tmp_path / "adir").mkdir()
+    dir_fd = os.open(tmp_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for name in ["missing.txt", "adir"]:
+            with pytest.raises(PurgeNotFileError):
+                PurgeObject(path=tmp_path / name, days=5, purge=True, dir_fd=dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def test_group_by_parent():
+    groups = group_by_parent(["/a/b/1", "/a/c/2", "/a/b/3"])
+    assert groups == {"/a/b": ["/a/b/1", "/a/b/3"], "/a/c": ["/a/c/2"]}
+    assert group_by_parent(["old.txt"]) == {".": ["old.txt"]}
+
+
+def test_PurgeBatch_dirfd_relative(agedfile, monkeypatch):
+    """bare names are purged relative to the current directory"""
+    monkeypatch.chdir(agedfile.parent)
+    batch = PurgeBatch(days=60, purge=True, ignore_ctime=True, dirfd=True)
+    assert batch.run([agedfile.name]) == {"purged": 1}
+    assert not agedfile.exists()
+
+
+def test_PurgeBatch_dirfd(agedfile, underagefile, stagepath):
+    """grouped directory handle mode should match the path mode"""
+    paths = [
+        str(agedfile),
+        str(underagefile),
+        str(agedfile.parent / "missing.txt"),
+        "/garbage/path/file.txt",
+    ]
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True, dirfd=True)
+    summary = batch.run(paths, groupsize=2)
+
+    assert summary == {"staged": 1, "underage": 1, "notfile": 2}
+    assert not agedfile.exists()
+    staged = pathlib.Path(stagepath) / agedfile.relative_to("/")
+    assert staged.is_file()
+
+
+def test_PurgeBatch_userignore(agedfile, stagepath, monkeypatch):
+    """ignored users are turned into uids once, not looked up per file"""
+    idcache = IdentityCache()
+    idcache.add("notarealuser", agedfile.stat().st_uid)
+    monkeypatch.setattr(purgehelper, "identities", idcache)
+    mock_pwd = MagicMock()
+    monkeypatch.setattr(pwd, "getpwuid", mock_pwd)
+
+    batch = PurgeBatch(
+        days=60, stagepath=stagepath, userignore=["notarealuser"], ignore_ctime=True
+    )
+    assert batch.run([str(agedfile)]) == {"ignored": 1}
+    assert agedfile.exists()
+    assert mock_pwd.call_count == 0
+
+
+@pytest.fixture
+def made(monkeypatch):
+    """list of directories pathlib is asked to mkdir(parents=True)"""
+    made = []
+    real_mkdir = pathlib.Path.mkdir
+
+    def recording_mkdir(self, *args, **kwargs):
+        if kwargs.get("parents"):  # skip pathlib's own retry after making parents
+            made.append(self)
+        return real_mkdir(self, *args, **kwargs)
+
+    monkeypatch.setattr(pathlib.Path, "mkdir", recording_mkdir)
+    return made
+
+
+def test_StageDirs(tmp_path, made):
+    """each stage directory is only made once"""
+    stagedirs = StageDirs()
+    assert stagedirs.makedirs(tmp_path / "a" / "b")
+    assert not stagedirs.makedirs(tmp_path / "a" / "b")
+    assert not stagedirs.makedirs(tmp_path / "a")  # parent already exists
+    assert stagedirs.makedirs(tmp_path / "a" / "c")
+    assert made.count(tmp_path / "a" / "b") == 1
+    assert made.count(tmp_path / "a") == 1  # only as parent of a/b
+    assert (tmp_path / "a" / "c").is_dir()
+
+
+@pytest.mark.parametrize("dirfd", [False, True])
+def test_PurgeBatch_stage_many(tmp_path, stagepath, made, dirfd):
+    """staging a directory of files should only mkdir the stage directory once"""
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=75)).timetuple())
+    paths = []
+    for i in range(10):
+        f = tmp_path / f"file{i}"
+        f.touch()
+        os.utime(f, (aTime, aTime))
+        paths.append(str(f))
+
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True, dirfd=dirfd)
+    assert batch.run(paths) == {"staged": 10}
+    sd = pathlib.Path(stagepath) / tmp_path.relative_to("/")
+    assert made.count(sd) == 1
+    assert len(list(sd.iterdir())) == 10
+
+
+def test_PurgeBatch_stats(agedfile, underagefile, stagepath):
+    """stats count skips by reason and bytes reclaimed"""
+    agedfile.write_bytes(b"x" * 100)
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=75)).timetuple())
+    os.utime(agedfile, (aTime, aTime))
+
+    batch = PurgeBatch(days=60, purge=True, ignore_ctime=True)
+    batch.run([str(agedfile), str(underagefile), "/garbage/path/file.txt"])
+    stats = batch.stats.as_dict()
+
+    assert stats["counters"] == {"purged": 1, "underage_atime": 1, "notfile": 1}
+    assert stats["bytes"] == {"purged": 100}
+    assert stats["latency"]["stat"]["count"] == 3
+    assert stats["latency"]["purged"]["count"] == 1
+
+
+def test_PurgeBatch_throttle(tmp_path):
+    """every file waits on the rate ceiling and the adaptive limiter"""
+    paths = [str(tmp_path / f"missing{i}") for i in range(5)]
+    batch = PurgeBatch(days=60, purge=True, maxrate=1000, target_latency=0.010)
+    batch.throttle.acquire = MagicMock(return_value=0)
+    limiter = batch.limiter
+    limiter.acquire = MagicMock(wraps=limiter.acquire)
+    limiter.release = MagicMock(wraps=limiter.release)
+    limiter.observe = MagicMock(wraps=limiter.observe)
+
+    assert batch.run(paths) == {"notfile": 5}
+    assert batch.throttle.acquire.call_count == 5
+    assert limiter.acquire.call_count == limiter.release.call_count == 5
+    assert limiter.observe.call_count == 5  # one stat each
+
+
+def test_PurgeBatch_journal(agedfile, underagefile):
+    """every outcome is journaled, resume skips the ones done"""
+    journal = Journal()
+    paths = [str(agedfile), str(underagefile), "/garbage/path/file.txt"]
+    batch = PurgeBatch(days=60, purge=True, ignore_ctime=True, journal=journal)
+    batch.run(paths)
+    outcomes = {path: outcome for _, outcome, path in journal.take()}
+    assert outcomes == {
+        str(agedfile): "purged",
+        str(underagefile): "underage",
+        "/garbage/path/file.txt": "notfile",
+    }
+
+
+@pytest.mark.parametrize(
+    "args", [("--resume",), ("--journal", "j", "--dryrun")],
+)
+def test_journal_args(args):
+    with pytest.raises(SystemExit):
+        parse_args(["--days", "5", "--files-from", "-"] + list(args))
@@ -0,0 +1,176 @@
+import datetime
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from purgelist import chunks, get_lists, get_path, parse_args, purge_lists
+from purgestats import Progress, PurgeStats
+
+
+def test_missing_lists():
+    """Need either list files or a --scanident"""
+    with pytest.raises(SystemExit):
+        parse_args(["--days", "60"])
+
+
+@pytest.mark.parametrize(
+    "ValidArgs",
+    [
+        [("--days", "60", "--scanident", "2020-08"), (60, "2020-08", [], 4)],
+        [
+            ("--days", "5", "a.txt", "b.txt", "--procs", "2"),
+            (5, None, ["a.txt", "b.txt"], 2),
+        ],
+    ],
+)
+def test_valid_args(ValidArgs):
+    args = parse_args(ValidArgs[0])
+    assert args.days == ValidArgs[1][0]
+    assert args.scanident == ValidArgs[1][1]
+    assert args.lists == ValidArgs[1][2]
+    assert args.procs == ValidArgs[1][3]
+
+
+@pytest.mark.parametrize(
+    "line,path",
+    [
+        (
+            "-rw-r--r-- msbritt support  18.000  B Aug 14 2019 17:04 /scratch/support_root/support/msbritt/testout\n",
+            "/scratch/support_root/support/msbritt/testout",
+        ),
+        (
+            "-rw-r--r-- bennet support 578.000  B Oct 22 2019 09:35 /scratch/a dir/with  spaces.txt\n",
+            "/scratch/a dir/with  spaces.txt",
+        ),
+        ("garbage line\n", None),
+    ],
+)
+def test_get_path(line, path):
+    assert get_path(line) == path
+
+
+def test_get_lists(tmp_path):
+    """per directory and per user lists should be kept apart"""
+    for name in ["a", "b", "c"]:
+        (tmp_path / f"testident-{name}.txt").touch()
+    for name in ["bennet", "msbritt"]:
+        (tmp_path / f"testident-{name}.purge.txt").touch()
+    (tmp_path / "otherident-a.txt").touch()
+
+    assert len(get_lists(tmp_path, "testident")) == 3
+    assert len(get_lists(tmp_path, "testident", userlists=True)) == 2
+
+
+def test_chunks():
+    assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.fixture
+def agedlist(tmp_path):
+    """dwalk style list of 20 files 75 days old plus one missing"""
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=75)).timetuple())
+
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    lines = []
+    for i in range(20):
+        f = scratch / f"file {i}.txt"
+        f.touch()
+        os.utime(f, (aTime, aTime))
+        lines.append(f"-rw-r--r-- bennet support   0.000  B Oct 22 2019 09:35 {f}\n")
+    lines.append(
+        f"-rw-r--r-- bennet support   0.000  B Oct 22 2019 09:35 {scratch}/gone\n"
+    )
+
+    listfile = tmp_path / "testident-scratch.txt"
+    listfile.write_text("".join(lines))
+    return listfile
+
+
+@pytest.mark.parametrize("dirfd", [False, True])
+@pytest.mark.parametrize("dryrun,remaining", [(True, 20), (False, 0)])
+def test_purge_lists(agedlist, dryrun, remaining, dirfd):
+    """stage every file from the list across processes and threads"""
+    stagepath = tempfile.mkdtemp()
+    summary = purge_lists(
+        [agedlist],
+        procs=2,
+        threads=2,
+        chunksize=3,
+        days=60,
+        stagepath=stagepath,
+        dryrun=dryrun,
+        ignore_ctime=True,
+        dirfd=dirfd,
+    )
+
+    assert summary == {"staged": 20, "notfile": 1}
+    scratch = agedlist.parent / "scratch"
+    assert len(list(scratch.iterdir())) == remaining
+    staged = [f for f in pathlib.Path(stagepath).glob("**/*") if f.is_file()]
+    assert len(staged) == 20 - remaining
+
+
+def test_purge_lists_stats(agedlist):
+    """worker stats are merged back in the parent"""
+    stats = PurgeStats()
+    progress = Progress(total=21, interval=0)
+    purge_lists(
+        [agedlist],
+        procs=2,
+        threads=2,
+        chunksize=5,
+        days=60,
+        purge=True,
+        dryrun=True,
+        ignore_ctime=True,
+        stats=stats,
+        progress=progress,
+    )
+
+    assert stats.counters == {"purged": 20, "notfile": 1}
+    assert stats.latency["stat"].count == 21
+
+
+def test_purge_lists_resume(agedlist):
+    """a second run with resume only checks paths not already done"""
+    args = dict(procs=2, threads=2, chunksize=5, days=60, purge=True)
+    args.update(ignore_ctime=True, journal=True)
+    first = purge_lists([agedlist], **args)
+    assert first == {"purged": 20, "notfile": 1}
+    journal = pathlib.Path(f"{agedlist}.journal")
+    assert len(journal.read_text().splitlines()) == 21
+
+    # drop the last 5 as if the run had died before writing them
+    lines = journal.read_text().splitlines(keepends=True)
+    journal.write_text("".join(lines[:16]))
+    assert sum(purge_lists([agedlist], resume=True, **args).values()) == 5
+    assert len(journal.read_text().splitlines()) == 21
+
+
+def test_purge_lists_prune(agedlist):
+    """directories emptied across workers are pruned, the scan directory kept"""
+    scratch = agedlist.parent / "scratch"
+    sub = scratch / "sub"
+    sub.mkdir()
+    old = scratch / "file 0.txt"
+    (sub / "file.txt").touch()
+    os.utime(sub / "file.txt", (os.stat(old).st_atime,) * 2)
+    os.utime(sub, (os.stat(old).st_atime,) * 2)
+    with agedlist.open("a") as f:
+        f.write(
+            f"-rw-r--r-- bennet support   0.000  B Oct 22 2019 09:35 {sub}/file.txt\n"
+        )
+
+    args = dict(procs=2, threads=2, chunksize=5, days=60, purge=True)
+    purge_lists([agedlist], ignore_ctime=True, prune_root=str(agedlist.parent), **args)
+    assert not sub.exists()
+    assert scratch.is_dir()
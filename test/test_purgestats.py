@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from purgestats import (
+    BUCKETS,
+    Histogram,
+    Progress,
+    PurgeStats,
+    count_entries,
+    format_duration,
+    write_json,
+)
+
+
+def test_Histogram():
+    h = Histogram()
+    for _ in range(90):
+        h.observe(0.0002)
+    for _ in range(10):
+        h.observe(0.3)
+
+    assert h.count == 100
+    assert h.percentile(50) == 0.00025
+    assert h.percentile(95) == 0.5
+    assert h.max == 0.3
+
+    h.observe(60)  # over the last bucket
+    assert h.percentile(100) == 60
+    assert len(h.as_dict()["buckets"]) == len(BUCKETS) + 1
+
+
+def test_PurgeStats_take_merge():
+    """worker deltas add up in the parent"""
+    worker = PurgeStats()
+    worker.count("purged", nbytes=100)
+    worker.count("underage_atime", n=3)
+    with worker.timer("stat"):
+        pass
+
+    delta = worker.take()
+    assert worker.total == 0  # reset after take
+
+    parent = PurgeStats()
+    parent.merge(delta)
+    parent.merge(delta)
+    d = parent.as_dict()
+    assert d["counters"] == {"purged": 2, "underage_atime": 6}
+    assert d["bytes"] == {"purged": 200}
+    assert d["latency"]["stat"]["count"] == 2
+    assert d["total"] == 8
+    json.dumps(d)  # must be serializable
+
+
+def test_Progress(caplog):
+    caplog.set_level(logging.INFO)
+    progress = Progress(total=100, interval=60)
+    progress.start -= 10  # 10 seconds in
+
+    s = progress.status(25)
+    assert s["rate"] == pytest.approx(2.5, rel=0.01)
+    assert s["eta"] == pytest.approx(30, rel=0.01)
+
+    assert not progress.update(25)  # interval hasn't passed
+    assert progress.update(25, force=True)
+    assert "25/100 (25.0%)" in caplog.text
+    assert "ETA 00:00:" in caplog.text
+
+
+def test_Progress_unknown_total():
+    progress = Progress()
+    s = progress.status(10)
+    assert s["eta"] is None
+    assert s["expected"] is None
+    assert "total" not in s  # would clobber PurgeStats total in the summary
+
+
+@pytest.mark.parametrize(
+    "seconds,expected",
+    [(30.5, "00:00:30"), (3725, "01:02:05"), (99 * 3600, "4d 03:00:00")],
+)
+def test_format_duration(seconds, expected):
+    assert format_duration(seconds) == expected
+
+
+def test_count_entries(tmp_path):
+    a = tmp_path / "a.txt"
+    a.write_text("1\n2\n3\n")
+    b = tmp_path / "b.txt"
+    b.write_bytes(b"x\0y\0")
+    assert count_entries([a]) == 3
+    assert count_entries([b], sep=b"\0") == 2
+
+
+def test_write_json(tmp_path):
+    path = tmp_path / "stats.json"
+    write_json(path, {"a": 1})
+    write_json(path, {"a": 2})
+    assert json.loads(path.read_text()) == {"a": 2}
+    assert list(tmp_path.iterdir()) == [path]
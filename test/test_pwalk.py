@@ -0,0 +1,34 @@
+import os
+import sys
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from pwalk import walk
+
+
+def test_walk(tmp_path):
+    """every directory listed once with its files stat'd"""
+    for d in ["a/b/c", "a/d", "e"]:
+        (tmp_path / d).mkdir(parents=True)
+    for f in ["a/1", "a/b/c/2", "e/3", "4"]:
+        (tmp_path / f).write_text(f)
+    os.symlink("a", tmp_path / "link")
+
+    seen = {}
+    for dirpath, st, dirnames, files in walk([tmp_path], threads=3):
+        assert dirpath not in seen
+        seen[dirpath] = (sorted(dirnames), {name: st.st_size for name, st in files})
+
+    rel = {os.path.relpath(k, tmp_path): v for k, v in seen.items()}
+    assert len(rel) == 6
+    assert rel["."] == (["a", "e"], {"4": 1, "link": 1})  # symlink not followed
+    assert rel["a/b/c"] == ([], {"2": 7})
+
+
+def test_walk_unreadable(tmp_path, caplog):
+    """directories that vanish or can't be read are skipped"""
+    (tmp_path / "ok").mkdir()
+    found = [d for d, *_ in walk([tmp_path / "missing", tmp_path], threads=2)]
+    assert sorted(found) == [str(tmp_path), str(tmp_path / "ok")]
+    assert "Can't list" in caplog.text
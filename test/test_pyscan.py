@@ -0,0 +1,101 @@
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from pyscan import Cancelled, WorkerDied, dwalk_line, format_size, scan
+from scansort import user_key
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [(18, " 18.000  B"), (238378, "232.791 KB"), (1024 ** 3, "  1.000 GB"),],
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+
+
+def test_dwalk_line(tmp_path):
+    """Same columns purgelist.py and userlist.py split on."""
+    f = tmp_path / "testout"
+    f.write_text("x" * 18)
+    line = dwalk_line(str(f), os.lstat(f), "msbritt", "support")
+    assert line.startswith("-rw-r--r-- msbritt support  18.000  B ")
+    assert line.rstrip("\n").split(None, 9)[9] == str(f)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """a/ and a/b/c/ with files owned by two users, one recently accessed"""
+    root = tmp_path / "scan"
+    deep = root / "a" / "b" / "c"
+    deep.mkdir(parents=True)
+    (root / "link").symlink_to(root / "a")
+    for i, d in enumerate([root, root / "a", deep] * 2):
+        f = d / f"f{i}"
+        f.write_text("data")
+        os.chown(f, i % 2, -1)
+    os.utime(root / "a" / "f1", (time.time() + 7200, time.time()))
+    return root
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs root to chown")
+def test_scan(tmp_path, tree):
+    """Old regular files only, no symlinks, sorted by user."""
+    output = tmp_path / "out.txt"
+    log = tmp_path / "out.log"
+    with open(log, "w") as f:
+        counts = scan(tree, output, time.time() + 3600, procs=2, log=f, runsize=2)
+
+    assert counts["files"] == 5
+    assert counts["bytes"] == 20
+    assert counts["items"] == 10  # 6 files, a, b, c and link
+
+    lines = output.read_text().splitlines()
+    paths = [line.split(None, 9)[9] for line in lines]
+    assert str(tree / "a" / "f1") not in paths
+    assert len(paths) == 5
+    users = [user_key(line) for line in lines]
+    assert users == sorted(users)
+    assert "Walked 10 items" in log.read_text()
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+
+
+def test_scan_nothing(tmp_path, tree):
+    """Like dwalk no output when nothing matched."""
+    output = tmp_path / "out.txt"
+    counts = scan(tree, output, time.time() - 3600, procs=2)
+    assert counts["files"] == 0
+    assert not output.exists()
+
+
+def test_scan_worker_died(tmp_path, tree, monkeypatch):
+    """A killed worker fails the scan rather than hanging it."""
+    process = mp.get_context("spawn").Process
+    started = process.start
+
+    def start(self):
+        started(self)
+        os.kill(self.pid, signal.SIGKILL)
+
+    monkeypatch.setattr(process, "start", start)
+    start = time.time()
+    with pytest.raises(WorkerDied):
+        scan(tree, tmp_path / "out.txt", time.time() + 3600, procs=2, progress=1)
+    assert time.time() - start < 30
+
+
+def test_scan_cancelled(tmp_path, tree):
+    """Nothing is merged into output once cancelled, even if the walk is done."""
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(Cancelled):
+        scan(tree, tmp_path / "out.txt", time.time() + 3600, procs=2, cancel=cancel)
+    assert not (tmp_path / "out.txt").exists()
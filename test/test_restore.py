@@ -0,0 +1,79 @@
+import datetime
+import os
+import sys
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+import manifest
+from idcache import IdentityCache
+from manifest import Manifest, find_entries
+from purgehelper import PurgeBatch
+from restore import Restore, parse_args
+
+
+@pytest.fixture
+def staged(tmp_path, monkeypatch):
+    """stage a few old files through PurgeBatch with a manifest"""
+    cache = IdentityCache()
+    cache.add("bennet", os.getuid())
+    monkeypatch.setattr(manifest, "identities", cache)
+
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=75)).timetuple())
+    scratch = tmp_path / "scratch"
+    paths = []
+    for rel in ["a/1.txt", "a/2.dat", "b/deep/3.txt"]:
+        f = scratch / rel
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_text(rel)
+        os.utime(f, (aTime, aTime))
+        paths.append(str(f))
+
+    stagepath = tmp_path / "stage"
+    m = Manifest(tmp_path / "manifests")
+    batch = PurgeBatch(days=60, stagepath=str(stagepath), ignore_ctime=True, manifest=m)
+    assert batch.run(paths) == {"staged": 3}
+    batch.close()
+    return tmp_path, scratch
+
+
+def test_restore(staged):
+    tmp_path, scratch = staged
+    (scratch / "b" / "deep").rmdir()  # pruned after staging
+    entries = find_entries(tmp_path / "manifests", users=["bennet"])
+    assert len(entries) == 3
+
+    summary = Restore(threads=2).run(entries)
+    assert summary == {"restored": 3}
+    assert (scratch / "a" / "1.txt").read_text() == "a/1.txt"
+    assert (scratch / "b" / "deep" / "3.txt").read_text() == "b/deep/3.txt"
+
+    # second time everything is already back
+    assert Restore(threads=2).run(entries) == {"missing": 3}
+
+
+def test_restore_glob_exists(staged):
+    """only matching files, never overwrite one that came back"""
+    tmp_path, scratch = staged
+    (scratch / "a" / "1.txt").write_text("new")
+    entries = find_entries(tmp_path / "manifests", pattern="*.txt")
+    assert Restore().run(entries) == {"restored": 1, "exists": 1}
+    assert (scratch / "a" / "1.txt").read_text() == "new"
+    assert not (scratch / "a" / "2.dat").exists()
+
+
+def test_restore_dryrun(staged):
+    tmp_path, scratch = staged
+    entries = find_entries(tmp_path / "manifests", prefix=str(scratch / "a"))
+    assert Restore(dryrun=True).run(entries) == {"restored": 2}
+    assert not (scratch / "a" / "1.txt").exists()
+
+
+def test_args():
+    with pytest.raises(SystemExit):
+        parse_args([])
+    assert parse_args(["--user", "bennet,msbritt"]).user == "bennet,msbritt"
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from scandiff import ListOrderError, ScanDiff, parse_line, read_entries, scan_lists
+
+
+def line(user, path, size="18.000  B"):
+    return f"-rw-r--r-- {user} support {size} Aug 14 2019 17:04 {path}\n"
+
+
+def write(path, lines):
+    with open(path, "w", newline="\n") as f:
+        f.writelines(lines)
+
+
+def test_parse_line():
+    assert parse_line(line("bob", "/s/a b", "232.791 KB")) == ("bob", "/s/a b", 238378)
+
+
+def test_scan_lists(tmp_path):
+    """Directories with + in their names are listed, --split parts aren't."""
+    (tmp_path / "old-parts").mkdir()
+    for name in ["old-proj", "old-bob.purge", "old-a+b", "older-proj", "old-parts/c+"]:
+        write(tmp_path / f"{name}.txt", [])
+    assert scan_lists(tmp_path, "old") == {
+        "proj": tmp_path / "old-proj.txt",
+        "a+b": tmp_path / "old-a+b.txt",
+    }
+
+
+def test_ScanDiff(tmp_path):
+    """Added, removed and unchanged per user and directory."""
+    write(
+        tmp_path / "old-a.txt",
+        [line("amy", "/s/a/1"), line("amy", "/s/a/2"), line("bob", "/s/a/3")],
+    )
+    write(tmp_path / "old-gone.txt", [line("bob", "/s/gone/1")])
+    write(
+        tmp_path / "new-a.txt",
+        [
+            line("amy", "/s/a/2", " 20.000  B"),
+            line("bob", "/s/a/0"),
+            line("bob", "/s/a/3"),
+        ],
+    )
+    write(tmp_path / "new-b.txt", [line("cat", "/s/b/1")])
+
+    diff = ScanDiff()
+    diff.run(scan_lists(tmp_path, "old"), scan_lists(tmp_path, "new"))
+
+    assert diff.users["amy"] == {
+        "removed": 1,
+        "removed_bytes": 18,
+        "unchanged": 1,
+        "delta_bytes": -16,
+    }
+    assert diff.users["bob"] == {
+        "added": 1,
+        "added_bytes": 18,
+        "removed": 1,
+        "removed_bytes": 18,
+        "unchanged": 1,
+        "delta_bytes": 0,
+    }
+    assert diff.directories["gone"]["removed"] == 1
+    assert diff.directories["b"]["added"] == 1
+    total = diff.as_dict()["total"]
+    assert (total["added"], total["removed"], total["unchanged"]) == (2, 2, 2)
+    assert total["delta_bytes"] == 2
+    assert "Total added=2" in diff.report()
+
+
+def test_read_entries_unsorted(tmp_path):
+    """Lists from dwalk --sort user alone can't be merged."""
+    write(tmp_path / "x.txt", [line("amy", "/s/2"), line("amy", "/s/1")])
+    with pytest.raises(ListOrderError):
+        list(read_entries(tmp_path / "x.txt"))
@@ -0,0 +1,68 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from scanlog import estimate_cost, last_walked, longest_first
+
+
+def test_last_walked(tmp_path):
+    """Last of dwalk's progress and final lines, pyscan writes the same."""
+    log = tmp_path / "x.log"
+    log.write_text(
+        "[2020-01-09T10:10:10] Walking /scratch/a\n"
+        "[2020-01-09T10:11:10] Walked 500 items in 60.002 secs (8.333 items/sec) ...\n"
+        "[2020-01-09T10:11:30] Walked 640 items in 80.125 seconds (7.988 items/sec)\n"
+    )
+    assert last_walked(log) == (640, 80.125)
+    assert last_walked(tmp_path / "missing.log") is None
+
+
+def test_estimate_cost(tmp_path):
+    (tmp_path / "old-a.log").write_text("Walked 640 items in 80.1 secs\n")
+    (tmp_path / "old-b.cache").write_bytes(b"x" * 1280)
+    assert estimate_cost("a", "old", tmp_path) == 640
+    assert estimate_cost("b", "old", tmp_path) == 10
+    assert estimate_cost("c", "old", tmp_path) is None
+
+
+def test_estimate_cost_parts(tmp_path):
+    """Split parts are added up, a sibling directory named a+x is not a part."""
+    (tmp_path / "old-parts").mkdir()
+    for name, items in [("parts/a+", 5), ("parts/a+x", 10), ("a+x", 1000)]:
+        (tmp_path / f"old-{name}.log").write_text(f"Walked {items} items in 1 secs\n")
+    (tmp_path / "old-parts" / "a%2Bx+.log").write_text("Walked 7 items in 1 secs\n")
+    assert estimate_cost("a", "old", tmp_path) == 15
+    assert estimate_cost("a+x", "old", tmp_path) == 1000
+    assert estimate_cost("parts/a+x", "old", tmp_path) == 10
+
+
+def test_longest_first(tmp_path):
+    """Biggest first, unknown directories get the median."""
+    for name, items in [("a", 10), ("b", 1000), ("c", 50)]:
+        (tmp_path / f"old-{name}.log").write_text(f"Walked {items} items in 1 secs\n")
+    paths = {pathlib.Path("/scratch") / x for x in "abcd"}
+
+    order = longest_first(paths, history="old", directory=tmp_path)
+    assert [(p.name, e) for p, e in order] == [
+        ("b", 1000),
+        ("c", 50),
+        ("d", 50),
+        ("a", 10),
+    ]
+    # no history keeps everything
+    assert len(longest_first(paths)) == 4
+
+
+def test_last_walked_tail(tmp_path):
+    """Found at the end of a long log or further back."""
+    log = tmp_path / "x.log"
+    log.write_text("Walked 1 items in 1.0 secs\n" + "x" * 100 + "\n")
+    assert last_walked(log, tail=10) == (1, 1.0)
+    with open(log, "a") as f:
+        f.write("Walked 2 items in 2.0 secs\n")
+    assert last_walked(log, tail=40) == (2, 2.0)
@@ -0,0 +1,60 @@
+import os
+import sys
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from scansort import RunWriter, merge_runs, sort_key, sort_text, user_key
+
+
+def line(user, path):
+    return f"-rw-r--r-- {user} support  18.000  B Aug 14 2019 17:04 {path}\n"
+
+
+def test_user_key():
+    assert user_key(line("msbritt", "/a b\r")) == "msbritt"
+
+
+def test_merge_runs(tmp_path):
+    """Runs merge sorted by user in passes of fanin, runs are removed."""
+    users = ["zed", "bob", "amy", "bob", "kim", "amy", "zed", "al"]
+    runs = RunWriter(tmp_path, runsize=3)
+    for i, user in enumerate(users):
+        runs.add(line(user, f"/scratch/f{i}\r"))
+    runs.close()
+    assert len(runs.runs) == 3
+
+    output = tmp_path / "out.txt"
+    assert merge_runs(runs.runs, output, fanin=2) == len(users)
+    with open(output, newline="\n") as f:
+        lines = f.readlines()
+    assert [user_key(l) for l in lines] == sorted(users)
+    assert all(l.endswith("\r\n") for l in lines)
+    assert sorted(os.listdir(tmp_path)) == ["out.txt"]
+
+
+def test_sort_text(tmp_path):
+    """In place, same result as sorting in memory, no runs left behind."""
+    users = ["zed", "bob", "amy", "bob", "kim", "amy", "zed", "al"]
+    text = tmp_path / "s-proj.txt"
+    with open(text, "w", newline="\n") as f:
+        f.writelines(line(user, f"/scratch/f{i}") for i, user in enumerate(users))
+
+    assert sort_text(text, text, runsize=3) == len(users)
+    lines = text.read_text().splitlines(keepends=True)
+    assert [user_key(l) for l in lines] == sorted(users)
+    assert sorted(os.listdir(tmp_path)) == ["s-proj.txt"]
+
+
+def test_sort_key(tmp_path):
+    """Within a user lists are in path order for scandiff.py, across runs."""
+    paths = ["/s/b", "/s/a/b", "/s/z", "/s/a", "/s/y", "/s/a c", "/s/c"]
+    users = ["amy", "al", "amy", "bob", "amy", "al", "amy"]
+    source = tmp_path / "s-proj.txt"
+    source.write_text("".join(line(u, p) for u, p in zip(users, paths)))
+
+    # runsize 2 so order comes from merging several runs
+    assert sort_text(source, source, runsize=2) == len(paths)
+    keys = [sort_key(l) for l in source.read_text().splitlines(keepends=True)]
+    assert keys == sorted(zip(users, paths))
+    assert keys[:2] == [("al", "/s/a c"), ("al", "/s/a/b")]
@@ -0,0 +1,65 @@
+import json
+import os
+import pathlib
+import sys
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from buildlist import ScanUnit, state_units
+from scanstate import DONE, FAILED, PENDING, RUNNING, ScanState
+
+
+def unit(name):
+    return ScanUnit(f"/scratch/{name}", name, name, False)
+
+
+def test_ScanState(tmp_path):
+    path = tmp_path / "s-state.json"
+    state = ScanState(path)
+    a, b, c = unit("a"), unit("b"), unit("c")
+    state.add([a, b, c])
+    state.start(a)
+    state.done(a, 12.3456, 100)
+    state.start(b)
+    state.failed(b, 1, "exit status 1")
+    state.start(c)
+
+    saved = json.loads(path.read_text())["units"]
+    assert saved["a"]["state"] == DONE
+    assert saved["a"]["runtime"] == 12.346
+    assert saved["a"]["entries"] == 100
+    assert saved["b"]["state"] == FAILED
+    assert saved["b"]["error"] == "exit status 1"
+    assert saved["c"]["state"] == RUNNING
+    assert saved["c"]["attempts"] == 1
+
+    # killed with c running, resume picks up b and c not a
+    resumed = ScanState(path, resume=True)
+    assert state_units(resumed, DONE) == [
+        ScanUnit(pathlib.Path("/scratch/a"), "a", "a", False)
+    ]
+    assert [u.name for u in state_units(resumed, PENDING, RUNNING, FAILED)] == [
+        "b",
+        "c",
+    ]
+    resumed.add([a, b, c])
+    assert resumed.units["a"]["state"] == DONE
+    resumed.start(b)
+    assert resumed.units["b"]["attempts"] == 2
+
+    # without resume start over
+    assert ScanState(path).units == {}
+
+
+def test_ScanState_discard(tmp_path):
+    state = ScanState(tmp_path / "s-state.json")
+    state.add([unit("slow")])
+    state.discard(unit("slow"))
+    state.add([unit("slow+"), unit("slow+a")])
+    assert sorted(state.units) == ["slow+", "slow+a"]
+    assert state.units["slow+"]["state"] == PENDING
+
+
+def test_ScanState_missing(tmp_path):
+    assert ScanState(tmp_path / "s-state.json", resume=True).units == {}
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from buildlist import ScanUnit
+from scanstatus import ScanStatus
+from scheduler import ScanScheduler
+
+
+def unit(name):
+    return ScanUnit(f"/scratch/{name}", name, name, False)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ScanStatus(tmp_path):
+    """Totals from finished and running logs, rewritten only every interval."""
+    (tmp_path / "s-a.log").write_text("Walked 100 items in 10.0 secs\n")
+    (tmp_path / "s-b.log").write_text(
+        "Walked 50 items in 5.0 secs (10 items/sec) ...\n"
+    )
+    textfile = tmp_path / "scan.prom"
+    status = tmp_path / "scan.json"
+    clock = Clock()
+    scan = ScanStatus(
+        's"1',
+        lambda u: tmp_path / f"s-{u.name}.log",
+        textfile=textfile,
+        status=status,
+        interval=15,
+        clock=clock,
+    )
+
+    clock.now += 10
+    scan.update([unit("c")], {unit("b"): 5.0}, [unit("a")])
+    data = json.loads(status.read_text())
+    assert (data["pending"], data["running"], data["done"]) == (1, 1, 1)
+    assert data["items"] == 150
+    assert data["rate"] == 15.0
+    assert data["directories"] == {"b": {"items": 50, "seconds": 5.0, "rate": 10.0}}
+
+    prom = textfile.read_text()
+    assert 'purgetools_scan_directories{scanident="s\\"1",state="pending"} 1' in prom
+    assert 'purgetools_scan_items{scanident="s\\"1"} 150' in prom
+    assert 'directory_items_per_second{scanident="s\\"1",directory="b"} 10.0' in prom
+    assert sorted(os.listdir(tmp_path)) == [
+        "s-a.log",
+        "s-b.log",
+        "scan.json",
+        "scan.prom",
+    ]
+
+    # too soon, unless forced
+    clock.now += 5
+    scan.update([], {}, [unit("a"), unit("b"), unit("c")])
+    assert json.loads(status.read_text())["done"] == 1
+    scan.update([], {}, [unit("a"), unit("b"), unit("c")], force=True)
+    assert json.loads(status.read_text())["done"] == 3
+
+
+def test_ScanScheduler_status(tmp_path):
+    """Final status is written once every scan is done."""
+    status = tmp_path / "scan.json"
+    scan = ScanStatus("s", lambda u: tmp_path / "none.log", status=status)
+    ScanScheduler(lambda u, cancel: None, status=scan).run([unit("a"), unit("b")])
+    data = json.loads(status.read_text())
+    assert (data["pending"], data["running"], data["done"]) == (0, 0, 2)
@@ -0,0 +1,195 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from buildlist import ScanUnit
+from pyscan import Cancelled
+from scanstate import ScanState
+from scheduler import ScanScheduler, size_ranks
+
+
+def unit(name):
+    return ScanUnit(f"/scratch/{name}", name, name, False)
+
+
+def fake_scan(unit, cancel=None):
+    """slow scans run until cancelled or 0.5s, the rest finish at once"""
+    if unit.name == "slow":
+        if cancel.wait(0.5):
+            raise Cancelled(unit.path)
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = tmp_path / "slow.log"
+    log.write_text("Walked 100 items in 1.000 secs (100.000 items/sec) ...\n")
+    return log
+
+
+def test_run():
+    units = [unit(x) for x in "abc"]
+    assert sorted(ScanScheduler(fake_scan, threads=2).run(units)) == units
+
+
+@pytest.mark.parametrize(
+    "estimate,resplit",
+    [
+        (100000, True),  # lots left, cancelled and split
+        (100, False),  # nearly done, left to finish
+        (None, False),  # no idea, left to finish
+    ],
+)
+def test_straggler(log, estimate, resplit):
+    parts = [unit("slow+"), unit("slow+a")]
+    scheduler = ScanScheduler(
+        fake_scan,
+        threads=4,
+        resplit=lambda u: parts,
+        logname=lambda u: log,
+        estimate=lambda u, walked: estimate,
+        minremaining=1,
+        interval=0.01,
+    )
+    scanned = scheduler.run([unit("slow"), unit("a"), unit("b")])
+    names = sorted(u.name for u in scanned)
+    if resplit:
+        assert names == ["a", "b", "slow+", "slow+a"]
+    else:
+        assert names == ["a", "b", "slow"]
+
+
+def test_straggler_slots_busy(log):
+    """Nothing re-split while other scans are waiting for a slot."""
+    scheduler = ScanScheduler(
+        fake_scan,
+        threads=1,
+        resplit=lambda u: [unit("slow+"), unit("slow+a")],
+        logname=lambda u: log,
+        estimate=lambda u, walked: 100000,
+        minremaining=1,
+        interval=0.01,
+    )
+    scanned = scheduler.run([unit("a"), unit("slow")])
+    assert [u.name for u in scanned] == ["a", "slow"]
+
+
+@pytest.mark.parametrize(
+    "failures,scanned,failed",
+    [
+        (1, ["a", "bad"], []),  # retried and done
+        (5, ["a"], ["bad"]),  # gave up, the rest still scanned
+    ],
+)
+def test_retry(tmp_path, failures, scanned, failed):
+    attempts = []
+
+    def flaky_scan(unit, cancel=None):
+        if unit.name == "bad":
+            attempts.append(time.monotonic())
+            if len(attempts) <= failures:
+                raise RuntimeError("dwalk exit status 1")
+
+    state = ScanState(tmp_path / "state.json")
+    scheduler = ScanScheduler(
+        flaky_scan, threads=2, retries=2, backoff=0.05, state=state, interval=0.01
+    )
+    assert sorted(u.name for u in scheduler.run([unit("a"), unit("bad")])) == scanned
+    assert [u.name for u in scheduler.failed] == failed
+    assert len(attempts) == min(failures + 1, 3)
+    # backoff doubles
+    if len(attempts) == 3:
+        assert attempts[2] - attempts[1] >= 0.1
+    assert state.units["a"]["state"] == "done"
+    assert state.units["bad"]["state"] == ("failed" if failed else "done")
+    assert state.units["bad"]["attempts"] == len(attempts)
+
+
+@pytest.mark.parametrize(
+    "items,ranks", [(None, 1), (10, 1), (1000000, 1), (1000001, 2), (10 ** 9, 64)],
+)
+def test_size_ranks(items, ranks):
+    assert size_ranks(items) == ranks
+
+
+def test_cores():
+    """Running ranks stay in the budget and freed cores go to queued scans."""
+    lock = threading.Lock()
+    used = []
+    most = []
+    given = {}
+    times = {}
+
+    def counting_scan(unit, cancel=None, np=None):
+        start = time.monotonic()
+        with lock:
+            given[unit.name] = np
+            used.append(np)
+            most.append(sum(used))
+        time.sleep(0.3 if unit.name == "big" else 0.05)
+        with lock:
+            used.remove(np)
+        times[unit.name] = (start, time.monotonic())
+
+    sizes = {"big": 6, "mid": 4, "a": 1, "b": 1, "c": 1, "huge": 20}
+    scheduler = ScanScheduler(
+        counting_scan, threads=8, cores=8, ranks=lambda u: sizes[u.name], interval=0.01,
+    )
+    units = [unit(x) for x in ["big", "mid", "a", "b", "c", "huge"]]
+    assert sorted(scheduler.run(units)) == sorted(units)
+    assert max(most) <= 8
+    # huge is clamped to the budget
+    assert given == {"big": 6, "mid": 4, "a": 1, "b": 1, "c": 1, "huge": 8}
+    # mid didn't fit beside big, the small ones ran alongside it instead
+    assert times["a"][0] < times["big"][1]
+    assert times["mid"][0] >= times["big"][1]
+
+
+def test_straggler_finished_late(log):
+    """A straggler finishing as it is cancelled is dropped for its parts."""
+
+    def late_scan(unit, cancel=None):
+        # cancel isn't looked at while it finishes up, like a sort
+        if unit.name == "slow":
+            cancel.wait(0.5)
+            time.sleep(0.05)
+
+    discarded = []
+    scheduler = ScanScheduler(
+        late_scan,
+        threads=4,
+        resplit=lambda u: [unit("slow+"), unit("slow+a")],
+        logname=lambda u: log,
+        estimate=lambda u, walked: 100000,
+        minremaining=1,
+        interval=0.01,
+        discard=discarded.append,
+    )
+    scanned = scheduler.run([unit("slow"), unit("a"), unit("b")])
+    assert sorted(u.name for u in scanned) == ["a", "b", "slow+", "slow+a"]
+    assert discarded == [unit("slow")]
+
+
+def test_straggler_estimate_later(log):
+    """An estimate that isn't ready yet is asked for again."""
+    answers = [None, None, 100000]
+
+    def estimate(u, walked):
+        return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    scheduler = ScanScheduler(
+        fake_scan,
+        threads=4,
+        resplit=lambda u: [unit("slow+"), unit("slow+a")],
+        logname=lambda u: log,
+        estimate=estimate,
+        minremaining=1,
+        interval=0.01,
+    )
+    scanned = scheduler.run([unit("slow"), unit("a"), unit("b")])
+    assert sorted(u.name for u in scanned) == ["a", "b", "slow+", "slow+a"]
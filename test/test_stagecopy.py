@@ -0,0 +1,132 @@
+import datetime
+import errno
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from manifest import Manifest, find_entries
+from purgehelper import PurgeBatch, PurgeObject
+from stagecopy import CrossDeviceStager, StageCopyError, copy_stage
+
+# contents of datafile, kept here as reading the file would update atime
+DATA = bytes(range(256)) * 12288 + b"x" * 17
+
+
+@pytest.fixture
+def datafile(tmp_path):
+    """75 day old file with some data and odd permissions"""
+    f = tmp_path / "data.bin"
+    f.write_bytes(DATA)
+    f.chmod(0o640)
+    today = datetime.date.today()
+    aTime = time.mktime((today - datetime.timedelta(days=75)).timetuple())
+    os.utime(f, (aTime, aTime))
+    return f
+
+
+@pytest.fixture
+def stagepath():
+    return pathlib.Path(tempfile.mkdtemp())
+
+
+def test_copy_stage(datafile, stagepath):
+    """copy keeps data, mode and times and removes the source"""
+    st = datafile.stat()
+    target = stagepath / "data.bin"
+
+    assert copy_stage(datafile, target, st) == len(DATA)
+    assert not datafile.exists()
+    tst = target.stat()
+    assert tst.st_mode == st.st_mode
+    assert tst.st_mtime_ns == st.st_mtime_ns
+    assert tst.st_atime_ns == st.st_atime_ns
+    assert target.read_bytes() == DATA
+    assert list(stagepath.iterdir()) == [target]  # no temporary left
+
+
+def test_copy_stage_changed(datafile, stagepath):
+    """source changed since it was checked, leave it alone"""
+    st = datafile.stat()
+    with datafile.open("ab") as f:
+        f.write(b"more")
+
+    with pytest.raises(StageCopyError):
+        copy_stage(datafile, stagepath / "data.bin", st)
+    assert datafile.exists()
+    assert list(stagepath.iterdir()) == []
+
+
+@pytest.mark.parametrize("missing", ["copy_file_range", "sendfile"])
+def test_copy_stage_fallback(datafile, stagepath, monkeypatch, missing):
+    """fall back when the zero copy calls aren't supported"""
+    unsupported = MagicMock(side_effect=OSError(errno.ENOSYS, "not supported"))
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    if missing == "sendfile":
+        monkeypatch.setattr(os, "sendfile", unsupported)
+
+    copy_stage(datafile, stagepath / "data.bin", datafile.stat())
+    assert (stagepath / "data.bin").read_bytes() == DATA
+
+
+def test_rename_exdev(datafile, stagepath, monkeypatch):
+    """rename across filesystems without a stager falls back to a copy"""
+
+    def exdev(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(pathlib.Path, "rename", exdev)
+    po = PurgeObject(path=datafile, days=60, stagepath=stagepath)
+    assert po.applyrules(ignore_ctime=True) == "staged"
+    assert not datafile.exists()
+    assert (stagepath / datafile.relative_to("/")).read_bytes() == DATA
+
+
+def test_CrossDeviceStager(tmp_path, stagepath):
+    """small and large files are copied by their own threads"""
+    stager = CrossDeviceStager(stagepath, threads=2, largethreads=1, largesize=1000)
+    futures = []
+    for i, size in enumerate([10, 5000, 20, 3000]):
+        src = tmp_path / f"f{i}"
+        src.write_bytes(b"x" * size)
+        futures.append(stager.stage(src, stagepath / f"f{i}", src.stat()))
+
+    assert [f.result() for f in futures] == [10, 5000, 20, 3000]
+    stager.close()
+    assert stager.files == 4
+    assert stager.bytes == 8030
+    assert "Copied 4 files 8030 bytes" in stager.report()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("dirfd", [False, True])
+def test_PurgeBatch_crossdev(datafile, stagepath, monkeypatch, dirfd):
+    """batch queues copies for another filesystem and counts them when done"""
+    monkeypatch.setattr(CrossDeviceStager, "crossdev", lambda self, st: True)
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True, dirfd=dirfd)
+    assert batch.run([str(datafile)]) == {"staged": 1}
+    batch.close()
+    assert not datafile.exists()
+    assert (stagepath / datafile.relative_to("/")).is_file()
+    assert batch.copied == len(DATA)
+    assert "across filesystems" in batch.report()
+
+
+def test_PurgeBatch_crossdev_manifest(datafile, stagepath, monkeypatch, tmp_path):
+    """copies across filesystems are only in the manifest once done"""
+    monkeypatch.setattr(CrossDeviceStager, "crossdev", lambda self, st: True)
+    m = Manifest(tmp_path / "manifests")
+    batch = PurgeBatch(days=60, stagepath=stagepath, ignore_ctime=True, manifest=m)
+    batch.run([str(datafile)])
+    batch.close()
+    entries = find_entries(tmp_path / "manifests")
+    assert entries == {
+        str(datafile): (len(DATA), str(stagepath / datafile.relative_to("/")))
+    }
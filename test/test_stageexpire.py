@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+import stageexpire
+from idcache import IdentityCache
+from stageexpire import StageExpire, parse_args
+
+
+@pytest.fixture
+def stagetree(tmp_path, monkeypatch):
+    """
+    stage/scratch/old/{a,b}  arrived before the cutoff
+    stage/scratch/new/c      arrived after
+    returns stage root and cutoff between them
+    """
+    cache = IdentityCache()
+    cache.add("bennet", os.getuid())
+    monkeypatch.setattr(stageexpire, "identities", cache)
+
+    stage = tmp_path / "stage"
+    (stage / "scratch" / "old").mkdir(parents=True)
+    (stage / "scratch" / "new").mkdir(parents=True)
+    (stage / "scratch" / "old" / "a").write_bytes(b"x" * 10)
+    (stage / "scratch" / "old" / "b").write_bytes(b"x" * 20)
+    time.sleep(0.05)
+    cutoff = time.time()
+    time.sleep(0.05)
+    (stage / "scratch" / "new" / "c").write_bytes(b"x" * 40)
+    return stage, cutoff
+
+
+@pytest.mark.parametrize("dryrun", [False, True])
+def test_StageExpire(stagetree, dryrun):
+    stage, cutoff = stagetree
+    expire = StageExpire(str(stage), days=30, threads=2, dryrun=dryrun)
+    expire.cutoff = cutoff
+    expire.run()
+
+    assert expire.files == {"bennet": 2}
+    assert expire.bytes == {"bennet": 30}
+    assert expire.kept == 1
+    assert (stage / "scratch" / "new" / "c").exists()
+    assert (stage / "scratch" / "old").exists() == dryrun  # emptied dir pruned
+    assert (stage / "scratch").is_dir()
+    assert "Expired 2 files 30 bytes" in expire.report()
+    assert expire.as_dict()["users"] == {"bennet": {"files": 2, "bytes": 30}}
+
+
+def test_args():
+    args = parse_args(["--days", "30", "--stagepath", "/stage"])
+    assert args.days == 30
+    assert args.stagepath == "/stage"
+    with pytest.raises(SystemExit):
+        parse_args(["--stagepath", "/stage"])
+
+
+@pytest.mark.parametrize("relative", [True, False])
+def test_StageExpire_exclude(stagetree, tmp_path, monkeypatch, relative):
+    """manifests are skipped however --stagepath is written"""
+    stage, cutoff = stagetree
+    manifests = stage / ".manifest"
+    manifests.mkdir()
+    (manifests / "bennet.manifest").write_text("[]\n")
+    os.utime(manifests / "bennet.manifest", (0, 0))
+    if relative:
+        monkeypatch.chdir(tmp_path)
+        path = "stage"
+    else:
+        (tmp_path / "link").symlink_to(stage)
+        path = str(tmp_path / "link")
+
+    expire = StageExpire(path, days=30, threads=2, exclude=[manifests])
+    expire.cutoff = time.time() + 3600
+    expire.run()
+    assert (manifests / "bennet.manifest").exists()
+    assert expire.files == {"bennet": 3}
@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# needed to import functions in odd paths
+sys.path.append(os.path.abspath("./"))
+
+from throttle import AdaptiveLimiter, TokenBucket
+
+
+class FakeClock:
+    """clock and sleep that only move when slept"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_TokenBucket_rate():
+    """100 operations at 10/s after the burst takes about 10 seconds"""
+    clock = FakeClock()
+    bucket = TokenBucket(10, burst=1, clock=clock, sleep=clock.sleep)
+    for _ in range(101):
+        bucket.acquire()
+    assert clock.now == pytest.approx(10, rel=0.01)
+
+
+def test_TokenBucket_burst():
+    """idle time builds tokens only up to the burst size"""
+    clock = FakeClock()
+    bucket = TokenBucket(10, burst=5, clock=clock, sleep=clock.sleep)
+    clock.now = 100  # idle a long time
+    for _ in range(5):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.1)
+
+
+@pytest.mark.parametrize(
+    "latency,start,expected",
+    [
+        (0.050, 8, 6),  # over target cut by a quarter
+        (0.050, 1, 1),  # never under minimum
+        (0.005, 8, 9),  # well under target ramp up
+        (0.005, 16, 16),  # never over maximum
+        (0.009, 8, 8),  # close to target hold
+    ],
+)
+def test_AdaptiveLimiter(latency, start, expected):
+    limiter = AdaptiveLimiter(0.010, maximum=16, window=10, start=start)
+    for _ in range(10):
+        limiter.observe(latency)
+    assert limiter.limit == expected
+    assert limiter.last == latency
+
+
+def test_AdaptiveLimiter_concurrency():
+    """no more than limit threads inside at once"""
+    limiter = AdaptiveLimiter(1.0, maximum=8, start=2)
+    active = []
+    most = []
+    lock = threading.Lock()
+
+    def work():
+        with limiter:
+            with lock:
+                active.append(1)
+                most.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(most) == 2
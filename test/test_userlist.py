@@ -16,6 +16,7 @@ import pytest
 # needed to import functions in odd paths
 sys.path.append(os.path.abspath("./"))
 
+from idcache import IdentityCache
 from userlist import (
     EmailFromTemplate,
     UserNotify,
@@ -123,8 +124,8 @@ def test_UserSort(example_path, path_test):
     sorter = UserSort(scanident="ident-example")
     sorter.sort([example_path / "ident-example-support.txt"])
 
-    # delete to force flushing of buffers
-    del sorter
+    # write buffered lines and close the files
+    sorter.flush()
 
     # should produce three purge lists
     exptected_purge = [
@@ -145,6 +146,55 @@ def test_UserSort(example_path, path_test):
         assert filecmp.cmp(p1, p2, shallow=False)
 
 
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"cachelimit": 1, "buffersize": 1},  # every line written, handles churn
+        {"cachelimit": 2, "buffersize": 200},  # some buffers written early
+    ],
+)
+def test_UserSort_small(example_path, path_test, kwargs):
+    """same lists however small the handle cache and buffers"""
+    os.chdir(example_path)
+    sorter = UserSort(scanident="ident-example", **kwargs)
+    sorter.sort([example_path / "ident-example-support.txt"])
+    sorter.flush()
+
+    for x in ["bennet", "mmiranda", "msbritt"]:
+        name = f"ident-example-{x}.purge.txt"
+        assert filecmp.cmp(
+            example_path / name, path_test / "data" / name, shallow=False
+        )
+
+
+def test_UserSort_lru(tmp_path):
+    """the least recently used handle is closed, not the first opened"""
+    os.chdir(tmp_path)
+    sorter = UserSort(scanident="lru", cachelimit=2, buffersize=0)
+    sorter.writeline("a", "1\n")
+    sorter.writeline("b", "2\n")
+    a = sorter._handles["a"]
+    sorter.writeline("a", "3\n")
+    sorter.writeline("c", "4\n")
+    assert list(sorter._handles) == ["a", "c"]
+    assert not a.closed
+    sorter.flush()
+    assert a.closed
+    assert (tmp_path / "lru-a.purge.txt").read_text() == "1\n3\n"
+
+
+def test_UserSort_buffered(tmp_path):
+    """lines are held until flush() and written once per user"""
+    os.chdir(tmp_path)
+    sorter = UserSort(scanident="buf")
+    for i in range(1000):
+        sorter.writeline("a" if i % 2 else "b", f"{i}\n")
+    assert list(tmp_path.iterdir()) == []
+    sorter.flush()
+    assert (tmp_path / "buf-a.purge.txt").read_text().count("\n") == 500
+    assert sorter._handles == {}
+
+
 def test_UserNotify_nopath():
     """Check throws on required inputs for UserNotify"""
     with pytest.raises(BaseException):
@@ -154,12 +204,16 @@ def test_UserNotify_nopath():
 def test_UserNotify(tmp_path, path_test, monkeypatch):
     """copy the purge"""
 
-    # replace shutil.chown() with a check for the expected users
+    # users come from the identity cache rather than the system
     # this keeps from the users being actually needed
+    idcache = IdentityCache()
+    for uid, user in enumerate(["msbritt", "bennet", "mmiranda"], start=1001):
+        idcache.add(user, uid)
+
+    # replace shutil.chown() with a check for the expected uids
     def mockreturn(*args, **kwargs):
-        # check that the user passed is in the list
-        users = ["msbritt", "bennet", "mmiranda"]
-        if kwargs["user"] in users:
+        # check that the uid passed is in the list
+        if kwargs["user"] in [1001, 1002, 1003]:
             return True
 
         else:
@@ -168,7 +222,7 @@ def test_UserNotify(tmp_path, path_test, monkeypatch):
     monkeypatch.setattr(shutil, "chown", mockreturn)
 
     os.chdir(path_test / "data")
-    n = UserNotify(notifypath=tmp_path)
+    n = UserNotify(notifypath=tmp_path, idcache=idcache)
     list(n.copy())  # copy is a generator
     result = tmp_path.glob("*")
     assert len(list(result)) == 3  # should be 3 files when complete
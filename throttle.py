@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limit operations to rate per second.
+
+    Up to burst operations may go at once after an idle period, beyond
+    that acquire() sleeps until enough tokens have built up.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate  # operations per second
+        self.burst = burst if burst else max(1.0, rate / 10)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """Block until n operations are allowed, returns seconds waited."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            # reserve the tokens now, going negative if needed, and sleep once
+            # for the shortfall so callers queue up behind each other in order
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class AdaptiveLimiter:
+    """
+    Limit concurrent operations to keep their latency under a target.
+
+    Every window observations the percentile latency of that window is
+    compared to target, over it the limit is cut by a quarter, well under it
+    (less than 3/4 of target) the limit grows by one.  Threads wait in
+    acquire() while limit operations are already running.
+    """
+
+    def __init__(
+        self,
+        target,  # seconds
+        percentile=95,
+        minimum=1,
+        maximum=32,
+        window=100,  # observations between adjustments
+        start=None,  # initial limit, default half way
+    ):
+        self.target = target
+        self.percentile = percentile
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.limit = start if start else max(minimum, maximum // 2)
+        self.last = None  # percentile latency of the last full window
+        self._active = 0
+        self._samples = []
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def observe(self, seconds):
+        """Record latency of one operation, adjusting limit each window."""
+        with self._cond:
+            self._samples.append(seconds)
+            if len(self._samples) >= self.window:
+                self._adjust()
+
+    def _adjust(self):
+        samples = sorted(self._samples)
+        self._samples = []
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        self.last = samples[index]
+
+        limit = self.limit
+        if self.last > self.target:
+            limit = max(self.minimum, min(limit - 1, int(limit * 0.75)))
+        elif self.last < self.target * 0.75:
+            limit = min(self.maximum, limit + 1)
+
+        if limit != self.limit:
+            logging.debug(
+                f"p{self.percentile} latency {self.last * 1000:.1f}ms "
+                f"target {self.target * 1000:.1f}ms concurrency {self.limit} -> {limit}"
+            )
+            self.limit = limit
+            self._cond.notify_all()
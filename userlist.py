@@ -7,7 +7,6 @@ import configparser
 import logging
 import pathlib
 import pprint
-import pwd
 import re
 import shutil
 import smtplib
@@ -19,6 +18,8 @@ from email.headerregistry import Address
 from email.message import EmailMessage
 from string import Template
 
+from idcache import identities
+
 # load config file settings
 config = configparser.ConfigParser()
 config.read(pathlib.Path(__file__).resolve().parent.joinpath("etc/purgetools.ini"))
@@ -41,6 +42,12 @@ def parse_args(args):
     parser.add_argument(
         "--cachelimit", help="Number of file hanels to hold open", type=int, default=100
     )
+    parser.add_argument(
+        "--buffersize",
+        help="MB of lines to hold in memory before writing (Default 256)",
+        type=int,
+        default=256,
+    )
     parser.add_argument(
         "--email", help="Email users a notice of their purge list", action="store_true"
     )
@@ -90,50 +97,74 @@ def get_user(line):
 class UserSort:
     # cachelimit is number of open files to hold open
     # if you get to many open files lower this value default=100
-    def __init__(self, scanident, cachelimit=100):
+    # buffersize is bytes of lines held in memory across all users before
+    # the biggest buffers are written out default=256MB
+    def __init__(self, scanident, cachelimit=100, buffersize=256 * 1024 ** 2):
         self._handles = OrderedDict()
         self._cachelimit = cachelimit
         self._scanident = scanident
-
-    # returns handle if exists in _handles or creates a new one push end of list
-    # if _handles.count() = cachelimit  pop front of list
+        self._buffers = {}  # user to list of lines not yet written
+        self._sizes = {}  # user to bytes in _buffers
+        self._buffered = 0  # bytes in all _buffers
+        self._buffersize = buffersize
+
+    # returns handle if exists in _handles or creates a new one, either way
+    # it moves to the end of the list as most recently used
+    # if _handles.count() = cachelimit close the front of list, least recently used
     def _gethandle(self, lineuser):
         if lineuser in self._handles:
+            self._handles.move_to_end(lineuser)
             return self._handles[lineuser]
 
-        else:
-            # check if we are at cached limit
-            if len(self._handles) >= self._cachelimit:
-                # already have maxed cached handles remove the first one created
-                # this is overly simple and does not actaully do remove last recently accessed
-                handle = self._handles.popitem(last=False)
-                handle.close()
-
-            # go ahead and create handle
-            user_log = pathlib.Path.cwd() / f"{self._scanident}-{lineuser}.purge.txt"
-            g = user_log.open("a")
-            self._handles[lineuser] = g
-            return self._handles[lineuser]
-
-    # force closing all filehandles / sync to disk
+        # check if we are at cached limit
+        if len(self._handles) >= self._cachelimit:
+            user, handle = self._handles.popitem(last=False)
+            logging.debug(f"closing {handle}")
+            handle.close()
+
+        # go ahead and create handle
+        user_log = pathlib.Path.cwd() / f"{self._scanident}-{lineuser}.purge.txt"
+        self._handles[lineuser] = user_log.open("a")
+        return self._handles[lineuser]
+
+    # write out one user's buffered lines in a single write
+    def _writebuffer(self, lineuser):
+        lines = self._buffers.pop(lineuser)
+        self._buffered -= self._sizes.pop(lineuser)
+        self._gethandle(lineuser).write("".join(lines))
+
+    # over buffersize write the biggest buffers until under half of it, so
+    # users with few lines wait for more rather than costing an open each
+    def _spill(self):
+        for lineuser in sorted(self._sizes, key=self._sizes.get, reverse=True):
+            if self._buffered <= self._buffersize // 2:
+                break
+            self._writebuffer(lineuser)
+
+    # force writing all buffers and closing all filehandles / sync to disk
     def flush(self):
-        for handle in self._handles:
+        for lineuser in sorted(self._buffers):
+            self._writebuffer(lineuser)
+        for lineuser, handle in self._handles.items():
             # close each open file
-            logging.debug(f"closing {self._handles[handle]}")
-            self._handles[handle].close()
+            logging.debug(f"closing {handle}")
+            handle.close()
+        self._handles.clear()
 
-    # take user and line check if already have cache in
-    # _handles if so write otherwise create a new one
+    # take user and line and hold it in the user's buffer, written by
+    # _spill() once buffers are over buffersize or by flush()
     def writeline(self, lineuser, line):
-        handle = self._gethandle(lineuser)
-        handle.write(line)
+        self._buffers.setdefault(lineuser, []).append(line)
+        self._sizes[lineuser] = self._sizes.get(lineuser, 0) + len(line)
+        self._buffered += len(line)
+        if self._buffered > self._buffersize:
+            self._spill()
 
     def sort(self, paths):
         for path in paths:
             with path.open() as f:
                 logging.debug(str(f))
-                lines = f.readlines()
-                for line in lines:
+                for line in f:
                     lineuser = get_user(line)
                     if lineuser:
                         self.writeline(lineuser, line)
@@ -152,9 +183,17 @@ class UserSort:
 #  2. Set the permissions/ownership of the copy
 #  3. Email a template to the user with location
 class UserNotify:
-    def __init__(self, email=False, notifypath=False, mode=0o400, template=False):
+    def __init__(
+        self,
+        email=False,
+        notifypath=False,
+        mode=0o400,
+        template=False,
+        idcache=identities,
+    ):
         self._mode = mode  # mode to set the file to
         self._notifypath = notifypath  # path to put the notices in
+        self._idcache = idcache  # IdentityCache to look up owners in
 
         # check requireds
         if not notifypath:
@@ -182,7 +221,8 @@ class UserNotify:
 
             try:
                 logging.debug(f"Change {d_file} owner to {username}")
-                shutil.chown(d_file, user=username)
+                uid = self._idcache.getpwnam(username).pw_uid
+                shutil.chown(d_file, user=uid)
             except LookupError as e:  # username not found
                 logging.warning(f"{e}")
 
@@ -278,7 +318,7 @@ def email_purgelist(path=False, username=False):
     today = datetime.now().strftime("%B %-d, %Y")
 
     # get users common name
-    common_name = pwd.getpwnam(username).pw_gecos
+    common_name = identities.getpwnam(username).pw_gecos
 
     # setup template subsitution dict
     sub_data = {
@@ -318,6 +358,8 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(level=logging.INFO)
 
+    identities.configure(config["idcache"])
+
     paths = get_dir_paths(scanident=args.scanident)
 
     pp.pprint(paths)
@@ -329,7 +371,11 @@ if __name__ == "__main__":
     currentuser = ""
 
     # sort + merge per path scans into per user lists
-    sorter = UserSort(cachelimit=args.cachelimit, scanident=args.scanident)
+    sorter = UserSort(
+        cachelimit=args.cachelimit,
+        scanident=args.scanident,
+        buffersize=args.buffersize * 1024 ** 2,
+    )
     sorter.sort(paths)
     sorter.flush()
 
@@ -341,3 +387,5 @@ if __name__ == "__main__":
     for username, path in notifier.copy():
         logging.debug(f"User Purge list: {path}")
         email_purgelist(path=path, username=username)
+
+    identities.save()